@@ -17,7 +17,7 @@ from chunks.models import Semester, Submission, Subject
 from django.contrib.auth.models import User
 from django.core.urlresolvers import reverse
 from django.db.models import Q, Max
-from caesar.accounts.models import Extension
+from accounts.models import Extension
 import datetime
 import sys
 import re
@@ -44,6 +44,13 @@ class ReviewMilestoneAdmin(MilestoneAdmin):
 	list_users_link.allow_tags = True
 	list_users_link.short_description = 'List Users'
 	exclude = ('type',)
+	actions = ['preassign_tasks']
+	def preassign_tasks(self, request, queryset):
+		from tasks.routing import preassign_tasks # tasks.models imports chunks.models
+		for review_milestone in queryset:
+			tasks = preassign_tasks(review_milestone)
+			self.message_user(request, 'Assigned %s tasks for %s.' % (len(tasks), review_milestone.full_name()))
+	preassign_tasks.short_description = 'Assign review tasks to all members now'
 
 class SubmitMilestoneAdmin(MilestoneAdmin):
 	list_display = ('__unicode__', 'extension_data',)
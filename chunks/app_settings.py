@@ -5,3 +5,23 @@ CHUNK_SIMILARITY_THRESHOLD = getattr(
 
 SIMILAR_CHUNK_LIMIT = getattr(
         settings, 'CHUNKS_SIMILAR_CHUNK_LIMIT', 10)
+
+# alias in settings.CACHES that stores highlighted file lines
+HIGHLIGHT_CACHE = getattr(settings, 'CHUNKS_HIGHLIGHT_CACHE', 'default')
+
+HIGHLIGHT_CACHE_TIMEOUT = getattr(
+        settings, 'CHUNKS_HIGHLIGHT_CACHE_TIMEOUT', 60 * 60 * 24 * 30)
+
+# number of highlighted files each process keeps in memory
+HIGHLIGHT_LRU_SIZE = getattr(settings, 'CHUNKS_HIGHLIGHT_LRU_SIZE', 500)
+
+# alias in settings.CACHES that stores each submit milestone's chunk size
+# histograms, for the routing configuration page. It should be shared by
+# all the server processes (e.g. file based).
+HISTOGRAM_CACHE = getattr(settings, 'CHUNKS_HISTOGRAM_CACHE', 'default')
+
+# histograms of an earlier version are never looked up again, this only
+# bounds how long they are kept, and how long changes the preprocessor didn't
+# make (e.g. in the admin) take to show
+HISTOGRAM_CACHE_TIMEOUT = getattr(
+        settings, 'CHUNKS_HISTOGRAM_CACHE_TIMEOUT', 60 * 60 * 24)
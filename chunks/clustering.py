@@ -0,0 +1,154 @@
+"""
+Groups the chunks of a submit milestone into clusters of similar code, which
+fill Chunk.cluster_id for get_similar_chunks and for routing.
+
+Each chunk's student code (staff lines are left out, since every submission
+shares them) is split into tokens and overlapping shingles of
+SHINGLE_LENGTH tokens. A MinHash signature of SIGNATURE_LENGTH values
+estimates the Jaccard similarity of two chunks' shingle sets. It is computed
+with one hash per shingle (one permutation hashing, with empty bins filled
+from their neighbours, see Shrivastava and Li, "Densifying One Permutation
+Hashing via Rotation", 2014). Locality sensitive hashing then puts chunks
+whose signatures agree on a whole band of ROWS values in the same bucket,
+and only chunks sharing a bucket are compared, so clustering takes about
+linear time in the number of chunks instead of comparing all pairs.
+
+Chunks whose estimated similarity is at least CHUNK_SIMILARITY_THRESHOLD
+are joined, and a cluster is named after the smallest chunk id in it, which
+keeps cluster ids unique across milestones. Chunks that are similar to no
+other chunk get no cluster.
+"""
+import re
+from collections import defaultdict
+
+from django.db import transaction
+
+from chunks.models import Chunk, File
+from tasks.models import invalidate_routing_states
+import app_settings
+
+TOKEN_RE = re.compile(r'[A-Za-z_]\w*|\d+|[^\w\s]')
+
+SHINGLE_LENGTH = 4
+SIGNATURE_LENGTH = 100
+
+MASK = (1 << 64) - 1
+
+def _band_rows(threshold, length=SIGNATURE_LENGTH):
+    """
+    Rows per band, chosen so that the similarity at which two chunks become
+    likely to share a bucket, (1/bands) ** (1/rows), is near the threshold.
+    """
+    divisors = [rows for rows in range(1, length + 1) if length % rows == 0]
+    return min(divisors, key=lambda rows: abs((float(rows) / length) ** (1.0 / rows) - threshold))
+
+ROWS = _band_rows(app_settings.CHUNK_SIMILARITY_THRESHOLD)
+
+def shingles(text):
+    tokens = TOKEN_RE.findall(text)
+    if len(tokens) < SHINGLE_LENGTH:
+        return set([tuple(tokens)]) if tokens else set()
+    return set(tuple(tokens[i:i + SHINGLE_LENGTH]) for i in xrange(len(tokens) - SHINGLE_LENGTH + 1))
+
+def signature(shingle_set):
+    """The MinHash signature of a non-empty set of shingles."""
+    bins = [None] * SIGNATURE_LENGTH
+    for shingle in shingle_set:
+        # a multiplicative hash spreads Python's hash over all 64 bits
+        value = (hash(shingle) * 0x9e3779b97f4a7c15) & MASK
+        value ^= value >> 29
+        index = value % SIGNATURE_LENGTH
+        value //= SIGNATURE_LENGTH
+        if bins[index] is None or value < bins[index]:
+            bins[index] = value
+    # an empty bin borrows the value of the next full bin to its right,
+    # offset by the distance so that borrowed values stay distinct
+    densified = list(bins)
+    for index in xrange(SIGNATURE_LENGTH):
+        distance = 1
+        while densified[index] is None:
+            borrowed = bins[(index + distance) % SIGNATURE_LENGTH]
+            if borrowed is not None:
+                densified[index] = borrowed + (distance << 58)
+            distance += 1
+    return densified
+
+def similarity(signature1, signature2):
+    """Estimated Jaccard similarity of the chunks with these signatures."""
+    return sum(1 for a, b in zip(signature1, signature2) if a == b) / float(SIGNATURE_LENGTH)
+
+def student_code(chunk, file):
+    """The lines of the chunk that aren't staff code, joined."""
+    line_index = file.line_index()
+    staff_line_index = file.staff_line_index()
+    first = line_index.line_number(chunk.start)
+    last = line_index.line_number(max(chunk.start, chunk.end - 1))
+    return '\n'.join(line for number, line in line_index.numbered_lines(first, last)
+            if not staff_line_index.is_staff(number))
+
+def find_clusters(signatures, threshold=None):
+    """
+    Takes {chunk id: signature} and returns {chunk id: cluster id} for the
+    chunks that are similar to at least one other chunk.
+    """
+    if threshold is None:
+        threshold = app_settings.CHUNK_SIMILARITY_THRESHOLD
+    parent = dict((chunk_id, chunk_id) for chunk_id in signatures)
+
+    def find(chunk_id):
+        root = chunk_id
+        while parent[root] != root:
+            root = parent[root]
+        while parent[chunk_id] != root:
+            parent[chunk_id], chunk_id = root, parent[chunk_id]
+        return root
+
+    buckets = defaultdict(list)
+    for chunk_id in sorted(signatures):
+        values = signatures[chunk_id]
+        for band in xrange(0, SIGNATURE_LENGTH, ROWS):
+            buckets[band, tuple(values[band:band + ROWS])].append(chunk_id)
+
+    for members in buckets.itervalues():
+        # comparing each member with the first keeps big buckets linear;
+        # union-find links up whatever the other buckets connect
+        first = members[0]
+        for chunk_id in members[1:]:
+            if find(chunk_id) != find(first) and \
+                    similarity(signatures[first], signatures[chunk_id]) >= threshold:
+                root1, root2 = find(first), find(chunk_id)
+                parent[max(root1, root2)] = min(root1, root2)
+
+    sizes = defaultdict(int)
+    for chunk_id in signatures:
+        sizes[find(chunk_id)] += 1
+    return dict((chunk_id, find(chunk_id)) for chunk_id in signatures if sizes[find(chunk_id)] > 1)
+
+def cluster_milestone(submit_milestone):
+    """
+    Recomputes cluster_id for every chunk submitted to the milestone.
+    Returns the number of clusters found.
+    """
+    files = dict((f.id, f) for f in File.objects.filter(submission__milestone=submit_milestone) \
+            .only('id', 'data', 'staff_lines'))
+    File.prefetch_staff_line_indexes(files.values())
+    chunks = Chunk.objects.filter(file__submission__milestone=submit_milestone) \
+            .only('id', 'file', 'start', 'end')
+    signatures = {}
+    for chunk in chunks:
+        shingle_set = shingles(student_code(chunk, files[chunk.file_id]))
+        if shingle_set:
+            signatures[chunk.id] = signature(shingle_set)
+    clusters = find_clusters(signatures)
+
+    members = defaultdict(list)
+    for chunk_id, cluster_id in clusters.iteritems():
+        members[cluster_id].append(chunk_id)
+    with transaction.commit_on_success():
+        Chunk.objects.filter(file__submission__milestone=submit_milestone) \
+                .exclude(cluster_id=None).update(cluster_id=None)
+        for cluster_id, chunk_ids in members.iteritems():
+            for i in xrange(0, len(chunk_ids), 500):
+                Chunk.objects.filter(id__in=chunk_ids[i:i + 500]).update(cluster_id=cluster_id)
+    invalidate_routing_states()
+    return len(members)
@@ -1,6 +1,7 @@
 from django import forms
 
 class SimulateRoutingForm(forms.Form):
-  num_students = forms.IntegerField()
-  num_staff = forms.IntegerField()
-  num_alum = forms.IntegerField()
+  # how many reviewers of each role take part, blank for all of them
+  num_students = forms.IntegerField(required=False, min_value=0)
+  num_staff = forms.IntegerField(required=False, min_value=0)
+  num_alum = forms.IntegerField(required=False, min_value=0)
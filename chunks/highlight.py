@@ -0,0 +1,135 @@
+"""
+Caches syntax-highlighted source lines for each File.
+
+Files rarely change once the preprocessor has loaded them, so the output of
+pygments for a file only has to be computed once per content, lexer and
+formatter version. Highlighted lines live in a small in-process LRU in front
+of a Django cache backend (see CHUNKS_HIGHLIGHT_CACHE), and chunk renderers
+slice the cached file output instead of re-running pygments per chunk.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+
+import pygments
+from pygments import highlight
+from pygments.lexers import get_lexer_for_filename
+from pygments.formatters import HtmlFormatter
+from django.core.cache import get_cache
+
+import app_settings
+
+# bump this whenever the lexer or formatter options below change
+HIGHLIGHT_FORMAT_VERSION = 1
+
+# shared by the threads of the process, so only touched under _lru_lock
+_lru = OrderedDict()
+_lru_lock = threading.Lock()
+
+def get_lexer(path):
+    # stripnl would drop leading blank lines and shift the line numbering
+    return get_lexer_for_filename(path, stripnl=False, tabsize=4)
+
+def get_formatter():
+    return HtmlFormatter(cssclass='syntax', nowrap=True)
+
+def source_text(data):
+    """
+    Returns file data as unicode. The preprocessor hands in the raw bytes of
+    the files, which are decoded the way the lexers' 'guess' encoding does:
+    as UTF-8 if they are valid UTF-8, otherwise as Latin-1.
+    """
+    if isinstance(data, unicode):
+        return data
+    try:
+        return data.decode('utf-8')
+    except UnicodeDecodeError:
+        return data.decode('latin-1')
+
+def _cache_key(file, text, lexer):
+    # the content digest keeps files updated by a re-import from being served
+    # their old highlighting
+    digest = hashlib.sha1(text.encode('utf-8')).hexdigest()[:12]
+    return 'highlight:%s:%s:%s:%s:%s' % (file.id, digest,
+            lexer.__class__.__name__, pygments.__version__,
+            HIGHLIGHT_FORMAT_VERSION)
+
+def _remember(key, lines):
+    with _lru_lock:
+        _lru[key] = lines
+        while len(_lru) > app_settings.HIGHLIGHT_LRU_SIZE:
+            _lru.popitem(last=False)
+
+def _recall(key):
+    with _lru_lock:
+        lines = _lru.pop(key, None)
+        if lines is not None:
+            _lru[key] = lines
+        return lines
+
+def highlight_file_lines(file):
+    """
+    Returns the list of highlighted HTML lines for the whole file, one entry
+    per source line. Computes and caches them on first use.
+    """
+    lexer = get_lexer(file.path)
+    text = source_text(file.data)
+    key = _cache_key(file, text, lexer)
+    lines = _recall(key)
+    if lines is not None:
+        return lines
+
+    cache = get_cache(app_settings.HIGHLIGHT_CACHE)
+    lines = cache.get(key)
+    if lines is None:
+        lines = highlight(text, lexer, get_formatter()).splitlines()
+        cache.set(key, lines, app_settings.HIGHLIGHT_CACHE_TIMEOUT)
+    _remember(key, lines)
+    return lines
+
+def prime_highlight_cache(files):
+    """Highlights the given files ahead of time, e.g. right after import."""
+    for file in files:
+        highlight_file_lines(file)
+
+def _dedent_html(line, margin):
+    # removes up to margin leading spaces from the text of a highlighted line,
+    # skipping over any markup that opens the line
+    out = []
+    i = 0
+    while i < len(line) and margin > 0:
+        if line[i] == '<':
+            close = line.find('>', i)
+            if close == -1:
+                break
+            out.append(line[i:close + 1])
+            i = close + 1
+        elif line[i] == ' ':
+            margin -= 1
+            i += 1
+        else:
+            break
+    out.append(line[i:])
+    return ''.join(out)
+
+def highlight_chunk(chunk):
+    """
+    Returns the highlighted lines of the chunk, sliced out of the cached
+    highlighting of its file and dedented the same way as chunk.data.
+    """
+    if not chunk.lines:
+        return []
+    file_lines = highlight_file_lines(chunk.file)
+    first_line = chunk.lines[0][0]
+    highlighted = file_lines[first_line - 1:first_line - 1 + len(chunk.lines)]
+
+    # chunk.data is dedented, so work out how much indentation was removed
+    margin = 0
+    line_index = chunk.file.line_index()
+    for number, line in chunk.lines:
+        if line.strip() and number <= len(line_index):
+            margin = len(line_index.line(number).expandtabs(4)) - len(line)
+            break
+    if margin > 0:
+        highlighted = [_dedent_html(line, margin) for line in highlighted]
+    return highlighted
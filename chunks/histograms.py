@@ -0,0 +1,125 @@
+"""
+Chunk size histograms of a submit milestone, shown on the routing
+configuration page (chunks.views.simulate).
+
+Chunks are grouped by name. A name is provided by the staff if more than
+STAFF_PROVIDED_COPIES chunks have it, important if some copy of it has more
+than EDITED_LINES student lines outside of a test, and a test if some copy
+of it is a test. The histograms are computed from one grouped query, so
+their cost follows the number of distinct (name, type, size) rows rather
+than the number of chunks. They are cached per milestone under a version
+number kept in the same cache, which the preprocessor bumps after it imports
+or re-imports the milestone's code (see invalidate_histograms).
+"""
+import time
+from collections import defaultdict
+
+from django.core.cache import get_cache
+from django.db.models import Count
+
+from chunks.models import Chunk
+import app_settings
+
+MAX_LINES = 200
+# the MAX_LINES bar is cut off at this many copies, so that it doesn't
+# flatten the rest of the histogram
+MAX_LINES_COPIES = 10
+EDITED_LINES = 30
+STAFF_PROVIDED_COPIES = 41
+
+VERSION_TIMEOUT = 60 * 60 * 24 * 365
+
+def _version_key(submit_milestone_id):
+    return 'chunk-histograms:version:%s' % submit_milestone_id
+
+def _start_version(cache, submit_milestone_id):
+    # like the routing generation, start from the clock so that losing the
+    # key can't bring back histograms of an earlier version
+    cache.add(_version_key(submit_milestone_id), int(time.time()), VERSION_TIMEOUT)
+
+def _cache_key(cache, submit_milestone_id):
+    version = cache.get(_version_key(submit_milestone_id))
+    if version is None:
+        _start_version(cache, submit_milestone_id)
+        version = cache.get(_version_key(submit_milestone_id))
+    return 'chunk-histograms:%s:%s' % (submit_milestone_id, version)
+
+def invalidate_histograms(submit_milestone_id):
+    """Makes every process recompute the milestone's histograms."""
+    cache = get_cache(app_settings.HISTOGRAM_CACHE)
+    try:
+        cache.incr(_version_key(submit_milestone_id))
+    except ValueError:
+        # a new version is a change already
+        _start_version(cache, submit_milestone_id)
+
+def compute_histograms(submit_milestone_id):
+    histograms = defaultdict(lambda: defaultdict(int))
+    copies = defaultdict(int)
+    edited = set()
+    test = set()
+    rows = Chunk.objects.filter(file__submission__milestone=submit_milestone_id) \
+            .exclude(name=None) \
+            .values('name', 'class_type', 'student_lines').annotate(copies=Count('id'))
+    for row in rows:
+        name, lines = row['name'], min(row['student_lines'], MAX_LINES)
+        histograms[name][lines] += row['copies']
+        copies[name] += row['copies']
+        if lines > EDITED_LINES and row['class_type'] == 'NONE':
+            edited.add(name)
+        if row['class_type'] == 'TEST':
+            test.add(name)
+
+    important_graphs = []
+    test_graphs = []
+    unimportant_graphs = []
+    student_tests = []
+    student_classes = []
+    max_important = max_test = max_unimportant = 0
+    for name in sorted(histograms):
+        histogram = histograms[name]
+        if MAX_LINES in histogram:
+            histogram[MAX_LINES] = min(histogram[MAX_LINES], MAX_LINES_COPIES)
+        lines_list = [[lines, histogram[lines]] for lines in sorted(histogram)]
+        max_copy = max(histogram.values())
+        staff_provided = copies[name] > STAFF_PROVIDED_COPIES
+        if name in test:
+            max_test = max(max_test, max_copy)
+            if staff_provided:
+                test_graphs.append([name, lines_list])
+            else:
+                student_tests.extend(lines_list)
+        elif name in edited and staff_provided:
+            max_important = max(max_important, max_copy)
+            important_graphs.append([name, lines_list])
+        else:
+            max_unimportant = max(max_unimportant, max_copy)
+            if staff_provided:
+                unimportant_graphs.append([name, lines_list])
+            else:
+                student_classes.extend(lines_list)
+
+    # everything the students created themselves is shown together
+    if student_tests:
+        test_graphs.append(["StudentDefinedTests", student_tests])
+    if student_classes:
+        unimportant_graphs.append(["StudentDefinedClasses", student_classes])
+
+    return {
+        'important_graph': important_graphs,
+        'unimportant_graph': unimportant_graphs,
+        'test_graph': test_graphs,
+        'max_important': max_important + 1,
+        'max_unimportant': max_unimportant + 1,
+        'max_test': max_test + 1,
+    }
+
+def get_histograms(submit_milestone_id):
+    """Returns the milestone's histograms, from the cache when possible."""
+    cache = get_cache(app_settings.HISTOGRAM_CACHE)
+    key = _cache_key(cache, submit_milestone_id)
+    histograms = cache.get(key)
+    if histograms is None:
+        histograms = compute_histograms(submit_milestone_id)
+        cache.set(key, histograms, app_settings.HISTOGRAM_CACHE_TIMEOUT)
+    return histograms
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+from south.utils import datetime_utils as datetime
+from south.db import db
+from south.v2 import DataMigration
+from django.db import models
+
+class Migration(DataMigration):
+
+    def forwards(self, orm):
+        # Collect the staff markers of every file in one pass
+        intervals = {}
+        markers = orm.StaffMarker.objects.filter(start_line__isnull=False, end_line__isnull=False) \
+                .values_list('chunk__file_id', 'start_line', 'end_line')
+        for file_id, start_line, end_line in markers.iterator():
+            intervals.setdefault(file_id, []).append((start_line, end_line))
+
+        orm.File.objects.update(staff_lines='')
+        for file_id, file_intervals in intervals.iteritems():
+            staff_lines = ','.join('%d-%d' % interval for interval in sorted(file_intervals))
+            orm.File.objects.filter(id=file_id).update(staff_lines=staff_lines)
+
+    def backwards(self, orm):
+        orm.File.objects.update(staff_lines=None)
+
+    models = {
+        u'auth.group': {
+            'Meta': {'object_name': 'Group'},
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '80'}),
+            'permissions': ('django.db.models.fields.related.ManyToManyField', [], {'to': u"orm['auth.Permission']", 'symmetrical': 'False', 'blank': 'True'})
+        },
+        u'auth.permission': {
+            'Meta': {'ordering': "(u'content_type__app_label', u'content_type__model', u'codename')", 'unique_together': "((u'content_type', u'codename'),)", 'object_name': 'Permission'},
+            'codename': ('django.db.models.fields.CharField', [], {'max_length': '100'}),
+            'content_type': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['contenttypes.ContentType']"}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '50'})
+        },
+        u'auth.user': {
+            'Meta': {'object_name': 'User'},
+            'date_joined': ('django.db.models.fields.DateTimeField', [], {'default': 'datetime.datetime.now'}),
+            'email': ('django.db.models.fields.EmailField', [], {'max_length': '75', 'blank': 'True'}),
+            'first_name': ('django.db.models.fields.CharField', [], {'max_length': '30', 'blank': 'True'}),
+            'groups': ('django.db.models.fields.related.ManyToManyField', [], {'to': u"orm['auth.Group']", 'symmetrical': 'False', 'blank': 'True'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'is_active': ('django.db.models.fields.BooleanField', [], {'default': 'True'}),
+            'is_staff': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'is_superuser': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'last_login': ('django.db.models.fields.DateTimeField', [], {'default': 'datetime.datetime.now'}),
+            'last_name': ('django.db.models.fields.CharField', [], {'max_length': '30', 'blank': 'True'}),
+            'password': ('django.db.models.fields.CharField', [], {'max_length': '128'}),
+            'user_permissions': ('django.db.models.fields.related.ManyToManyField', [], {'to': u"orm['auth.Permission']", 'symmetrical': 'False', 'blank': 'True'}),
+            'username': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '30'})
+        },
+        u'chunks.assignment': {
+            'Meta': {'object_name': 'Assignment', 'db_table': "u'assignments'"},
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '50'}),
+            'semester': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'assignments'", 'null': 'True', 'to': u"orm['chunks.Semester']"})
+        },
+        u'chunks.batch': {
+            'Meta': {'object_name': 'Batch'},
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '50'})
+        },
+        u'chunks.chunk': {
+            'Meta': {'object_name': 'Chunk', 'db_table': "u'chunks'"},
+            'chunk_info': ('django.db.models.fields.TextField', [], {'null': 'True', 'blank': 'True'}),
+            'class_type': ('django.db.models.fields.CharField', [], {'max_length': '4', 'null': 'True', 'blank': 'True'}),
+            'cluster_id': ('django.db.models.fields.IntegerField', [], {'null': 'True', 'blank': 'True'}),
+            'created': ('django.db.models.fields.DateTimeField', [], {'auto_now_add': 'True', 'blank': 'True'}),
+            'end': ('django.db.models.fields.IntegerField', [], {}),
+            'file': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'chunks'", 'to': u"orm['chunks.File']"}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'modified': ('django.db.models.fields.DateTimeField', [], {'auto_now': 'True', 'blank': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '200'}),
+            'staff_portion': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'start': ('django.db.models.fields.IntegerField', [], {}),
+            'student_lines': ('django.db.models.fields.IntegerField', [], {'default': '0'})
+        },
+        u'chunks.file': {
+            'Meta': {'unique_together': "(('path', 'submission'),)", 'object_name': 'File', 'db_table': "u'files'"},
+            'created': ('django.db.models.fields.DateTimeField', [], {'auto_now_add': 'True', 'blank': 'True'}),
+            'data': ('django.db.models.fields.TextField', [], {}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'path': ('django.db.models.fields.CharField', [], {'max_length': '200'}),
+            'staff_lines': ('django.db.models.fields.TextField', [], {'null': 'True', 'blank': 'True'}),
+            'submission': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'files'", 'to': u"orm['chunks.Submission']"})
+        },
+        u'chunks.milestone': {
+            'Meta': {'object_name': 'Milestone'},
+            'assigned_date': ('django.db.models.fields.DateTimeField', [], {'null': 'True', 'blank': 'True'}),
+            'assignment': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'milestones'", 'to': u"orm['chunks.Assignment']"}),
+            'duedate': ('django.db.models.fields.DateTimeField', [], {'null': 'True', 'blank': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'max_extension': ('django.db.models.fields.IntegerField', [], {'default': '2'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '50'}),
+            'type': ('django.db.models.fields.CharField', [], {'max_length': '1'})
+        },
+        u'chunks.reviewmilestone': {
+            'Meta': {'object_name': 'ReviewMilestone', '_ormbases': [u'chunks.Milestone']},
+            'alum_count': ('django.db.models.fields.IntegerField', [], {'default': '3'}),
+            'alum_count_default': ('django.db.models.fields.IntegerField', [], {'default': '3'}),
+            'alums': ('django.db.models.fields.IntegerField', [], {'default': '1'}),
+            'alums_default': ('django.db.models.fields.IntegerField', [], {'default': '1'}),
+            'chunks_to_assign': ('django.db.models.fields.TextField', [], {'null': 'True', 'blank': 'True'}),
+            'chunks_to_exclude': ('django.db.models.fields.TextField', [], {'null': 'True', 'blank': 'True'}),
+            u'milestone_ptr': ('django.db.models.fields.related.OneToOneField', [], {'to': u"orm['chunks.Milestone']", 'unique': 'True', 'primary_key': 'True'}),
+            'min_student_lines': ('django.db.models.fields.IntegerField', [], {'default': '30'}),
+            'reviewers_per_chunk': ('django.db.models.fields.IntegerField', [], {'default': '2'}),
+            'staff': ('django.db.models.fields.IntegerField', [], {'default': '15'}),
+            'staff_count': ('django.db.models.fields.IntegerField', [], {'default': '10'}),
+            'staff_count_default': ('django.db.models.fields.IntegerField', [], {'default': '10'}),
+            'staff_default': ('django.db.models.fields.IntegerField', [], {'default': '15'}),
+            'student_count': ('django.db.models.fields.IntegerField', [], {'default': '5'}),
+            'student_count_default': ('django.db.models.fields.IntegerField', [], {'default': '5'}),
+            'students': ('django.db.models.fields.IntegerField', [], {'default': '199'}),
+            'students_default': ('django.db.models.fields.IntegerField', [], {'default': '199'}),
+            'submit_milestone': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'review_milestone'", 'to': u"orm['chunks.SubmitMilestone']"})
+        },
+        u'chunks.semester': {
+            'Meta': {'object_name': 'Semester'},
+            'about': ('accounts.fields.MarkdownTextField', [], {'blank': 'True'}),
+            'about_html': ('django.db.models.fields.TextField', [], {'blank': 'True'}),
+            'description': ('django.db.models.fields.CharField', [], {'max_length': '140', 'blank': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'is_current_semester': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'semester': ('django.db.models.fields.CharField', [], {'max_length': '32', 'blank': 'True'}),
+            'subject': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'semesters'", 'to': u"orm['chunks.Subject']"})
+        },
+        u'chunks.staffmarker': {
+            'Meta': {'object_name': 'StaffMarker'},
+            'chunk': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'staffmarkers'", 'to': u"orm['chunks.Chunk']"}),
+            'end_line': ('django.db.models.fields.IntegerField', [], {'null': 'True', 'blank': 'True'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'start_line': ('django.db.models.fields.IntegerField', [], {'null': 'True', 'blank': 'True'})
+        },
+        u'chunks.subject': {
+            'Meta': {'object_name': 'Subject'},
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '32'})
+        },
+        u'chunks.submission': {
+            'Meta': {'object_name': 'Submission', 'db_table': "u'submissions'"},
+            'authors': ('django.db.models.fields.related.ManyToManyField', [], {'blank': 'True', 'related_name': "'submissions'", 'null': 'True', 'symmetrical': 'False', 'to': u"orm['auth.User']"}),
+            'batch': ('django.db.models.fields.related.ForeignKey', [], {'blank': 'True', 'related_name': "'submissions'", 'null': 'True', 'to': u"orm['chunks.Batch']"}),
+            'created': ('django.db.models.fields.DateTimeField', [], {'auto_now_add': 'True', 'blank': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'milestone': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'submissions'", 'to': u"orm['chunks.SubmitMilestone']"}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '50'}),
+            'published': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'revision': ('django.db.models.fields.IntegerField', [], {'null': 'True', 'blank': 'True'}),
+            'revision_date': ('django.db.models.fields.DateTimeField', [], {'null': 'True', 'blank': 'True'})
+        },
+        u'chunks.submitmilestone': {
+            'Meta': {'object_name': 'SubmitMilestone', '_ormbases': [u'chunks.Milestone']},
+            u'milestone_ptr': ('django.db.models.fields.related.OneToOneField', [], {'to': u"orm['chunks.Milestone']", 'unique': 'True', 'primary_key': 'True'})
+        },
+        u'contenttypes.contenttype': {
+            'Meta': {'ordering': "('name',)", 'unique_together': "(('app_label', 'model'),)", 'object_name': 'ContentType', 'db_table': "'django_content_type'"},
+            'app_label': ('django.db.models.fields.CharField', [], {'max_length': '100'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'model': ('django.db.models.fields.CharField', [], {'max_length': '100'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '100'})
+        }
+    }
+
+    complete_apps = ['chunks']
+    symmetrical = True
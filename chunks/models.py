@@ -1,19 +1,23 @@
 import app_settings
+import bisect
 import datetime
+import re
 import logging
 import textwrap
 import tasks
 import logging
 
 from accounts.fields import MarkdownTextField
+from array import array
 from collections import defaultdict
 from django_tools.middlewares import ThreadLocal
 from django.db import models
+from django.db.models import Count, F, Max, Sum
 from django.contrib.auth.models import User
 from django.db.models.signals import post_save
 from django.conf import settings
 from django.core.exceptions import PermissionDenied
-from django.dispatch import receiver
+from django.dispatch import receiver, Signal
 from pygments.formatters import HtmlFormatter
 
 class lazy_property(object):
@@ -184,6 +188,12 @@ class Submission(models.Model):
     milestone = models.ForeignKey(SubmitMilestone, related_name='submissions')
     batch = models.ForeignKey(Batch, blank=True, null=True, related_name='submissions')
     published = models.BooleanField()
+    # fields added for denormalization purposes, see update_activity_counts
+    user_comment_count = models.IntegerField(default=0)
+    static_comment_count = models.IntegerField(default=0)
+    test_comment_count = models.IntegerField(default=0)
+    reviewer_count = models.IntegerField(default=0)
+    last_comment_modified = models.DateTimeField(blank=True, null=True)
 
     class Meta:
         db_table = u'submissions'
@@ -221,26 +231,133 @@ class Submission(models.Model):
             review_milestones = ReviewMilestone.objects.filter(submit_milestone=self.milestone)
             return review_milestones.latest('duedate').duedate
 
+class StaffLineIndex(object):
+    """
+    Answers "is line N staff code" for one file in constant time.
+
+    Built from the file's staff line intervals (1-based and inclusive, like
+    StaffMarker), which are stored on the File as "start-end,start-end".
+    """
+    def __init__(self, intervals=()):
+        self.intervals = sorted(intervals)
+        last_line = max([end for start, end in self.intervals] or [0])
+        self._bitmap = bytearray(last_line + 1)
+        for start, end in self.intervals:
+            self._bitmap[start:end + 1] = '\x01' * (end - start + 1)
+
+    @classmethod
+    def parse(cls, text):
+        intervals = []
+        for interval in (text or '').split(','):
+            if interval:
+                start, end = interval.split('-')
+                intervals.append((int(start), int(end)))
+        return cls(intervals)
+
+    @classmethod
+    def from_markers(cls, markers):
+        return cls([(marker.start_line, marker.end_line) for marker in markers
+            if marker.start_line is not None and marker.end_line is not None])
+
+    def serialize(self):
+        return ','.join('%d-%d' % interval for interval in self.intervals)
+
+    def is_staff(self, number):
+        return 0 <= number < len(self._bitmap) and self._bitmap[number] == 1
+
+    def mark(self, numbered_lines):
+        """Turns (number, line) pairs into (number, line, is_staff) triples."""
+        return [(number, line, self.is_staff(number)) for number, line in numbered_lines]
+
+class LineIndex(object):
+    """
+    Offsets of the lines of a file, so that a line or a range of lines can be
+    cut out of the text without splitting all of it.
+
+    Line numbers are 1-based and the lines are the same as those of
+    data.splitlines().
+    """
+    LINE_BREAK = re.compile(u'\r\n|[\n\r\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029]')
+
+    def __init__(self, data):
+        self.data = data
+        self._starts = array('l', [0])
+        self._ends = array('l')
+        for match in self.LINE_BREAK.finditer(data):
+            self._ends.append(match.start())
+            self._starts.append(match.end())
+        if self._starts[-1] == len(data):
+            # no empty line after a trailing line break
+            self._starts.pop()
+        else:
+            self._ends.append(len(data))
+
+    def __len__(self):
+        return len(self._starts)
+
+    def line(self, number):
+        return self.data[self._starts[number - 1]:self._ends[number - 1]]
+
+    def line_start(self, number):
+        """Offset of the first character of the line."""
+        return self._starts[number - 1] if number <= len(self) else len(self.data)
+
+    def line_number(self, offset):
+        """Number of the line starting at or containing offset. Offsets on a
+        line break belong to the line after it."""
+        number = bisect.bisect_right(self._starts, offset)
+        if number and offset >= self._ends[number - 1]:
+            number += 1
+        return max(number, 1)
+
+    def numbered_lines(self, first=1, last=None):
+        """Yields (number, line) pairs from line first to line last."""
+        if last is None or last > len(self):
+            last = len(self)
+        for number in xrange(first, last + 1):
+            yield number, self.data[self._starts[number - 1]:self._ends[number - 1]]
+
 class File(models.Model):
     id = models.AutoField(primary_key=True)
     path = models.CharField(max_length=200)
     data = models.TextField()
     submission = models.ForeignKey(Submission, related_name='files')
     created = models.DateTimeField(auto_now_add=True)
-    def __split_lines(self):
-        # first_line_offset = 0
-        # offset = 0
-        # while self.data[first_line_offset] == '\n' or self.data[first_line_offset] == '\r':
-        #     if self.data[first_line_offset] == '\n':
-        #         offset += 1
-        #     first_line_offset += 1
-        # offset +=1
-
-        self.lines = list(enumerate(self.data.splitlines(), start = 1))
-
-    def __init__(self, *args, **kwargs):
-        super(File, self).__init__(*args, **kwargs)
-        self.__split_lines()
+    # staff line intervals for the whole file, see StaffLineIndex
+    staff_lines = models.TextField(blank=True, null=True)
+    @lazy_property
+    def lines(self):
+        return list(self.line_index().numbered_lines())
+
+    def line_index(self):
+        if not hasattr(self, '_line_index'):
+            self._line_index = LineIndex(self.data)
+        return self._line_index
+
+    def staff_line_index(self):
+        if not hasattr(self, '_staff_line_index'):
+            if self.staff_lines is None:
+                # files imported before staff_lines existed
+                markers = StaffMarker.objects.filter(chunk__file=self)
+                self._staff_line_index = StaffLineIndex.from_markers(markers)
+            else:
+                self._staff_line_index = StaffLineIndex.parse(self.staff_lines)
+        return self._staff_line_index
+    @staticmethod
+    def prefetch_staff_line_indexes(files):
+        """Fills in staff_line_index() for many files with at most one query."""
+        legacy = dict((f.id, []) for f in files if f.staff_lines is None)
+        if legacy:
+            for file_id, start, end in StaffMarker.objects.filter(chunk__file__in=legacy) \
+                    .exclude(start_line=None).exclude(end_line=None) \
+                    .values_list('chunk__file', 'start_line', 'end_line'):
+                legacy[file_id].append((start, end))
+        for f in files:
+            if f.id in legacy:
+                f._staff_line_index = StaffLineIndex(legacy[f.id])
+            else:
+                f.staff_line_index()
+
     class Meta:
         db_table = u'files'
         unique_together = (('path', 'submission'))
@@ -248,6 +365,78 @@ class File(models.Model):
         return '%s - %s' % (self.path, self.submission)
 
 
+class ChunkAccessCache(object):
+    """
+    Who may view the restricted chunks of each submission (its authors and
+    assigned reviewers), remembered for the length of one request so that
+    Chunk.lines doesn't query for them once per chunk. Views that show many
+    chunks fill it in bulk with prefetch().
+    """
+    def __init__(self):
+        self._allowed = {}
+        self._chunk_submissions = {}
+        self.hits = 0
+        self.misses = 0
+
+    def prefetch(self, chunks):
+        """
+        Loads the allowed users of the given chunks' submissions in two
+        queries, plus one for the chunks whose file isn't loaded yet.
+        """
+        unknown = []
+        for chunk in chunks:
+            if not chunk.chunk_info or chunk.chunk_info.find('restricted') == -1 \
+                    or chunk.id in self._chunk_submissions:
+                continue
+            if hasattr(chunk, '_file_cache'):
+                self._chunk_submissions[chunk.id] = chunk._file_cache.submission_id
+            else:
+                unknown.append(chunk.id)
+        if unknown:
+            self._chunk_submissions.update(Chunk.objects.filter(id__in=unknown) \
+                    .values_list('id', 'file__submission'))
+        self._load(set(self._chunk_submissions.itervalues()).difference(self._allowed))
+
+    def _load(self, submission_ids):
+        if not submission_ids:
+            return
+        allowed = dict((submission_id, set()) for submission_id in submission_ids)
+        authors = Submission.authors.through.objects \
+                .filter(submission__in=submission_ids) \
+                .values_list('submission', 'user__username')
+        reviewers = User.objects.filter(tasks__submission__in=submission_ids) \
+                .values_list('tasks__submission', 'username')
+        for submission_id, username in list(authors) + list(reviewers):
+            allowed[submission_id].add(username)
+        self._allowed.update(allowed)
+
+    def submission_id(self, chunk):
+        if chunk.id in self._chunk_submissions:
+            return self._chunk_submissions[chunk.id]
+        return chunk.file.submission_id
+
+    def allowed_usernames(self, submission_id):
+        if submission_id in self._allowed:
+            self.hits += 1
+        else:
+            self.misses += 1
+            self._load([submission_id])
+        return self._allowed[submission_id]
+
+    def refresh(self, submission_id):
+        self._allowed.pop(submission_id, None)
+        return self.allowed_usernames(submission_id)
+
+def get_chunk_access_cache():
+    """Returns the ChunkAccessCache of the current request."""
+    request = ThreadLocal.get_current_request()
+    if request is None:
+        # outside of a request there is nothing to scope the cache to
+        return ChunkAccessCache()
+    if not hasattr(request, 'chunk_access_cache'):
+        request.chunk_access_cache = ChunkAccessCache()
+    return request.chunk_access_cache
+
 class ChunkManager(models.Manager):
     def find_by_assignment(self, assignment):
         return self.filter(file__submission__milestone__assignment=assignment)
@@ -274,6 +463,14 @@ class Chunk(models.Model):
     staff_portion = models.IntegerField(default=0)
     student_lines = models.IntegerField(default=0)
     chunk_info = models.TextField(blank=True, null=True)
+    # fields added for denormalization purposes, see update_activity_counts;
+    # static_comment_count counts the static analysis (checkstyle) comments and
+    # test_comment_count the test result ones
+    user_comment_count = models.IntegerField(default=0)
+    static_comment_count = models.IntegerField(default=0)
+    test_comment_count = models.IntegerField(default=0)
+    reviewer_count = models.IntegerField(default=0)
+    last_comment_modified = models.DateTimeField(blank=True, null=True)
 
     simulated_tasks = None
 
@@ -296,46 +493,33 @@ class Chunk(models.Model):
         return self._lines
 
     def _check_permissions(self):
-        usr = ThreadLocal.get_current_user()
-
         # The chunk_info field is set to 'restricted' if only authors and
         # reviewers of the chunk are allowed to view it.
-        if self.chunk_info == None:
-          cinfo = ""
-        else:
-          cinfo = self.chunk_info
-
-        # get the authors.
-        authors = [str(u.username) for u in self.file.submission.authors.filter()]
-        # get the assigned reviewers.
-        assigned_reviewers = User.objects.filter(tasks__submission=self.file.submission)
-        reviewers = [str(u.username) for u in assigned_reviewers]
-
-        allowed_users = authors + reviewers
-
-        if cinfo.find('restricted') != -1 and not str(usr.username) in allowed_users:
-          # Don't stop super users from viewing chunks.
-          if not usr.is_superuser:
-            raise PermissionDenied
-        # logging to make sure the reviewers and authors lists are correct.
-        #logger = logging.getLogger(__name__)
-        #logger.info("authors" + str(authors) + "\n reviewers:" + str(reviewers));
+        if self.chunk_info is None or self.chunk_info.find('restricted') == -1:
+            return
+        usr = ThreadLocal.get_current_user()
+        # Don't stop super users from viewing chunks.
+        if usr.is_superuser:
+            return
+        access = get_chunk_access_cache()
+        submission_id = access.submission_id(self)
+        if usr.username in access.allowed_usernames(submission_id):
+            return
+        # tasks may have been assigned earlier in this request
+        if usr.username in access.refresh(submission_id):
+            return
+        raise PermissionDenied
 
     def _split_lines(self):
         file_data = self.file.data
-        # Rewind backwards from the offset to the beginning of the line
-        first_line_offset = self.start
-        while first_line_offset >= -len(file_data) and file_data[first_line_offset] != '\n':
-            first_line_offset -= 1
-        first_line_offset += 1
-        if first_line_offset < 0:
-            first_line_offset=0
-        first_line = file_data.count("\n", 0, first_line_offset) + 1
+        # Start from the beginning of the line containing the offset
+        line_index = self.file.line_index()
+        first_line = line_index.line_number(self.start)
+        first_line_offset = line_index.line_start(first_line)
 
         # TODO: make tab expansion configurable
         # TODO: more robust (custom) dedenting code
         data = file_data[first_line_offset:self.end].expandtabs(4)
-        #data = str(usr.__unicode__())
         self._data = textwrap.dedent(data)
         self._lines = list(enumerate(self.data.splitlines(), start=first_line))
 
@@ -344,7 +528,7 @@ class Chunk(models.Model):
         total_lines = 0
         for marker in markers:
             total_lines += marker.end_line - marker.start_line
-        return float(total_lines)/len(self.file.lines)
+        return float(total_lines)/len(self.file.line_index())
 
     def save(self, *args, **kwargs):
         super(Chunk, self).save(*args, **kwargs)
@@ -459,11 +643,84 @@ class Chunk(models.Model):
     #
     #   return [checkstyle, students, alum, staff]
 
-    def reviewer_count(self):
-      return self.file.submission.milestone.assignment.semester.members.exclude(user__username = 'checkstyle').count()
-
     def comment_count(self):
-      return self.comments.count()
+      return self.user_comment_count + self.static_comment_count + self.test_comment_count
+
+# sent after update_activity_counts, with the ids of the chunks it updated
+activity_counts_updated = Signal(providing_args=['chunk_ids'])
+
+def update_activity_counts(chunk_ids):
+    """
+    Recomputes the comment and reviewer counts of the given chunks and of
+    the submissions they belong to. Comment deletes call this through
+    signals, and code that bulk creates comments or tasks has to call it
+    itself. Saving a single comment or task only adjusts the counts, see
+    count_activity.
+    """
+    chunk_ids = sorted(set(chunk_ids).difference([None]))
+    # keep the IN clauses within sqlite's limit on query parameters
+    for i in xrange(0, len(chunk_ids), 500):
+        _update_activity_counts(chunk_ids[i:i + 500])
+    if chunk_ids:
+        activity_counts_updated.send(sender=Chunk, chunk_ids=chunk_ids)
+
+def _update_activity_counts(chunk_ids):
+    chunks = Chunk.objects.filter(id__in=chunk_ids)
+    counts = dict((chunk_id, {
+        'user_comment_count': 0,
+        'static_comment_count': 0,
+        'test_comment_count': 0,
+        'reviewer_count': 0,
+        'last_comment_modified': None,
+    }) for chunk_id in chunk_ids)
+    for field, comment_type in [('user_comment_count', 'U'), ('static_comment_count', 'S'),
+            ('test_comment_count', 'T')]:
+        for chunk_id, count in chunks.filter(comments__type=comment_type) \
+                .annotate(count=Count('comments')).values_list('id', 'count'):
+            counts[chunk_id][field] = count
+    for chunk_id, count in chunks.annotate(count=Count('tasks')).values_list('id', 'count'):
+        counts[chunk_id]['reviewer_count'] = count
+    for chunk_id, latest in chunks.annotate(latest=Max('comments__modified')).values_list('id', 'latest'):
+        counts[chunk_id]['last_comment_modified'] = latest
+    for chunk_id, chunk_counts in counts.iteritems():
+        Chunk.objects.filter(id=chunk_id).update(**chunk_counts)
+
+    submission_ids = set(chunks.values_list('file__submission', flat=True))
+    totals = Chunk.objects.filter(file__submission__in=submission_ids) \
+        .values('file__submission') \
+        .annotate(user_comments=Sum('user_comment_count'),
+                  static_comments=Sum('static_comment_count'),
+                  test_comments=Sum('test_comment_count'),
+                  reviewers=Sum('reviewer_count'),
+                  latest=Max('last_comment_modified'))
+    for total in totals:
+        Submission.objects.filter(id=total['file__submission']).update(
+            user_comment_count=total['user_comments'] or 0,
+            static_comment_count=total['static_comments'] or 0,
+            test_comment_count=total['test_comments'] or 0,
+            reviewer_count=total['reviewers'] or 0,
+            last_comment_modified=total['latest'])
+
+def count_activity(chunk_id, user_comments=0, static_comments=0, test_comments=0, reviewers=0,
+        comment_modified=None):
+    """
+    Adds to the counts of a chunk and its submission with F() increments,
+    for a single comment or task that was just saved or deleted, instead of
+    recounting everything like update_activity_counts. comment_modified is
+    the time of a comment that was just saved, which makes it the latest.
+    """
+    fields = dict((field, F(field) + delta) for field, delta in [
+            ('user_comment_count', user_comments),
+            ('static_comment_count', static_comments),
+            ('test_comment_count', test_comments),
+            ('reviewer_count', reviewers)] if delta)
+    if comment_modified is not None:
+        fields['last_comment_modified'] = comment_modified
+    if chunk_id is None or not fields:
+        return
+    Chunk.objects.filter(id=chunk_id).update(**fields)
+    Submission.objects.filter(files__chunks=chunk_id).update(**fields)
+    activity_counts_updated.send(sender=Chunk, chunk_ids=[chunk_id])
 
 class StaffMarker(models.Model):
     chunk = models.ForeignKey(Chunk, related_name='staffmarkers')
@@ -0,0 +1,38 @@
+"""
+The course the tests of the apps build their data on: a subject, semester,
+assignment and submit milestone, plus helpers for submissions and chunks.
+"""
+import datetime
+
+from django.test import TestCase
+
+from chunks.models import Subject, Semester, Assignment, SubmitMilestone, ReviewMilestone, \
+        Submission, File, Chunk
+
+class CourseTestCase(TestCase):
+    """Sets up self.subject, self.semester, self.assignment and self.submit_milestone."""
+    def setUp(self):
+        self.now = datetime.datetime.now()
+        self.subject = Subject.objects.create(name='6.005')
+        self.semester = Semester.objects.create(subject=self.subject, semester='Fall', is_current_semester=True)
+        self.assignment = Assignment.objects.create(semester=self.semester, name='ps0')
+        self.submit_milestone = SubmitMilestone.objects.create(assignment=self.assignment, name='submit',
+                assigned_date=self.now, duedate=self.now)
+
+    def create_review_milestone(self, **fields):
+        values = dict(assignment=self.assignment, name='review', submit_milestone=self.submit_milestone,
+                chunks_to_assign='', assigned_date=self.now, duedate=self.now)
+        values.update(fields)
+        return ReviewMilestone.objects.create(**values)
+
+    def create_submission(self, name='author', authors=()):
+        submission = Submission.objects.create(milestone=self.submit_milestone, name=name)
+        if authors:
+            submission.authors.add(*authors)
+        return submission
+
+    def create_chunk(self, submission, name='A', data='class A {\n}\n', path=None, staff_lines='', **fields):
+        """Creates a file of the submission with a chunk spanning all of it."""
+        f = File.objects.create(path=path or '%s.java' % name, data=data, submission=submission,
+                staff_lines=staff_lines)
+        return Chunk.objects.create(file=f, name=name, start=0, end=len(data), **fields)
@@ -5,9 +5,33 @@ unittest). These will both pass when you run "manage.py test".
 Replace these with more appropriate tests for your application.
 """
 
+import json
+import os
+import shutil
+import tempfile
+import time
+
+from django.contrib.auth.models import User
+from django.core.exceptions import PermissionDenied
+from django.db import connection
 from django.test import TestCase, Client
-from chunks.models import Submission, File
+from django.test.client import RequestFactory
+from django.test.utils import override_settings
+from django_tools.middlewares import ThreadLocal
+
+from accounts.models import Member
+from chunks import views as chunk_views
+from chunks.clustering import cluster_milestone
+from chunks.highlight import highlight_chunk, highlight_file_lines
+from chunks.histograms import get_histograms, invalidate_histograms
+from chunks.models import Submission, File, Chunk, StaffLineIndex, LineIndex, get_chunk_access_cache, \
+        ChunkAccessCache
+from chunks.testing import CourseTestCase
 from chunks.views import *
+from review import suggestions
+from review.models import Comment
+from tasks.models import Task, invalidate_routing_states
+from utils.cache import LRUFileBasedCache
 
 class UserTest(TestCase):
     fixtures = ['test_fixtures.json']
@@ -46,3 +70,296 @@ class PublishCodeTest(TestCase):
         Tests that an attempt to publish someone else's code results in failure.
         """
         pass
+
+class HighlightCacheTest(TestCase):
+
+    def test_chunk_slices_file_highlighting(self):
+        """
+        Tests that a chunk's highlighted lines are cut out of its file's and
+        dedented like the chunk's own data.
+        """
+        data = "class A {\n  void f() {\n    int x = 1;\n  }\n}\n"
+        f = File(id=1001, path='A.java', data=data)
+        chunk = Chunk(file=f, name='f', start=data.index('  void'), end=data.index('}\n}') + 1)
+        chunk._split_lines()
+        chunk.lines = chunk._lines
+        file_lines = highlight_file_lines(f)
+        self.assertEqual(len(file_lines), 5)
+        self.assertTrue(highlight_file_lines(f) is file_lines)
+        chunk_lines = highlight_chunk(chunk)
+        self.assertEqual(len(chunk_lines), 3)
+        self.assertTrue(chunk_lines[0].startswith('<span class="kt">void'))
+        self.assertTrue(chunk_lines[1].startswith('  <span'))
+
+    def test_highlights_raw_bytes(self):
+        """
+        Tests that the undecoded file data the preprocessor passes in is
+        highlighted, and shares its cache entry with the decoded data.
+        """
+        data = u'class A {\n  String s = "caf\xe9";\n}\n'
+        lines = highlight_file_lines(File(id=1002, path='A.java', data=data.encode('utf-8')))
+        self.assertTrue(highlight_file_lines(File(id=1002, path='A.java', data=data)) is lines)
+        latin1 = highlight_file_lines(File(id=1003, path='A.java', data=data.encode('latin-1')))
+        self.assertEqual(latin1, lines)
+
+class LRUFileBasedCacheTest(TestCase):
+
+    def test_culls_least_recently_used(self):
+        """
+        Tests that a full cache drops the entries that were used longest ago
+        when culled, and never while setting entries.
+        """
+        location = tempfile.mkdtemp()
+        try:
+            cache = LRUFileBasedCache(location, {'OPTIONS': {'MAX_ENTRIES': 3, 'CULL_FREQUENCY': 3}})
+            for age, key in enumerate(['d', 'c', 'b', 'a']):
+                cache.set(key, key)
+                path = cache._key_to_file(cache.make_key(key))
+                os.utime(path, (time.time() - 100 * (4 - age),) * 2)
+            self.assertEqual([cache.get(key) for key in 'abcd'], ['a', 'b', 'c', 'd'])
+            cache.set('e', 'e', -1)
+            for age, key in enumerate(['c', 'b', 'a']):
+                path = cache._key_to_file(cache.make_key(key))
+                os.utime(path, (time.time() - 100 * (3 - age),) * 2)
+            cache.cull()
+            # the expired entry, then the least recently used ones
+            self.assertEqual([cache.get(key) for key in 'abcde'], ['a', None, None, 'd', None])
+        finally:
+            shutil.rmtree(location)
+
+    def test_add_and_incr(self):
+        """
+        Tests that counters can be started with add() and bumped with incr().
+        """
+        location = tempfile.mkdtemp()
+        try:
+            cache = LRUFileBasedCache(location, {})
+            self.assertRaises(ValueError, cache.incr, 'generation')
+            self.assertTrue(cache.add('generation', 1, 60))
+            self.assertFalse(cache.add('generation', 5, 60))
+            self.assertEqual(cache.incr('generation'), 2)
+            self.assertEqual(cache.get('generation'), 2)
+        finally:
+            shutil.rmtree(location)
+
+class StaffLineIndexTest(TestCase):
+
+    def test_round_trip(self):
+        """
+        Tests that serialized staff line intervals mark the same lines.
+        """
+        index = StaffLineIndex.parse(StaffLineIndex([(3, 5), (10, 10)]).serialize())
+        marked = index.mark((n, '') for n in range(1, 12))
+        self.assertEqual([n for n, line, staff in marked if staff], [3, 4, 5, 10])
+
+class LineIndexTest(TestCase):
+
+    def test_matches_splitlines(self):
+        """
+        Tests that the line index cuts out the same lines as splitlines.
+        """
+        data = u'class A {\r\n\tint x;\n\n}\n'
+        index = LineIndex(data)
+        self.assertEqual(list(index.numbered_lines()), list(enumerate(data.splitlines(), start=1)))
+        self.assertEqual(index.line(2), u'\tint x;')
+        self.assertEqual(index.line_number(data.index('x')), 2)
+        # an offset on a line break belongs to the next line
+        self.assertEqual(index.line_number(data.index('\n', 12)), 3)
+
+class ChunkAccessCacheTest(CourseTestCase):
+
+    def test_restricted_chunks(self):
+        """
+        Tests that restricted chunks are shown to their authors and reviewers
+        only, and that later checks in the same request hit the cache.
+        """
+        review_milestone = self.create_review_milestone()
+        author, reviewer, other = [User.objects.create(username=name) for name in ['author', 'reviewer', 'other']]
+        submission = self.create_submission(authors=[author])
+        chunks = [self.create_chunk(submission, name, chunk_info='restricted') for name in 'AB']
+        Task.objects.create(reviewer=reviewer, chunk=chunks[0], submission=submission, milestone=review_milestone)
+
+        class FakeRequest(object):
+            pass
+        try:
+            for user in [author, reviewer, other]:
+                ThreadLocal._thread_locals.request = FakeRequest()
+                ThreadLocal._thread_locals.request.user = user
+                get_chunk_access_cache().prefetch(chunks)
+                for chunk in Chunk.objects.filter(id__in=[c.id for c in chunks]):
+                    if user is other:
+                        self.assertRaises(PermissionDenied, lambda: chunk.lines)
+                    else:
+                        self.assertEqual(chunk.lines, [(1, 'class A {'), (2, '}')])
+                if user is not other:
+                    self.assertEqual(get_chunk_access_cache().hits, 2)
+        finally:
+            del ThreadLocal._thread_locals.request
+        # the chunks know their files, so only the allowed users are queried
+        with self.assertNumQueries(2):
+            ChunkAccessCache().prefetch(chunks)
+
+class ViewAllChunksTest(CourseTestCase):
+
+    def test_queries_do_not_grow_with_files(self):
+        """
+        Tests that view_all_chunks loads a submission's comments in bulk, so
+        a submission with more files doesn't take more queries.
+        """
+        author = User.objects.create(username='author')
+        Member.objects.create(user=author, semester=self.semester, role=Member.STUDENT)
+
+        def view_submission(file_count):
+            submission = self.create_submission(authors=[author])
+            for i in range(file_count):
+                chunk = self.create_chunk(submission, path='A%d.java' % i)
+                Comment(chunk=chunk, author=author, text='hi', start=1, end=1, type='U').save()
+                Comment(chunk=chunk, author=author, text='style', start=2, end=2, type='S').save()
+            request = RequestFactory().get('/')
+            request.user = author
+            queries = len(connection.queries)
+            context = view_all_chunks(request, 'all', submission.id)
+            self.assertEqual([stats[1:] for stats in context['path_and_stats']], [(1, 1)] * file_count)
+            return len(connection.queries) - queries
+
+        # only count the view's own queries, not the template's
+        render = chunk_views.render
+        chunk_views.render = lambda request, template, context: context
+        try:
+            with override_settings(DEBUG=True):
+                self.assertEqual(view_submission(2), view_submission(5))
+        finally:
+            chunk_views.render = render
+
+
+class SimilarCommentSuggestionsTest(CourseTestCase):
+
+    def test_ranked_pages_and_etag(self):
+        """
+        Tests that suggestions come in compact pages ranked by how related
+        their chunk is to the viewed one, and that an unchanged page is
+        revalidated with its ETag.
+        """
+        teacher = User.objects.create(username='teacher', first_name='Ada', last_name='Lovelace')
+        Member.objects.create(user=teacher, semester=self.semester, role=Member.TEACHER)
+        submission = self.create_submission()
+
+        def chunk(name, data):
+            return self.create_chunk(submission, name, data, path='%s%d.java' % (name, File.objects.count()))
+        viewed = chunk('Graph', 'int vertexCount() {\n  return vertices.size();\n}\n')
+        same_name = chunk('Graph', 'class Graph {\n}\n')
+        mentions = chunk('Edge', 'class Edge {\n}\n')
+        unrelated = chunk('Main', 'class Main {\n}\n')
+
+        def comment(chunk, text):
+            c = Comment(chunk=chunk, author=teacher, text=text, start=1, end=1)
+            c.save()
+            return c
+        c1 = comment(unrelated, 'Needs a spec')
+        c2 = comment(mentions, 'Keep the vertices in a set')
+        c3 = comment(same_name, 'Good rep invariant')
+
+        def get(page, etag=None):
+            request = RequestFactory().get('/', {'page': page}, HTTP_IF_NONE_MATCH=etag or '')
+            request.user = teacher
+            with override_settings(COMMENT_SEARCH=True):
+                return similar_comment_suggestions(request, str(viewed.id), 'staff')
+
+        per_page = suggestions.SUGGESTIONS_PER_PAGE
+        suggestions.SUGGESTIONS_PER_PAGE = 2
+        try:
+            first = get(1)
+            data = json.loads(first.content)
+            self.assertEqual(data['authors'], [['Ada Lovelace', 'teacher', 0]])
+            self.assertEqual([row[0] for row in data['comments']], [c3.id, c2.id])
+            self.assertEqual(data['next'], 2)
+            data = json.loads(get(2).content)
+            self.assertEqual([row[0] for row in data['comments']], [c1.id])
+            self.assertEqual(data['next'], None)
+
+            self.assertEqual(get(1, first['ETag']).status_code, 304)
+            c1.text = 'Needs a better spec'
+            c1.save()
+            self.assertEqual(get(1, first['ETag']).status_code, 200)
+
+            # changes to the authors and clusters show up as well
+            etag = get(1)['ETag']
+            teacher.first_name = 'Augusta'
+            teacher.save()
+            self.assertEqual(get(1, etag).status_code, 200)
+            etag = get(1)['ETag']
+            profile = teacher.get_profile()
+            profile.reputation += 1
+            profile.save()
+            self.assertEqual(get(1, etag).status_code, 200)
+            etag = get(1)['ETag']
+            # as cluster_milestone does
+            Chunk.objects.filter(id__in=[viewed.id, mentions.id]).update(cluster_id=viewed.id)
+            invalidate_routing_states()
+            changed = get(1, etag)
+            self.assertEqual(changed.status_code, 200)
+            self.assertEqual([row[0] for row in json.loads(changed.content)['comments']], [c2.id, c3.id])
+        finally:
+            suggestions.SUGGESTIONS_PER_PAGE = per_page
+
+
+class ClusteringTest(CourseTestCase):
+
+    def test_cluster_milestone(self):
+        """
+        Tests that chunks with similar student code share a cluster named
+        after the smallest chunk id, and that staff code is ignored.
+        """
+        staff = 'public class Graph {\n  // TODO implement the graph below, using a map of edges to weights\n'
+        loop = '  int total(List<Integer> weights) {\n    int sum = 0;\n    for (int w : weights) {\n      sum += w;\n    }\n    return sum;\n  }\n}\n'
+
+        def chunk(student_code):
+            submission = self.create_submission('s%d' % Submission.objects.count())
+            return self.create_chunk(submission, 'Graph', staff + student_code, staff_lines='1-2')
+        similar = [chunk(loop), chunk(loop.replace('sum', 'total')), chunk(loop.replace('0', '1'))]
+        different = chunk('  String name() {\n    return "graph of " + vertices.size() + " vertices";\n  }\n}\n')
+        staff_only = chunk('')
+
+        self.assertEqual(cluster_milestone(self.submit_milestone), 1)
+        cluster_ids = dict(Chunk.objects.values_list('id', 'cluster_id'))
+        for c in similar:
+            self.assertEqual(cluster_ids[c.id], similar[0].id)
+        self.assertEqual(cluster_ids[different.id], None)
+        self.assertEqual(cluster_ids[staff_only.id], None)
+        self.assertEqual(set(Chunk.objects.get(id=similar[1].id).get_similar_chunks()),
+                set([similar[0], similar[2]]))
+
+
+class HistogramTest(CourseTestCase):
+
+    def test_histograms(self):
+        """
+        Tests that chunk sizes are grouped per name, that names are sorted
+        into important, test and student defined groups, and that cached
+        histograms are recomputed once the milestone is invalidated.
+        """
+        submit_milestone = self.submit_milestone
+
+        def submission(i, chunks):
+            s = self.create_submission('s%d' % i)
+            for name, class_type, lines in chunks:
+                self.create_chunk(s, name, class_type=class_type, student_lines=lines)
+        for i in range(42):
+            submission(i, [('Graph', 'NONE', 40 if i % 2 else 250), ('GraphTest', 'TEST', 10), ('Main', 'NONE', 5)])
+        submission(42, [('Helper', 'NONE', 12)])
+
+        histograms = get_histograms(submit_milestone.id)
+        self.assertEqual(histograms['important_graph'], [['Graph', [[40, 21], [200, 10]]]])
+        self.assertEqual(histograms['test_graph'], [['GraphTest', [[10, 42]]]])
+        self.assertEqual(histograms['unimportant_graph'], [['Main', [[5, 42]]], ['StudentDefinedClasses', [[12, 1]]]])
+        self.assertEqual((histograms['max_important'], histograms['max_test'], histograms['max_unimportant']), (22, 43, 43))
+
+        self.assertEqual(get_histograms(submit_milestone.id), histograms)
+        # as the preprocessor does after an import
+        submission(43, [('Other', 'NONE', 3)])
+        self.assertEqual(get_histograms(submit_milestone.id), histograms)
+        invalidate_histograms(submit_milestone.id)
+        self.assertEqual(get_histograms(submit_milestone.id)['unimportant_graph'][-1], ['StudentDefinedClasses', [[12, 1], [3, 1]]])
+        Chunk.objects.filter(name='Helper').update(student_lines=13)
+        invalidate_histograms(submit_milestone.id)
+        self.assertEqual(get_histograms(submit_milestone.id)['unimportant_graph'][-1], ['StudentDefinedClasses', [[13, 1], [3, 1]]])
@@ -7,6 +7,6 @@ urlpatterns = patterns('chunks.views',
     (r'^simulate/(?P<review_milestone_id>\d+)', 'simulate'),
     (r'^list_users/(?P<review_milestone_id>\d+)', 'list_users'),
     (r'^publish/', 'publish_code'),
-    (r'^load_similar_comments/(?P<chunk_id>\d+)/(?P<load_all_staff_comments>(True|False))', 'load_similar_comments'),
+    (r'^similar_comments/(?P<chunk_id>\d+)/(?P<scope>(mine|staff))', 'similar_comment_suggestions'),
     (r'^highlight_comment_chunk_line/(?P<comment_id>\d+)', 'highlight_comment_chunk_line'),
 )
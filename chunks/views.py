@@ -1,21 +1,25 @@
 from accounts.models import Member
 from chunks.models import Chunk, File, Assignment, ReviewMilestone, SubmitMilestone, Submission, StaffMarker, Semester
+from chunks.models import get_chunk_access_cache
 from chunks.forms import SimulateRoutingForm
 from review.models import Comment, Vote, Star
+from review.suggestions import CommentSuggestions
 from tasks.models import Task
-from tasks.routing import simulate_tasks
+from tasks.simulation import simulate_tasks
 
 from django.http import Http404, HttpResponse
 from django.core.exceptions import PermissionDenied
 from django.shortcuts import render, get_object_or_404, redirect
 from django.template import RequestContext
 from django.contrib.auth.decorators import login_required
+from django.views.decorators.cache import cache_control
+from django.views.decorators.gzip import gzip_page
+from django.views.decorators.http import condition
 from django.contrib.auth.models import User
-from django.db.models import Q
+from django.db.models import Count, Q
 
-from pygments import highlight
-from pygments.lexers import get_lexer_for_filename
-from pygments.formatters import HtmlFormatter
+from chunks.highlight import highlight_chunk, highlight_file_lines
+from chunks.histograms import get_histograms
 
 from simplewiki.models import Article
 
@@ -29,22 +33,12 @@ from django.conf import settings
 
 import logging
 
-def highlight_chunk_lines(lexer, formatter, staff_lines, chunk, start=None, end=None):
-    [numbers, lines] = zip(*chunk.lines[start:end])
-    # highlight the code this way to correctly identify multi-line constructs
-    # TODO implement a custom formatter to do this instead
-    highlighted = zip(numbers,
-            highlight(chunk.data, lexer, formatter).splitlines()[start:end])
-    highlighted_lines = []
-    staff_line_index = 0
-    for number, line in highlighted:
-        if staff_line_index < len(staff_lines) and number >= staff_lines[staff_line_index].start_line and number <= staff_lines[staff_line_index].end_line:
-            while staff_line_index < len(staff_lines) and number == staff_lines[staff_line_index].end_line:
-                staff_line_index += 1
-            highlighted_lines.append((number, line, True))
-        else:
-            highlighted_lines.append((number, line, False))
-    return highlighted_lines
+def highlight_chunk_lines(staff_line_index, chunk, start=None, end=None):
+    numbers = zip(*chunk.lines[start:end])[0]
+    # slice the cached highlighting of the whole file so that multi-line
+    # constructs are still identified correctly
+    highlighted = zip(numbers, highlight_chunk(chunk)[start:end])
+    return staff_line_index.mark(highlighted)
 
 @login_required
 def view_chunk(request, chunk_id):
@@ -74,8 +68,6 @@ def view_chunk(request, chunk_id):
     user_votes = dict((vote.comment_id, vote.value) \
             for vote in user.votes.filter(comment__chunk=chunk_id))
 
-    staff_lines = StaffMarker.objects.filter(chunk=chunk).order_by('start_line', 'end_line')
-
     def get_comment_data(comment):
         vote = user_votes.get(comment.id, None)
         snippet = chunk.generate_snippet(comment.start, comment.end)
@@ -83,9 +75,7 @@ def view_chunk(request, chunk_id):
 
     comment_data = map(get_comment_data, chunk.comments.prefetch_related('author__profile', 'author__membership__semester'))
 
-    lexer = get_lexer_for_filename(chunk.file.path)
-    formatter = HtmlFormatter(cssclass='syntax', nowrap=True)
-    highlighted_lines = highlight_chunk_lines(lexer, formatter, staff_lines, chunk)
+    highlighted_lines = highlight_chunk_lines(chunk.file.staff_line_index(), chunk)
 
     task_count = Task.objects.filter(reviewer=user) \
             .exclude(status='C').exclude(status='U').count()
@@ -121,59 +111,53 @@ def view_chunk(request, chunk_id):
 
     return render(request, 'chunks/view_chunk.html', context)
 
-@login_required
-def load_similar_comments(request, chunk_id, load_all_staff_comments):
-    if settings.COMMENT_SEARCH:
-        user = request.user
+def _comment_suggestions(request, chunk_id, scope):
+    # built once per request, for both the ETag and the response
+    if not hasattr(request, 'comment_suggestions'):
         chunk = get_object_or_404(Chunk, pk=chunk_id)
         semester = chunk.file.submission.milestone.assignment.semester
-        subject = semester.subject
-        membership = Member.objects.filter(user=request.user).filter(semester=semester)
-        try:
-            role = membership[0].role
-        except:
-            return HttpResponse()
-
-        if load_all_staff_comments == "True":
-            if role == Member.TEACHER:
-                similarComments = Comment.objects.filter(author__membership__semester=semester).filter(author__membership__role=Member.TEACHER).filter(chunk__file__submission__milestone__assignment__semester__subject=subject).distinct().prefetch_related('chunk__file__submission__authors__profile', 'author__profile')
-            else:
-                similarComments = []
+        roles = Member.objects.filter(user=request.user, semester=semester).values_list('role', flat=True)
+        if not settings.COMMENT_SEARCH or not roles:
+            request.comment_suggestions = None
         else:
-            similarComments = Comment.objects.filter(author=request.user).filter(chunk__file__submission__milestone__assignment__semester__subject=subject).distinct().prefetch_related('chunk__file__submission__authors__profile', 'author__profile')
+            request.comment_suggestions = CommentSuggestions(chunk, request.user, scope, roles[0])
+    return request.comment_suggestions
 
-        similar_comment_data = []
-        for comment in similarComments:
-            if comment.author.get_full_name():
-                author = comment.author.get_full_name()
-            else:
-                author = comment.author.username
-            similar_comment_data.append({
-                'comment': comment.text,
-                'comment_id': comment.id,
-                'chunk_id': comment.chunk.id,
-                'author': author,
-                'author_username': comment.author.username,
-                'reputation': comment.author.profile.reputation,
-            })
-        return HttpResponse(json.dumps({'similar_comment_data': similar_comment_data}), content_type="application/json")
-    return HttpResponse()
+def _suggestions_page(request):
+    try:
+        return max(1, int(request.GET.get('page', 1)))
+    except ValueError:
+        return 1
+
+def _suggestions_etag(request, chunk_id, scope):
+    suggestions = _comment_suggestions(request, chunk_id, scope)
+    if suggestions is None:
+        return None
+    return suggestions.etag(_suggestions_page(request))
+
+@login_required
+@gzip_page
+@cache_control(private=True, must_revalidate=True, max_age=0)
+@condition(etag_func=_suggestions_etag)
+def similar_comment_suggestions(request, chunk_id, scope):
+    suggestions = _comment_suggestions(request, chunk_id, scope)
+    if suggestions is None:
+        return HttpResponse()
+    data = suggestions.page(_suggestions_page(request))
+    return HttpResponse(json.dumps(data, separators=(',', ':')), content_type="application/json")
 
 @login_required
 def highlight_comment_chunk_line(request, comment_id):
     if settings.COMMENT_SEARCH:
         comment = get_object_or_404(Comment, pk=comment_id)
         chunk = comment.chunk
-        staff_lines = StaffMarker.objects.filter(chunk=chunk).order_by('start_line', 'end_line')
-        lexer = get_lexer_for_filename(chunk.file.path)
-        formatter = HtmlFormatter(cssclass='syntax', nowrap=True)
         # comment.start is a line number, which is 1-indexed
         # start is an index into a list of lines, which is 0-indexed
         start = comment.start-1
         # comment.end is a line number
         # end is an index into a list of lines, which excludes the last line
         end = comment.end
-        highlighted_comment_lines = highlight_chunk_lines(lexer, formatter, staff_lines, comment.chunk, start, end)
+        highlighted_comment_lines = highlight_chunk_lines(chunk.file.staff_line_index(), chunk, start, end)
 
         return HttpResponse(json.dumps({
             'comment_id': comment_id,
@@ -207,9 +191,26 @@ def view_all_chunks(request, viewtype, submission_id):
         if not user.is_staff:
             raise PermissionDenied # you get a 401 page if you aren't a member of the semester
         
-    files = File.objects.filter(submission=submission_id).select_related('chunks')
+    files = list(File.objects.filter(submission=submission_id) \
+            .select_related('submission__milestone__assignment__semester'))
     if not files:
         raise Http404
+    File.prefetch_staff_line_indexes(files)
+
+    # load every chunk and comment of the submission up front and group them
+    # by file and chunk, rather than querying for each chunk
+    files_by_id = dict((afile.id, afile) for afile in files)
+    chunks_by_file = defaultdict(list)
+    for chunk in Chunk.objects.filter(file__submission=submission_id).order_by('start'):
+        chunk._file_cache = files_by_id[chunk.file_id]
+        chunks_by_file[chunk.file_id].append(chunk)
+    get_chunk_access_cache().prefetch(chunk for chunks in chunks_by_file.itervalues() for chunk in chunks)
+    comments_by_chunk = defaultdict(list)
+    comments = Comment.objects.filter(chunk__file__submission=submission_id) \
+            .select_related('author__profile') \
+            .prefetch_related('author__membership__semester')
+    for comment in comments:
+        comments_by_chunk[comment.chunk_id].append(comment)
 
     milestone = files[0].submission.milestone
     milestone_name = milestone.full_name()
@@ -229,27 +230,14 @@ def view_all_chunks(request, viewtype, submission_id):
     for afile in files:
         paths.append(os.path.relpath(afile.path, common_prefix))
 
-    formatter = HtmlFormatter(cssclass='syntax', nowrap=True)
     for afile in files:
-        staff_lines = StaffMarker.objects.filter(chunk__file=afile).order_by('start_line', 'end_line')
-    	lexer = get_lexer_for_filename(afile.path)
         #prepare the file - get the lines that are part of chunk and the ones that aren't
         highlighted_lines_for_file = []
         numbers, lines = zip(*afile.lines)
-        highlighted = zip(numbers,
-                highlight(afile.data, lexer, formatter).splitlines())
-
-        highlighted_lines = []
-        staff_line_index = 0
-        for number, line in highlighted:
-            if staff_line_index < len(staff_lines) and number >= staff_lines[staff_line_index].start_line and number <= staff_lines[staff_line_index].end_line:
-                while staff_line_index < len(staff_lines) and number == staff_lines[staff_line_index].end_line:
-                    staff_line_index += 1
-                highlighted_lines.append((number, line, True))
-            else:
-                highlighted_lines.append((number, line, False))
+        highlighted = zip(numbers, highlight_file_lines(afile))
+        highlighted_lines = afile.staff_line_index().mark(highlighted)
 
-        chunks = afile.chunks.order_by('start')
+        chunks = chunks_by_file[afile.id]
         total_lines = len(afile.lines)
         offset = numbers[0]
         start = offset
@@ -274,11 +262,13 @@ def view_all_chunks(request, viewtype, submission_id):
                     snippet = chunk.generate_snippet(comment.start, comment.end)
                     return (comment, snippet)
 
-                comments = chunk.comments.prefetch_related('chunk', 'author__profile', 'author__membership__semester')
+                comments = comments_by_chunk[chunk.id]
+                for comment in comments:
+                    comment._chunk_cache = chunk
                 comment_data = map(get_comment_data, comments)
 
-                user_comments += comments.filter(type='U').count()
-                static_comments += comments.filter(type='S').count()
+                user_comments += sum(1 for comment in comments if comment.type == 'U')
+                static_comments += sum(1 for comment in comments if comment.type == 'S')
 
                 #now for the chunk part
                 start = chunk_start
@@ -331,83 +321,10 @@ def view_submission_for_milestone(request, viewtype, milestone_id, username):
 def simulate(request, review_milestone_id):
     user = request.user
     review_milestone = ReviewMilestone.objects.get(id=review_milestone_id)
-    milestone_chunks = Chunk.objects.filter(file__submission__milestone=review_milestone.submit_milestone).select_related('file__submission__milestone', 'profile')
-
-    chunks_graph = dict()
-    edited = set()
-    test = set()
-    staff_provided = set()
-    max_important = 0
-    max_test = 0
-    max_unimportant = 0
-    for chunk in milestone_chunks:
-        name = chunk.name
-        if name is None:
-            continue
-        lines_dict = dict()
-        num = 0
-        if name in chunks_graph:
-            lines_dict, num = chunks_graph[name]
-        lines = min(chunk.student_lines, 200)
-        if lines in lines_dict:
-            copies = lines_dict[lines]
-            if not (lines == 200 and copies == 10):
-                lines_dict[lines] += 1
-        else:
-            lines_dict[lines] = 1
-        if lines > 30 and chunk.class_type == "NONE":
-            edited.add(name)
-        if num>40:
-            staff_provided.add(name)
-        if chunk.class_type == "TEST":
-            test.add(name)
-        chunks_graph[name] = (lines_dict, num+1)
-
-    #list of lists ["sudoku", [[1,20], [3,50]]]
-    #list of important and unimportant
-    important_graphs = []
-    test_graphs = []
-    unimportant_graphs = []
-    other_test = set()
-    other = set()
-    for name in chunks_graph.keys():
-        lines_dict, num = chunks_graph[name]
-        lines_list = []
-        max_copy = 0
-        for key in lines_dict.keys():
-            lines_list.append([int(key), lines_dict[key]])
-            max_copy = max(max_copy, lines_dict[key])
-        if name in test:
-            max_test = max(max_test, max_copy)
-            if name in staff_provided:
-                test_graphs.append([name, lines_list])
-            else:
-                other_test.add(name)
-        elif name in edited and name in staff_provided:
-            max_important = max(max_important, max_copy)
-            important_graphs.append([name, lines_list])
-        else:
-            max_unimportant = max(max_unimportant, max_copy)
-            if name in staff_provided:
-                unimportant_graphs.append([name, lines_list])
-            else:
-                other.add(name)
-
-    #call everything student created as "other"
-    lines_list = []
-    for name in other_test:
-        lines_dict, num = chunks_graph[name]
-        for key in lines_dict.keys():
-            lines_list.append([int(key), lines_dict[key]])
-    if len(lines_list) > 0:
-        test_graphs.append(["StudentDefinedTests", lines_list])
-    lines_list = []
-    for name in other:
-        lines_dict, num = chunks_graph[name]
-        for key in lines_dict.keys():
-            lines_list.append([int(key), lines_dict[key]])
-    if len(lines_list) > 0:
-        unimportant_graphs.append(["StudentDefinedClasses", lines_list])
+    histograms = get_histograms(review_milestone.submit_milestone_id)
+    important_graphs = histograms['important_graph']
+    unimportant_graphs = histograms['unimportant_graph']
+    test_graphs = histograms['test_graph']
 
     chunks_data = []
 
@@ -434,9 +351,9 @@ def simulate(request, review_milestone_id):
             'important_graph': important_graphs,
             'unimportant_graph': unimportant_graphs,
             'test_graph': test_graphs,
-            'max_important': max_important+1,
-            'max_unimportant': max_unimportant+1,
-            'max_test': max_test +1,
+            'max_important': histograms['max_important'],
+            'max_unimportant': histograms['max_unimportant'],
+            'max_test': histograms['max_test'],
         })
     else:
         students = request.POST['students']
@@ -483,133 +400,102 @@ def simulate(request, review_milestone_id):
             'important_graph': important_graphs,
             'unimportant_graph': unimportant_graphs,
             'test_graph': test_graphs,
-            'max_important': max_important+1,
-            'max_unimportant': max_unimportant+1,
-            'max_test': max_test +1,
+            'max_important': histograms['max_important'],
+            'max_unimportant': histograms['max_unimportant'],
+            'max_test': histograms['max_test'],
         })
 
 @login_required
 def list_users(request, review_milestone_id):
-  # def cmp_user_data(user_data1, user_data2):
-  #   user1 = user_data1['user']
-  #   user2 = user_data2['user']
-  #   # change this to use their member role in the class
-  #   if user1.profile.role == user2.profile.role:
-  #     return cmp(user1.first_name, user2.first_name)
-  #   if user1.profile.is_student():
-  #     return -1
-  #   if user1.profile.is_staff():
-  #     return 1
-  #   if user2.profile.is_student():
-  #     return 1
-  #   return -1
-
-  def task_dict(task):
-    return {
-        'completed': task.completed,
-        'chunk': task.chunk,
-        'author': task.author(),
-        'reviewer': task.reviewer,
-        'reviewers_dicts': None,
-        }
-  def chunk_dict(chunk):
-    return 
-
-  def reviewers_comment_strs(chunk=None, tasks=None):
-    comment_count = defaultdict(int)
-    if chunk and (not tasks or len(tasks) == 0):
-      for comment in chunk.comments.all():
-        comment_count[comment.author.profile] += 1
-
-    #if chunk and (not tasks or len(tasks) == 0):
-    #  tasks = chunk.tasks.all()
-
-    checkstyle = []; students = []; alum = []; staff = []
-    for task in tasks:
-      user_task_dict = {
-        'username': task.reviewer.user.username,
-        'count': comment_count[task.reviewer],
-        'completed': task.completed,
-        }
-
-      member = task.reviewer.user.memberships.objects.get(user=task.reviewer.user, semester=task.milestone.assignment.semester)
-      if member.is_student():
-        students.append(user_task_dict)
-      elif member.is_teacher():
-        staff.append(user_task_dict)
-      elif member.is_volunteer():
-        alum.append(user_task_dict)
-      elif task.reviewer.is_checkstyle():
-        checkstyle.append(user_task_dict)
-
-    return [checkstyle, students, alum, staff]
-
-  review_milestone = ReviewMilestone.objects.get(id=review_milestone_id)
-  submissions = Submission.objects.filter(milestone=review_milestone.submit_milestone)
-  assignment_id = review_milestone.submit_milestone.id
+  review_milestone = get_object_or_404(ReviewMilestone.objects.select_related('assignment', 'submit_milestone'),
+      id=review_milestone_id)
+  submit_milestone_id = review_milestone.submit_milestone_id
+  roles = dict(Member.objects.filter(semester=review_milestone.assignment.semester_id) \
+      .values_list('user_id', 'role'))
 
   data = {}
-  chunk_task_map = defaultdict(list)
-  chunk_map = {}
-  form = None
-
-  for user in User.objects.select_related('profile').filter(Q(submissions__milestone__id=assignment_id) | Q(tasks__chunk__file__submission__milestone__id=assignment_id)):
-      data[user.id] = {'tasks': [], 'user': user, 'chunks': [], 'has_chunks': False, 'submission': None}
+  def entry_for(user_id):
+    if user_id not in data:
+      data[user_id] = {'tasks': [], 'user': None, 'chunks': [], 'has_chunks': False, 'submission': None}
+    return data[user_id]
 
-  for submission in Submission.objects.select_related('author__profile').filter(milestone__id=assignment_id):
-      data[submission.author_id]['submission'] = submission
+  submission_authors = defaultdict(list)
+  for submission in Submission.objects.filter(milestone=submit_milestone_id).prefetch_related('authors'):
+    for author in submission.authors.all():
+      submission_authors[submission.id].append(author)
+      entry_for(author.id)['submission'] = submission
 
-  for chunk in Chunk.objects.select_related('file__submission').filter(file__submission__milestone__id=assignment_id):
-      chunk_map[chunk.id] = chunk
-      authorid = chunk.file.submission.author_id
-      data[authorid]['chunks'].append({
-        'reviewer-count': chunk.reviewer_count(),
-        'id': chunk.id,
-        'name': chunk.name,
+  chunk_map = {}
+  for chunk_id, name, reviewer_count, submission_id in Chunk.objects \
+      .filter(file__submission__milestone=submit_milestone_id) \
+      .values_list('id', 'name', 'reviewer_count', 'file__submission'):
+    chunk_map[chunk_id] = {'id': chunk_id, 'name': name, 'submission_id': submission_id}
+    for author in submission_authors[submission_id]:
+      entry_for(author.id)['chunks'].append({
+        'reviewer_count': reviewer_count,
+        'id': chunk_id,
+        'name': name,
         'reviewers_dicts': None,
-        'tasks': [],
         })
-      data[authorid]['has_chunks'] = True
-      
-  for task in Task.objects.select_related('chunk__file__submission__author', 'reviewer__user').filter(chunk__file__submission__milestone__id=assignment_id):
-      authorid = task.chunk.file.submission.author_id
-      chunkid = task.chunk_id
-      for chunk in data[authorid]['chunks']:
-          if chunk["id"] == chunkid:
-              chunk["tasks"].append(task)
-
-  if request.method == 'POST':
-    form = SimulateRoutingForm(request.POST)
-
-  if form: #and form.is_valid():
-    #chunk_task_map = simulate_tasks(review_milestone, form.cleaned_data['num_students'], form.cleaned_data['num_staff'], form.cleaned_data['num_alum'])
-    chunk_task_map = simulate_tasks(review_milestone, 0, 0, 0)
-
-    for (chunk_id, tasks) in chunk_task_map.iteritems():
-      for task in tasks:
-        if task.reviewer.userid not in data:
-          data[task.reviewer.user_id] = {'tasks': [task_dict(task)], 'user': task.reviewer.user, 'chunks': [], 'submission': None}
-        else:
-          data[task.reviewer.user_id]['tasks'].append(task_dict(task))
+      entry_for(author.id)['has_chunks'] = True
 
+  form = SimulateRoutingForm(request.POST or None)
+  if form.is_valid():
+    chunk_task_map = simulate_tasks(review_milestone, form.cleaned_data['num_students'],
+        form.cleaned_data['num_staff'], form.cleaned_data['num_alum'])
+    tasks = [task for chunk_tasks in chunk_task_map.itervalues() for task in chunk_tasks]
   else:
-
-    for user_id in data.keys():
-      for chunk in data[user_id]['chunks']:
-        chunk_task_map[chunk['id']] = chunk['tasks']
-        for task in chunk['tasks']:
-          user_id = task.reviewer.user_id
-          data[user_id]['tasks'].append(task_dict(task))
-
-  chunk_reviewers_map = defaultdict(list)
-  
-  for user_data in data.values():
+    tasks = list(Task.objects.filter(milestone=review_milestone, chunk__isnull=False))
+
+  comment_counts = dict(((row['chunk'], row['author']), row['count']) for row in \
+      Comment.objects.filter(chunk__file__submission__milestone=submit_milestone_id) \
+      .values('chunk', 'author').annotate(count=Count('id')))
+  users = User.objects.select_related('profile') \
+      .in_bulk(set(data.keys()) | set(task.reviewer_id for task in tasks))
+
+  # reviewers of each chunk, as [checkstyle, students, alums, staff]
+  chunk_reviewers_map = defaultdict(lambda: [[], [], [], []])
+  for task in tasks:
+    reviewer = users[task.reviewer_id]
+    role = roles.get(reviewer.id)
+    if reviewer.username == 'checkstyle':
+      group = 0
+    elif role == Member.STUDENT:
+      group = 1
+    elif role == Member.VOLUNTEER:
+      group = 2
+    elif role == Member.TEACHER:
+      group = 3
+    else:
+      continue
+    chunk_reviewers_map[task.chunk_id][group].append({
+      'username': reviewer.username,
+      'count': comment_counts.get((task.chunk_id, reviewer.id), 0),
+      'completed': task.completed,
+      })
+
+  for task in tasks:
+    chunk = chunk_map[task.chunk_id]
+    authors = submission_authors[chunk['submission_id']]
+    entry_for(task.reviewer_id)['tasks'].append({
+      'completed': task.completed,
+      'chunk': chunk,
+      'author': authors[0] if authors else None,
+      'reviewers_dicts': chunk_reviewers_map[task.chunk_id],
+      })
+
+  for user_id, user_data in data.iteritems():
+    user_data['user'] = users[user_id]
     for chunk in user_data['chunks']:
       chunk['reviewers_dicts'] = chunk_reviewers_map[chunk['id']]
-    for task in user_data['tasks']:
-      task['reviewers_dicts'] = chunk_reviewers_map[task['chunk'].id]
 
-  return render(request, 'chunks/list_users.html', {'users_data': sorted(data.values(), cmp=cmp_user_data), 'form': SimulateRoutingForm()})
+  users_data = sorted(data.values(), key=lambda entry:
+      (roles.get(entry['user'].id) == Member.TEACHER, entry['user'].first_name, entry['user'].username))
+  return render(request, 'chunks/list_users.html', {
+    'users_data': users_data,
+    'form': form,
+    'simulated': form.is_bound and form.is_valid(),
+    })
 
 @login_required
 def publish_code(request):
@@ -0,0 +1,11 @@
+from django.conf import settings
+
+# alias in settings.CACHES that stores the users' dashboard summaries. It
+# should be shared by all the server processes (e.g. file based), since
+# summaries are invalidated by the process that changed the data.
+SUMMARY_CACHE = getattr(settings, 'DASHBOARD_SUMMARY_CACHE', 'default')
+
+# summaries are invalidated by signals, this only bounds how long a change
+# made around the ORM (raw SQL, queryset.update) can go unnoticed
+SUMMARY_CACHE_TIMEOUT = getattr(
+        settings, 'DASHBOARD_SUMMARY_CACHE_TIMEOUT', 60 * 60 * 24)
@@ -1,3 +1,74 @@
 from django.db import models
+from django.db.models.signals import post_save, post_delete, pre_delete, m2m_changed
+from django.dispatch import receiver
 
-# Create your models here.
+from accounts.models import Member, Extension
+from chunks.models import Subject, Semester, Assignment, Milestone, SubmitMilestone, ReviewMilestone, \
+        Submission, Chunk, activity_counts_updated
+from tasks.models import Task, tasks_updated
+from dashboard.summary import invalidate_dashboards, invalidate_all_dashboards
+
+# The dashboard has no models of its own; these receivers keep the cached
+# dashboard summaries (see dashboard.summary) in step with what they show.
+
+@receiver(activity_counts_updated, sender=Chunk)
+def invalidate_on_activity(sender, chunk_ids, **kwargs):
+    """Comments or tasks changed the counts shown next to tasks and submissions"""
+    # one query for both; a chunk has few reviewers and authors
+    rows = Chunk.objects.filter(id__in=chunk_ids).values_list('tasks__reviewer', 'file__submission__authors')
+    reviewer_ids, author_ids = zip(*rows) or ([], [])
+    invalidate_dashboards(reviewer_ids, ['tasks'])
+    invalidate_dashboards(author_ids, ['submissions'])
+
+
+@receiver(post_save, sender=Task)
+@receiver(post_delete, sender=Task)
+def invalidate_on_task(sender, instance, **kwargs):
+    invalidate_dashboards([instance.reviewer_id], ['tasks'])
+
+
+@receiver(tasks_updated, sender=Task)
+def invalidate_on_task_update(sender, reviewer_ids, **kwargs):
+    invalidate_dashboards(reviewer_ids, ['tasks'])
+
+
+@receiver(post_save, sender=Submission)
+@receiver(pre_delete, sender=Submission)
+def invalidate_on_submission(sender, instance, **kwargs):
+    invalidate_dashboards(instance.authors.values_list('id', flat=True), ['submissions'])
+
+
+@receiver(m2m_changed, sender=Submission.authors.through)
+def invalidate_on_submission_authors(sender, instance, action, pk_set=None, **kwargs):
+    if action not in ('post_add', 'pre_remove', 'pre_clear', 'post_remove'):
+        return
+    if isinstance(instance, Submission):
+        user_ids = set(pk_set or []).union(instance.authors.values_list('id', flat=True))
+    else:
+        user_ids = [instance.id]
+    invalidate_dashboards(user_ids, ['submissions'])
+
+
+@receiver(post_save, sender=Extension)
+@receiver(post_delete, sender=Extension)
+@receiver(post_save, sender=Member)
+@receiver(post_delete, sender=Member)
+def invalidate_on_membership(sender, instance, **kwargs):
+    invalidate_dashboards([instance.user_id], ['milestones'])
+
+
+@receiver(post_save, sender=Subject)
+@receiver(post_delete, sender=Subject)
+@receiver(post_save, sender=Semester)
+@receiver(post_delete, sender=Semester)
+@receiver(post_save, sender=Assignment)
+@receiver(post_delete, sender=Assignment)
+@receiver(post_save, sender=Milestone)
+@receiver(post_delete, sender=Milestone)
+@receiver(post_save, sender=SubmitMilestone)
+@receiver(post_delete, sender=SubmitMilestone)
+@receiver(post_save, sender=ReviewMilestone)
+@receiver(post_delete, sender=ReviewMilestone)
+def invalidate_on_course_change(sender, instance, raw=False, **kwargs):
+    """These show up on every member's dashboard, so start over"""
+    invalidate_all_dashboards()
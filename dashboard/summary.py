@@ -0,0 +1,119 @@
+"""
+Caches the data behind each user's dashboard.
+
+A summary has three sections, each cached on its own and rebuilt only when
+something it shows changes (see dashboard.models for the signals):
+
+  tasks        the user's review tasks, with their chunks' counts
+  submissions  the user's submissions, with their counts
+  milestones   the user's submit milestones, extensions and slack days
+
+Sections don't depend on the current time; dashboard_for applies the due
+date cutoffs when it serves them.
+"""
+import time
+from collections import defaultdict
+
+from django.core.cache import get_cache
+
+from accounts.models import Member, Extension
+from chunks.models import Submission, SubmitMilestone
+import app_settings
+
+SECTIONS = ('tasks', 'submissions', 'milestones')
+
+GENERATION_KEY = 'dashboard:generation'
+GENERATION_TIMEOUT = 60 * 60 * 24 * 365
+
+def _cache():
+    return get_cache(app_settings.SUMMARY_CACHE)
+
+def _generation(cache):
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        _start_generation(cache)
+        generation = cache.get(GENERATION_KEY)
+    return generation
+
+def _start_generation(cache):
+    # start from the clock rather than 0, so that losing the key can't bring
+    # back summaries from an earlier generation; add() keeps the first of
+    # several processes starting it at once
+    cache.add(GENERATION_KEY, int(time.time()), GENERATION_TIMEOUT)
+
+def _key(generation, section, user_id):
+    return 'dashboard:%s:%s:%s' % (generation, section, user_id)
+
+def build_tasks(user):
+    return list(user.tasks.select_related('submission',
+        'chunk__file__submission__milestone__assignment__semester',
+        'milestone__assignment__semester__subject'))
+
+def build_submissions(user):
+    return list(Submission.objects.filter(authors=user) \
+        .select_related('milestone__assignment__semester'))
+
+def build_milestones(user):
+    extensions = list(Extension.objects.filter(user=user) \
+        .select_related('milestone__assignment'))
+    extension_by_milestone = dict((extension.milestone_id, extension) for extension in extensions)
+    milestones = SubmitMilestone.objects \
+        .filter(assignment__semester__members__user=user, assignment__semester__members__role=Member.STUDENT) \
+        .select_related('assignment') \
+        .order_by('duedate')
+    milestone_data = [(milestone, extension_by_milestone.get(milestone.id)) for milestone in milestones]
+
+    slack_used = defaultdict(int)
+    for extension in extensions:
+        slack_used[extension.milestone.assignment.semester_id] += extension.slack_used or 0
+    slack_data = []
+    for membership in Member.objects.filter(user=user, role=Member.STUDENT).select_related('semester__subject'):
+        if membership.slack_budget > 0:
+            slack_data.append((membership.semester, membership.slack_budget - slack_used[membership.semester_id]))
+    return milestone_data, slack_data
+
+BUILDERS = {
+    'tasks': build_tasks,
+    'submissions': build_submissions,
+    'milestones': build_milestones,
+}
+
+def get_dashboard_summary(user):
+    """
+    Returns a dict with the sections of the user's dashboard summary,
+    building and caching any that are missing.
+    """
+    cache = _cache()
+    generation = _generation(cache)
+    keys = dict((section, _key(generation, section, user.id)) for section in SECTIONS)
+    summary = {}
+    built = {}
+    cached = cache.get_many(keys.values())
+    for section, key in keys.iteritems():
+        if key in cached:
+            summary[section] = cached[key]
+        else:
+            summary[section] = built[key] = BUILDERS[section](user)
+    # sections built before a generation bump may be stale, and must not be
+    # cached under the new generation
+    if built and _generation(cache) == generation:
+        cache.set_many(built, app_settings.SUMMARY_CACHE_TIMEOUT)
+    return summary
+
+def invalidate_dashboards(user_ids, sections=SECTIONS):
+    """Drops the given sections of the given users' summaries."""
+    cache = _cache()
+    generation = _generation(cache)
+    cache.delete_many([_key(generation, section, user_id)
+        for user_id in set(user_ids) if user_id is not None
+        for section in sections])
+
+def invalidate_all_dashboards():
+    """Drops every summary, e.g. when a milestone or semester changes."""
+    cache = _cache()
+    try:
+        # incr() is atomic, so concurrent invalidations all count
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        # a new generation drops the summaries already
+        _start_generation(cache)
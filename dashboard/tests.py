@@ -5,8 +5,16 @@ when you run "manage.py test".
 Replace this with more appropriate tests for your application.
 """
 
+from django.contrib.auth.models import User
 from django.test import TestCase
 
+from accounts.models import Member
+from chunks.testing import CourseTestCase
+from dashboard import summary as dashboard_summary
+from dashboard.summary import get_dashboard_summary, invalidate_all_dashboards
+from review.models import Comment
+from tasks.models import Task
+
 
 class SimpleTest(TestCase):
     def test_basic_addition(self):
@@ -14,3 +22,77 @@ class SimpleTest(TestCase):
         Tests that 1 + 1 always equals 2.
         """
         self.assertEqual(1 + 1, 2)
+
+
+class DashboardSummaryTest(CourseTestCase):
+    def setUp(self):
+        super(DashboardSummaryTest, self).setUp()
+        self.review_milestone = self.create_review_milestone()
+        self.author = User.objects.create(username='author')
+        self.reviewer = User.objects.create(username='reviewer')
+        for user in [self.author, self.reviewer]:
+            Member.objects.create(user=user, semester=self.semester, role=Member.STUDENT)
+        submission = self.create_submission(authors=[self.author])
+        self.chunk = self.create_chunk(submission)
+        self.task = Task.objects.create(reviewer=self.reviewer, chunk=self.chunk, submission=submission, milestone=self.review_milestone)
+
+    def test_summary_is_cached_until_its_data_changes(self):
+        """
+        Tests that a summary is served from the cache and that only the
+        sections a change touches are rebuilt.
+        """
+        summary = get_dashboard_summary(self.reviewer)
+        self.assertEqual([task.id for task in summary['tasks']], [self.task.id])
+        self.assertEqual(summary['tasks'][0].chunk.comment_count(), 0)
+        get_dashboard_summary(self.author)
+        with self.assertNumQueries(0):
+            get_dashboard_summary(self.reviewer)
+
+        Comment(chunk=self.chunk, author=self.reviewer, text='hi', start=1, end=1).save()
+        summary = get_dashboard_summary(self.reviewer)
+        self.assertEqual(summary['tasks'][0].chunk.comment_count(), 1)
+        summary = get_dashboard_summary(self.author)
+        self.assertEqual(summary['submissions'][0].user_comment_count, 1)
+
+        self.task.mark_as('C')
+        # just the tasks section is rebuilt
+        with self.assertNumQueries(1):
+            summary = get_dashboard_summary(self.reviewer)
+        self.assertEqual(summary['tasks'][0].status, 'C')
+
+    def test_course_changes_drop_every_summary(self):
+        """
+        Tests that renaming the review milestone or subject a task shows
+        rebuilds the summaries.
+        """
+        get_dashboard_summary(self.reviewer)
+        self.review_milestone.name = 'code review'
+        self.review_milestone.save()
+        summary = get_dashboard_summary(self.reviewer)
+        self.assertEqual(summary['tasks'][0].milestone.name, 'code review')
+
+        self.subject.name = '6.031'
+        self.subject.save()
+        summary = get_dashboard_summary(self.reviewer)
+        self.assertEqual(summary['tasks'][0].milestone.assignment.semester.subject.name, '6.031')
+
+    def test_summary_built_during_a_change_is_not_cached(self):
+        """
+        Tests that sections built before every summary was dropped aren't
+        cached under the new generation.
+        """
+        build_tasks = dashboard_summary.BUILDERS['tasks']
+        def build_tasks_during_change(user):
+            tasks = build_tasks(user)
+            invalidate_all_dashboards()
+            return tasks
+        dashboard_summary.BUILDERS['tasks'] = build_tasks_during_change
+        try:
+            get_dashboard_summary(self.reviewer)
+        finally:
+            dashboard_summary.BUILDERS['tasks'] = build_tasks
+        # every section is built again
+        with self.assertNumQueries(5):
+            get_dashboard_summary(self.reviewer)
+        with self.assertNumQueries(0):
+            get_dashboard_summary(self.reviewer)
@@ -1,5 +1,5 @@
 from django.core import serializers
-from django.db.models import Q, Count, Max
+from django.db.models import Q
 from django.shortcuts import render, redirect, get_object_or_404
 from django.template import RequestContext
 from django.contrib.auth.models import User
@@ -9,11 +9,11 @@ from django.http import HttpResponse, Http404
 from django.core.urlresolvers import reverse
 from  django.core.exceptions import ObjectDoesNotExist
 
-from chunks.models import Chunk, Assignment, Milestone, SubmitMilestone, ReviewMilestone, Submission, StaffMarker
-from review.models import Comment
+from chunks.models import Chunk, Assignment, Milestone, ReviewMilestone, Submission, StaffMarker
 from tasks.models import Task
 from tasks.routing import assign_tasks
-from accounts.models import UserProfile, Extension, Member
+from accounts.models import UserProfile, Member
+from dashboard.summary import get_dashboard_summary
 
 import datetime
 import sys
@@ -57,89 +57,54 @@ def student_dashboard(request, username):
     return dashboard_for(request, other_user)
 
 def dashboard_for(request, dashboard_user, new_task_count = 0, allow_requesting_more_tasks = False):
-    def annotate_tasks_with_counts(tasks):
-        return tasks.annotate(comment_count=Count('chunk__comments', distinct=True),
-                       reviewer_count=Count('chunk__tasks', distinct=True))
-        #logging.log(tasks.all()[0].comment_count)
-
-    all_tasks = dashboard_user.tasks \
-        .select_related('submission', 'chunk__file__submission__milestone', 'milestone__assignment__semester__subject')
-    active_tasks = all_tasks \
-        .exclude(status='C') \
-        .exclude(status='U') \
-        .order_by('chunk__name', 'submission__name')
-    active_tasks = annotate_tasks_with_counts(active_tasks)
-
-    old_completed_tasks = all_tasks \
-        .filter(status='C') \
-        .exclude(chunk__file__submission__milestone__assignment__semester__is_current_semester=True)
-    old_completed_tasks = annotate_tasks_with_counts(old_completed_tasks)
-
-    completed_tasks = all_tasks \
-        .filter(status='C') \
-        .filter(chunk__file__submission__milestone__assignment__semester__is_current_semester=True) \
-        .order_by('completed').reverse()
-    completed_tasks = annotate_tasks_with_counts(completed_tasks)
+    # the queries behind the dashboard are cached per user and section, see
+    # dashboard.summary; only the cutoffs that depend on the time are applied here
+    summary = get_dashboard_summary(dashboard_user)
+    now = datetime.datetime.now()
+
+    def is_current(task):
+        return task.chunk is not None and \
+            task.chunk.file.submission.milestone.assignment.semester.is_current_semester
+
+    all_tasks = summary['tasks']
+    active_tasks = [task for task in all_tasks if task.status not in ('C', 'U')]
+    active_tasks.sort(key=lambda task: (task.chunk and task.chunk.name, task.submission and task.submission.name))
+
+    old_completed_tasks = [task for task in all_tasks if task.status == 'C' and not is_current(task)]
+
+    completed_tasks = [task for task in all_tasks if task.status == 'C' and is_current(task)]
+    completed_tasks.sort(key=lambda task: task.completed, reverse=True)
 
     def collect_submission_data(submissions):
         data = []
         for submission in submissions:
-            user_comments = Comment.objects.filter(chunk__file__submission=submission).filter(type='U').count()
-            static_comments = Comment.objects.filter(chunk__file__submission=submission).filter(type='S').count()
-            reviewer_count = User.objects.filter(tasks__chunk__file__submission = submission).count()
-            data.append((submission, reviewer_count, submission.last_modified,
-                                      user_comments, static_comments))
+            data.append((submission, submission.reviewer_count, submission.last_comment_modified,
+                                      submission.user_comment_count, submission.static_comment_count))
         return data
 
     #get all the submissions that the user submitted
-    submissions = Submission.objects.filter(authors=dashboard_user) \
-        .filter(milestone__duedate__lt=datetime.datetime.now()) \
-        .order_by('milestone__duedate')\
-        .filter(milestone__assignment__semester__is_current_semester=True)\
-        .select_related('chunk__file__assignment') \
-        .annotate(last_modified=Max('files__chunks__comments__modified'))\
-        .reverse()
+    submissions = [submission for submission in summary['submissions'] \
+        if submission.milestone.duedate is not None and submission.milestone.duedate < now]
+    submissions.sort(key=lambda submission: submission.milestone.duedate, reverse=True)
 
-    submission_data = collect_submission_data(submissions)
+    submission_data = collect_submission_data(submission for submission in submissions \
+        if submission.milestone.assignment.semester.is_current_semester)
 
     #get all the submissions that the user submitted, in previous semesters
-    old_submissions = Submission.objects.filter(authors=dashboard_user) \
-        .filter(milestone__duedate__lt=datetime.datetime.now()) \
-        .order_by('milestone__duedate')\
-        .exclude(milestone__assignment__semester__is_current_semester=True)\
-        .select_related('chunk__file__assignment') \
-        .annotate(last_modified=Max('files__chunks__comments__modified'))\
-        .reverse()
-
-    old_submission_data = collect_submission_data(old_submissions)
+    old_submission_data = collect_submission_data(submission for submission in submissions \
+        if not submission.milestone.assignment.semester.is_current_semester)
 
     #find the current submissions
-    current_milestones = SubmitMilestone.objects.filter(assignment__semester__members__user=dashboard_user, assignment__semester__members__role=Member.STUDENT)\
-        .filter(assigned_date__lt= datetime.datetime.now())\
-        .order_by('duedate')
+    milestone_data, current_slack_data = summary['milestones']
 
     current_milestone_data = []
-    for milestone in current_milestones:
-        try:
-            user_extension = milestone.extensions.get(user=dashboard_user)
-            extension_days = user_extension.slack_used
-        except ObjectDoesNotExist:
-            user_extension = None
-            extension_days = 0
-        if datetime.datetime.now() <= milestone.duedate + datetime.timedelta(days=extension_days) + datetime.timedelta(hours=2):
+    for milestone, user_extension in milestone_data:
+        if milestone.assigned_date is None or milestone.assigned_date >= now:
+            continue
+        extension_days = user_extension.slack_used or 0 if user_extension else 0
+        if now <= milestone.duedate + datetime.timedelta(days=extension_days) + datetime.timedelta(hours=2):
             current_milestone_data.append((milestone, user_extension))
 
-    #find total slack days left for each membership
-    current_memberships = Member.objects.filter(user=dashboard_user, role=Member.STUDENT).select_related('semester__subject')
-
-    current_slack_data = []
-    for membership in current_memberships:
-        total_slack = membership.slack_budget
-        if total_slack > 0:
-            used_slack = sum([extension.slack_used for extension in Extension.objects.filter(user=dashboard_user, milestone__assignment__semester=membership.semester)])
-            slack_left = total_slack - used_slack
-            current_slack_data.append((membership.semester, slack_left))
-
     return render(request, 'dashboard/dashboard.html', {
         'active_tasks': active_tasks,
         'completed_tasks': completed_tasks,
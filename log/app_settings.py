@@ -0,0 +1,12 @@
+from django.conf import settings
+
+# log entries are written in batches: a process writes its buffered entries
+# once it holds this many of them...
+BUFFER_SIZE = getattr(settings, 'LOG_BUFFER_SIZE', 100)
+
+# ...or once the oldest of them is this many seconds old
+FLUSH_INTERVAL = getattr(settings, 'LOG_FLUSH_INTERVAL', 5)
+
+# if writing fails, entries are kept for the next flush up to this many;
+# the oldest are dropped beyond it
+BUFFER_LIMIT = getattr(settings, 'LOG_BUFFER_LIMIT', 1000)
@@ -0,0 +1,73 @@
+"""
+Buffers Log entries in memory and writes them with bulk_create, instead of
+one INSERT per logged event.
+
+Each process keeps its own buffer. It is written once it holds BUFFER_SIZE
+entries, FLUSH_INTERVAL seconds after its oldest entry was added, and when
+the process exits. A process that dies without exiting cleanly loses at
+most the entries of the last FLUSH_INTERVAL seconds, and never more than
+BUFFER_LIMIT of them.
+"""
+import atexit
+import datetime
+import logging
+import threading
+
+from django.db import connection
+
+from log.models import Log
+import app_settings
+
+logger = logging.getLogger(__name__)
+
+_entries = []
+_lock = threading.Lock()
+_timer = None
+
+def write(user, text, timestamp=None):
+    """Adds an entry to the buffer, flushing it if it is full."""
+    global _timer
+    if timestamp is None:
+        timestamp = datetime.datetime.now()
+    with _lock:
+        _entries.append(Log(user=user, log=text, timestamp=timestamp))
+        full = len(_entries) >= app_settings.BUFFER_SIZE
+        if not full and _timer is None:
+            _timer = threading.Timer(app_settings.FLUSH_INTERVAL, _flush_from_timer)
+            _timer.daemon = True
+            _timer.start()
+    if full:
+        flush()
+
+def flush():
+    """Writes the buffered entries. Returns how many were written."""
+    global _timer
+    with _lock:
+        entries = _entries[:]
+        del _entries[:]
+        if _timer is not None:
+            _timer.cancel()
+            _timer = None
+    if not entries:
+        return 0
+    try:
+        Log.objects.bulk_create(entries)
+    except Exception:
+        logger.exception('Could not write %d log entries' % len(entries))
+        with _lock:
+            _entries[0:0] = entries
+            dropped = len(_entries) - app_settings.BUFFER_LIMIT
+            if dropped > 0:
+                logger.error('Dropping %d log entries' % dropped)
+                del _entries[:dropped]
+        return 0
+    return len(entries)
+
+def _flush_from_timer():
+    try:
+        flush()
+    finally:
+        # the timer's thread has a database connection of its own
+        connection.close()
+
+atexit.register(flush)
@@ -4,4 +4,9 @@ from django.contrib.auth.models import User
 class Log(models.Model):
     user = models.ForeignKey(User)
     log = models.TextField()
-    timestamp = models.DateTimeField()
\ No newline at end of file
+    timestamp = models.DateTimeField()
+
+    class Meta:
+        # scripts/codeSearch/commentSearchAnalysis.py pages through the log
+        # in this order
+        index_together = [['user', 'timestamp', 'id']]
@@ -5,8 +5,12 @@ when you run "manage.py test".
 Replace this with more appropriate tests for your application.
 """
 
+from django.contrib.auth.models import User
 from django.test import TestCase
 
+from log import app_settings, buffer
+from log.models import Log
+
 
 class SimpleTest(TestCase):
     def test_basic_addition(self):
@@ -14,3 +18,26 @@ class SimpleTest(TestCase):
         Tests that 1 + 1 always equals 2.
         """
         self.assertEqual(1 + 1, 2)
+
+
+class LogBufferTest(TestCase):
+    def test_flushes_when_full(self):
+        """
+        Tests that buffered entries are written together once the buffer is
+        full, and that flush() writes the rest.
+        """
+        user = User.objects.create(username='reviewer')
+        size = app_settings.BUFFER_SIZE
+        app_settings.BUFFER_SIZE = 3
+        try:
+            buffer.write(user, 'one')
+            buffer.write(user, 'two')
+            self.assertEqual(Log.objects.count(), 0)
+            buffer.write(user, 'three')
+            self.assertEqual(list(Log.objects.order_by('id').values_list('log', flat=True)), ['one', 'two', 'three'])
+            buffer.write(user, 'four')
+            self.assertEqual(buffer.flush(), 1)
+            self.assertEqual(Log.objects.count(), 4)
+            self.assertEqual(buffer.flush(), 0)
+        finally:
+            app_settings.BUFFER_SIZE = size
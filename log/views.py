@@ -1,11 +1,9 @@
-import datetime
 from django.http import HttpResponse
 import json
 
-from log.models import Log
+from log import buffer
 
 def log(request):
     if request.is_ajax():
-      entry = Log(user=request.user, log=json.dumps(request.POST), timestamp=datetime.datetime.now())
-      entry.save()
+      buffer.write(request.user, json.dumps(request.POST))
     return HttpResponse()
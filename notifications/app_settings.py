@@ -0,0 +1,11 @@
+from django.conf import settings
+
+# notifications wait this many seconds before being emailed, so that a
+# burst of replies reaches the recipient as a single digest
+DIGEST_DELAY = getattr(settings, 'NOTIFICATIONS_DIGEST_DELAY', 60 * 15)
+
+# most notifications a single digest email lists
+DIGEST_LIMIT = getattr(settings, 'NOTIFICATIONS_DIGEST_LIMIT', 20)
+
+# digests sent over one SMTP connection before it is reopened
+BATCH_SIZE = getattr(settings, 'NOTIFICATIONS_BATCH_SIZE', 100)
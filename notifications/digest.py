@@ -0,0 +1,101 @@
+"""
+Emails queued notifications as per-recipient digests.
+
+Posting a comment only queues a Notification row (see models.py). Running
+send_digests, e.g. from scripts/sendNotifications.py, collects the unsent
+notifications of every recipient whose oldest one has waited DIGEST_DELAY
+seconds, renders one email per recipient and sends the emails over a
+shared SMTP connection, BATCH_SIZE at a time. A notification is marked as
+sent only once its email went out, so a failed run is retried by the next.
+"""
+import datetime
+import logging
+from collections import defaultdict
+
+from django.contrib.sites.models import Site
+from django.core import mail
+from django.template import Context, Template
+from django.template.loader import get_template
+
+from notifications.models import Notification
+import app_settings
+
+logger = logging.getLogger(__name__)
+
+NEW_REPLY_SUBJECT_TEMPLATE = Template(
+        "[{{ site.name }}] {{ comment.author.get_full_name|default:comment.author.username }} replied to your comment")
+
+DIGEST_SUBJECT_TEMPLATE = Template(
+        "[{{ site.name }}] {{ count }} new replies to your comments")
+
+def pending_notifications(now=None, delay=None):
+    """Returns {recipient: [notification, ...]} of the digests due now."""
+    if now is None:
+        now = datetime.datetime.now()
+    if delay is None:
+        delay = app_settings.DIGEST_DELAY
+    pending = Notification.objects.filter(email_sent=False).exclude(recipient__email='')
+    due = pending.filter(created__lte=now - datetime.timedelta(seconds=delay)) \
+            .values_list('recipient', flat=True).distinct()
+    notifications = pending.filter(recipient__in=list(due)) \
+            .select_related('recipient', 'comment__author', 'comment__chunk__file') \
+            .order_by('recipient', 'created')
+    digests = defaultdict(list)
+    for notification in notifications:
+        digests[notification.recipient].append(notification)
+    return digests
+
+def render_digest(site, recipient, notifications):
+    """Returns the email for one recipient's notifications."""
+    more = max(0, len(notifications) - app_settings.DIGEST_LIMIT)
+    context = Context({
+        'site': site,
+        'recipient': recipient,
+        'notifications': notifications[:app_settings.DIGEST_LIMIT],
+        'count': len(notifications),
+        'more': more,
+        'comment': notifications[0].comment,
+        'chunk': notifications[0].comment.chunk,
+    })
+    if len(notifications) == 1:
+        subject = NEW_REPLY_SUBJECT_TEMPLATE.render(context)
+        template = 'notifications/new_reply'
+    else:
+        subject = DIGEST_SUBJECT_TEMPLATE.render(context)
+        template = 'notifications/digest'
+    message = mail.EmailMultiAlternatives(subject.strip(),
+            get_template(template + '.txt').render(context), to=[recipient.email])
+    message.attach_alternative(get_template(template + '.html').render(context), 'text/html')
+    return message
+
+def send_digests(now=None, delay=None):
+    """Sends the digests that are due. Returns how many were sent."""
+    digests = pending_notifications(now, delay)
+    if not digests:
+        return 0
+    site = Site.objects.get_current()
+    recipients = digests.keys()
+    sent = 0
+    for i in xrange(0, len(recipients), app_settings.BATCH_SIZE):
+        connection = mail.get_connection()
+        connection.open()
+        try:
+            for recipient in recipients[i:i + app_settings.BATCH_SIZE]:
+                notifications = digests[recipient]
+                for notification in notifications:
+                    if notification.submission_id is None:
+                        notification.submission_id = notification.comment.chunk.file.submission_id
+                try:
+                    connection.send_messages([render_digest(site, recipient, notifications)])
+                except Exception:
+                    logger.exception('Could not email notifications to %s' % recipient.username)
+                    continue
+                by_submission = defaultdict(list)
+                for notification in notifications:
+                    by_submission[notification.submission_id].append(notification.id)
+                for submission_id, ids in by_submission.iteritems():
+                    Notification.objects.filter(id__in=ids).update(email_sent=True, submission=submission_id)
+                sent += 1
+        finally:
+            connection.close()
+    return sent
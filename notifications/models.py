@@ -1,21 +1,10 @@
-from django.template import Context, Template
-from django.template.loader import get_template
 from django.db import models
 from django.db.models.signals import post_save
 from django.dispatch import receiver
-from django.contrib.sites.models import Site
 from django.contrib.auth.models import User
-from django.contrib.contenttypes import generic
-from django.contrib.contenttypes.models import ContentType
-from django.db.models.signals import post_save, post_delete
-from django.dispatch import receiver
-
-from email_templates import send_templated_mail
 
-from review.models import Comment, Vote
+from review.models import Comment
 from chunks.models import Submission
-import datetime
-import sys
 
 
 class Notification(models.Model):
@@ -33,64 +22,27 @@ class Notification(models.Model):
     recipient = models.ForeignKey(User, related_name='notifications')
     reason = models.CharField(max_length=1, blank=True, choices=REASON_CHOICES)
     created = models.DateTimeField(auto_now_add=True)
-    email_sent = models.BooleanField(default=False)
+    email_sent = models.BooleanField(default=False, db_index=True)
 
     class Meta:
         ordering = [ '-created' ]
 
 
-NEW_SUBMISSION_COMMENT_SUBJECT_TEMPLATE = Template(
-        "[{{ site.name }}] {{ comment.author.get_full_name|default:comment.author.username }} commented on your code")
-
-NEW_REPLY_SUBJECT_TEMPLATE = Template(
-        "[{{ site.name }}] {{ comment.author.get_full_name|default:comment.author.username }} replied to your comment")
-
-
 @receiver(post_save, sender=Comment)
-def send_comment_notification(sender, instance, created=False, raw=False, **kwargs):
-    if created and not raw:
-        site = Site.objects.get_current()
-        context = Context({
-            'site': site,
-            'comment': instance,
-            'chunk': instance.chunk
-        })
-        #comment gets a reply, the reply is not by the original author
-        if instance.parent and instance.parent.author.email \
-                and instance.parent.author != instance.author:
-            to = instance.parent.author.email
-            subject = NEW_REPLY_SUBJECT_TEMPLATE.render(context)
-            notification = Notification(recipient = instance.parent.author, reason='R')
-            notification.submission = instance.chunk.file.submission
-            notification.comment = instance
-            notification.save()
-
-            #sent = send_templated_mail(
-            #    subject, None, (to,), 'new_reply',
-            #    context, template_prefix='notifications/')
-            #notification.email_sent = sent
-            #notification.save()
-            return
-
-        return # NOTE(TFK): The code below is broken since submissions can have multiple authors.
-        submission_author = instance.chunk.file.submission.author
-        submission = instance.chunk.file.submission
-        #comment gets made on a submission after code review deadline has passed
-        if submission_author and submission_author.email \
-                and instance.author != submission_author\
-                and instance.author.username != "checkstyle" \
-                and datetime.datetime.now() > submission.code_review_end_date():
-            to = submission_author.email
-            subject = NEW_SUBMISSION_COMMENT_SUBJECT_TEMPLATE.render(context)
-            notification = Notification(recipient = submission_author, reason='C')
-            notification.submission = instance.chunk.file.submission
-            notification.comment = instance
-            notification.save()
-
-            #sent = send_templated_mail(
-             #       subject, None, (to,), 'new_submission_comment',
-              #      context, template_prefix='notifications/')
-           # notification.email_sent = sent
-            #notification.save()
-    pass
-
+def queue_comment_notification(sender, instance, created=False, raw=False, **kwargs):
+    """
+    Queues a notification for the author of the comment being replied to.
+    This runs while the comment is posted, so it only writes the row; the
+    email goes out with the recipient's next digest (see digest.py).
+    """
+    if not created or raw or not instance.parent_id:
+        return
+    parent_authors = Comment.objects.filter(id=instance.parent_id).values_list('author', 'author__email')
+    # authors without an email address can't get a digest
+    if parent_authors and parent_authors[0][0] != instance.author_id and parent_authors[0][1]:
+        Notification.objects.create(recipient_id=parent_authors[0][0],
+                comment=instance, reason=Notification.RECEIVED_REPLY)
+
+    # NOTE(TFK): Notifying the authors of a submission about comments made
+    # after the code review deadline was never finished, since submissions
+    # can have multiple authors.
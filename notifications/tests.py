@@ -5,8 +5,15 @@ when you run "manage.py test".
 Replace this with more appropriate tests for your application.
 """
 
+from django.contrib.auth.models import User
+from django.core import mail
 from django.test import TestCase
 
+from chunks.testing import CourseTestCase
+from notifications.digest import send_digests
+from notifications.models import Notification
+from review.models import Comment
+
 
 class SimpleTest(TestCase):
     def test_basic_addition(self):
@@ -14,3 +21,38 @@ class SimpleTest(TestCase):
         Tests that 1 + 1 always equals 2.
         """
         self.assertEqual(1 + 1, 2)
+
+
+class DigestTest(CourseTestCase):
+    def test_replies_are_sent_as_one_digest(self):
+        """
+        Tests that replies only queue notifications, and that a recipient's
+        pending notifications are emailed together once they are due.
+        """
+        submission = self.create_submission()
+        chunk = self.create_chunk(submission)
+        reviewer = User.objects.create(username='reviewer', email='reviewer@example.com')
+        replier = User.objects.create(username='replier', email='replier@example.com')
+        no_email = User.objects.create(username='no_email')
+
+        def comment(author, text, parent=None):
+            c = Comment(chunk=chunk, author=author, text=text, start=1, end=1, parent=parent)
+            c.save()
+            return c
+        root = comment(reviewer, 'Needs a spec')
+        comment(replier, 'Which method?', root)
+        comment(replier, 'Found it, thanks', root)
+        comment(reviewer, 'The constructor', root)
+        comment(replier, 'Not emailed', comment(no_email, 'Hmm'))
+        self.assertEqual(Notification.objects.filter(recipient=reviewer, email_sent=False).count(), 2)
+        self.assertEqual(Notification.objects.filter(recipient__in=[replier, no_email]).count(), 0)
+
+        self.assertEqual(send_digests(), 0)
+        self.assertEqual(send_digests(delay=0), 1)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['reviewer@example.com'])
+        self.assertTrue('2 new replies' in mail.outbox[0].subject)
+        self.assertTrue('Which method?' in mail.outbox[0].body and 'Found it, thanks' in mail.outbox[0].body)
+        self.assertTrue('/chunks/view/%s' % chunk.id in mail.outbox[0].alternatives[0][0])
+        self.assertEqual(Notification.objects.filter(email_sent=True, submission=submission).count(), 2)
+        self.assertEqual(send_digests(delay=0), 0)
@@ -1,13 +1,21 @@
-from chunks.models import Submission, File, Chunk, Batch
+from chunks.models import Submission, File, Chunk, Batch, update_activity_counts
 from review.models import Comment
+from review.search import index_comments
 from django.contrib.auth.models import User
-from xml.dom.minidom import parseString
+from django.db import transaction
+from django.db.models import F
+from xml.etree.cElementTree import iterparse
+from multiprocessing.pool import ThreadPool
 from subprocess import Popen, PIPE
 from collections import defaultdict
+import os
 
 checkstyle_settings = {
     'settings': '/var/django/caesar/preprocessor/checks.xml',
     'jar': '/var/django/caesar/preprocessor/checkstyle-5.9-all.jar',
+    # JVM startup dominates the cost of checking a single file,
+    # so every java process checks this many files at once
+    'files_per_run': 50,
     }
 
 # ignored_warnings maps a class type (from the Chunk model)
@@ -18,63 +26,83 @@ ignored_warnings = defaultdict(set, {
                   'com.puppycrawl.tools.checkstyle.checks.coding.MagicNumberCheck' ])
 })
 
-def run_checkstyle(path):
+def run_checkstyle(paths):
+  """
+  Runs checkstyle over several files in one JVM and stream-parses its XML
+  report. Returns a dictionary mapping the real path of each file to a list
+  of (line, message, source) problems.
+  """
   proc = Popen([
     'java',
     '-jar', checkstyle_settings['jar'],
     '-c', checkstyle_settings['settings'],
-    '-f', 'xml',
-    path],
+    '-f', 'xml'] + list(paths),
     stdout=PIPE)
-  return proc.communicate()[0]
+  problems = defaultdict(list)
+  current_file = None
+  for event, elem in iterparse(proc.stdout, events=('start', 'end')):
+    if event == 'start':
+      if elem.tag == 'file':
+        current_file = os.path.realpath(elem.get('name'))
+      continue
+    if elem.tag == 'error' or elem.tag == 'warning':
+      problems[current_file].append((elem.get('line'), elem.get('message'), elem.get('source')))
+    elem.clear()
+  proc.wait()
+  return problems
 
 # This probably won't support multi-chunks per file properly
-def generate_comments(chunk, checkstyle_user, batch):
-  xml = run_checkstyle(chunk.file.path)
-  comment_nodes = find_comment_nodes(xml)
+def create_comments(chunk, problems, checkstyle_user, batch):
   ignored = 0
   comments = []
-  for node in comment_nodes:
-    if node.getAttribute('source') in ignored_warnings[chunk.class_type]:
+  for line, message, source in problems:
+    if source in ignored_warnings[chunk.class_type]:
       ignored += 1
     else:
       comments.append(Comment(
         type='S',
-        text=node.getAttribute('message'),
+        text=message,
         chunk=chunk,
         batch=batch,
         author=checkstyle_user,
-        start=node.getAttribute('line'),
-        end=node.getAttribute('line')))
+        start=line,
+        end=line))
   print "checkstyle: on", chunk.name, 'I made', len(comments), 'comments and ignored', ignored, 'minor problems'
   return comments
 
-def find_comment_nodes(xml):
-  dom = parseString(xml)
-
-  # Simple traversal of the DOM to find all errors.
-  # Maybe easier to search for error tag, but this is easier ATM
-  comment_nodes = []
-  to_traverse = [dom]
-  while to_traverse:
-    node = to_traverse.pop()
-    if node.nodeName == 'error' or node.nodeName == 'warning':
-      comment_nodes.append(node)
-    else:
-      to_traverse.extend(node.childNodes)
-  return comment_nodes
-
-def generate_checkstyle_comments(code_objects, save, batch):
+def generate_checkstyle_comments(code_objects, save, batch, jobs=None):
   
   checkstyle_user,created = User.objects.get_or_create(username='checkstyle')
 
-  i = 0
-  for (submission, files, chunks) in code_objects:
-    i += 1
-    print "%s: %s chunks for this submission." % (submission, len(chunks))
-    for chunk in chunks:
-      if chunk.student_lines == 0:
-        continue  # don't run checkstyle on code that student hasn't touched
-      comments = generate_comments(chunk, checkstyle_user, batch)
-      if save:
-        [comment.save() for comment in comments]
+  chunks = []
+  for (submission, files, submission_chunks) in code_objects:
+    print "%s: %s chunks for this submission." % (submission, len(submission_chunks))
+    # don't run checkstyle on code that student hasn't touched
+    chunks.extend([chunk for chunk in submission_chunks if chunk.student_lines != 0])
+
+  paths = sorted(set(chunk.file.path for chunk in chunks))
+  runs = [paths[i:i + checkstyle_settings['files_per_run']]
+      for i in range(0, len(paths), checkstyle_settings['files_per_run'])]
+  pool = ThreadPool(processes=jobs)
+  problems = {}
+  try:
+    for run_problems in pool.imap_unordered(run_checkstyle, runs):
+      problems.update(run_problems)
+  finally:
+    pool.close()
+    pool.join()
+
+  comments = []
+  for chunk in chunks:
+    chunk_problems = problems.get(os.path.realpath(chunk.file.path), [])
+    comments.extend(create_comments(chunk, chunk_problems, checkstyle_user, batch))
+
+  if save:
+    with transaction.commit_on_success():
+      Comment.objects.bulk_create(comments, batch_size=500)
+      # bulk_create skips Comment.save, which fills in thread_id
+      Comment.objects.filter(batch=batch, type='S', thread_id__isnull=True).update(thread_id=F('id'))
+      # and the signals that keep the comment counts and the search index
+      update_activity_counts(comment.chunk_id for comment in comments)
+      index_comments(Comment.objects.filter(batch=batch, type='S'))
+  return comments
@@ -1,7 +1,21 @@
-from chunks.models import Submission, File, Chunk, StaffMarker
+from chunks.models import Submission, File, Chunk, StaffMarker, StaffLineIndex
+from review.models import Comment
+from tasks.models import invalidate_routing_states
+from chunks.histograms import invalidate_histograms
 from django.contrib.auth.models import User
 
+from django.conf import settings
+from django.db import transaction
+from chunks.highlight import source_text
+
 import os
+import difflib
+import hashlib
+import pickle
+import stat
+import tempfile
+from collections import defaultdict
+from multiprocessing import Pool
 from diff_match_patch import diff_match_patch, patch_obj
 from crawler import crawl_submissions
 
@@ -9,16 +23,110 @@ from crawler import crawl_submissions
 failed_users = set()
 diff_object = diff_match_patch()
 
+class StaffFile(object):
+  """
+  One staff file, with every normalized (stripped) line hashed to a single
+  character so that student files can be aligned against it with a
+  line-mode diff.
+  """
+  # stands for every student line that doesn't appear in the staff file
+  UNKNOWN_LINE = u'\x00'
+
+  def __init__(self, data):
+    self.line_codes = {}
+    encoded = []
+    for line in data.split('\n'):
+      line = line.strip()
+      if line not in self.line_codes:
+        self.line_codes[line] = unichr(len(self.line_codes) + 1)
+      encoded.append(self.line_codes[line])
+    self.encoded = u''.join(encoded)
+
+  def encode(self, student_code):
+    return u''.join(self.line_codes.get(line.strip(), StaffFile.UNKNOWN_LINE) for line in student_code)
+
+class StaffCodeIndex(object):
+  """Maps the relative path of each staff file to its StaffFile."""
+  # bump this whenever StaffFile changes, to invalidate cached indexes
+  VERSION = 1
+
+  def __init__(self, fingerprint):
+    self.fingerprint = fingerprint
+    self.version = StaffCodeIndex.VERSION
+    self.files = {}
+
+  def __contains__(self, relative_path):
+    return relative_path in self.files
+
+  def __getitem__(self, relative_path):
+    return self.files[relative_path]
+
+  def __len__(self):
+    return len(self.files)
+
+  def keys(self):
+    return self.files.keys()
+
+# loading a pickle can run code, so the cached indexes are kept in a
+# directory that only the user running the preprocessor can write to
+STAFF_INDEX_CACHE_DIR = os.path.join(settings.PROJECT_ROOT, 'cache', 'staff-index')
+
+def staff_index_cache_path(staff_dir):
+  name = hashlib.sha1(os.path.abspath(staff_dir)).hexdigest()
+  return os.path.join(STAFF_INDEX_CACHE_DIR, 'staff-index-%s.pickle' % name)
+
+def _is_private(path):
+  info = os.stat(path)
+  return info.st_uid == os.getuid() and not info.st_mode & (stat.S_IWGRP | stat.S_IWOTH)
+
+def _private_cache_dir():
+  """Creates the index cache directory. Returns False if others can write to it."""
+  try:
+    if not os.path.isdir(STAFF_INDEX_CACHE_DIR):
+      os.makedirs(STAFF_INDEX_CACHE_DIR, 0700)
+    return _is_private(STAFF_INDEX_CACHE_DIR)
+  except OSError:
+    return False
+
 def parse_staff_code(staff_dir):
+  """
+  Builds the StaffCodeIndex for a directory of starting code. The index is
+  cached on disk and reused by later runs as long as none of the staff files
+  have changed.
+  """
   staff_files = crawl_submissions(staff_dir)
   num_subdirs = len(staff_dir.split('/'))
-  staff_code = {}
+  paths = {}
   for files in staff_files.values():
     for file_path in files:
       relative_path = '/'.join(file_path.split('/')[num_subdirs+1:])
-      staff_lines = open(file_path).read()
-      staff_code[relative_path] = set([line.strip() for line in staff_lines.split('\n')])
+      paths[relative_path] = file_path
+  fingerprint = sorted((relative_path, os.path.getsize(file_path), os.path.getmtime(file_path))
+      for relative_path, file_path in paths.iteritems())
 
+  cache_path = staff_index_cache_path(staff_dir)
+  use_cache = _private_cache_dir()
+  try:
+    if use_cache and _is_private(cache_path):
+      with open(cache_path, 'rb') as cache_file:
+        staff_code = pickle.load(cache_file)
+      if staff_code.version == StaffCodeIndex.VERSION and staff_code.fingerprint == fingerprint:
+        return staff_code
+  except Exception:
+    pass # no usable cached index
+
+  staff_code = StaffCodeIndex(fingerprint)
+  for relative_path, file_path in paths.iteritems():
+    staff_code.files[relative_path] = StaffFile(open(file_path).read())
+  if use_cache:
+    try:
+      # written next to its final name and renamed, so readers never see half a file
+      fd, temp_path = tempfile.mkstemp(dir=STAFF_INDEX_CACHE_DIR)
+      with os.fdopen(fd, 'wb') as cache_file:
+        pickle.dump(staff_code, cache_file, pickle.HIGHEST_PROTOCOL)
+      os.rename(temp_path, cache_path)
+    except (IOError, OSError):
+      pass
   return staff_code
 
 def get_type(file):
@@ -34,116 +142,334 @@ def get_name(file):
 def create_chunk(file):
   return Chunk(file=file, name=get_name(file), start=0, end=len(file.data), class_type=get_type(file), staff_portion=0, student_lines=0)
 
-def create_file(file_path, submission):
-  file_data = open(file_path).read()
-  return File(path=file_path, submission=submission, data=file_data)
-
 def split_into_usernames(folderName):
     return folderName.split("-")
 
-def parse_all_files(student_code, student_base_dir, batch, submit_milestone, save, staff_code, restricted):
-  code_objects = [
-     parse_student_files(split_into_usernames(rootFolderName),
-                         files,
-                         batch,
-                         submit_milestone,
-                         save,
-                         student_base_dir,
-                         staff_code,
-                         restricted)
-    for (rootFolderName, files) in student_code.iteritems()]
-  return [code_object for code_object in code_objects if code_object != None]
-
-def parse_student_files(usernames, files, batch, submit_milestone, save, student_base_dir, staff_code, restricted):
-  # staff_code is a dictionary from filename to staff code
-  # Trying to find the user(s) who wrote this submission. Bail if they don't all exist in the DB.
-  users = User.objects.filter(username__in=usernames)
-  
-  if users.count() != len(set(usernames)):
-    missing_users = set(usernames).difference([user.username for user in users])
-    for username in missing_users:
-      print "user %s doesn't exist in the database." % username
-    failed_users += missing_users
-    return None
-
-  submission_name = "-".join(usernames)
-  
-  # Shouldn't remake submissions
-  if Submission.objects.filter(milestone=submit_milestone, authors__in=users).count() > 0:
-    print "submission for %s already exists in the database." % submission_name
-    return None
+def find_staff_lines(student_code, staff_file):
+  """
+  Aligns the lines of a student file with the staff version using a
+  line-mode diff. Lines that the diff keeps equal are staff lines, and so
+  are blank lines; everything else was written by the student. Returns the
+  staff line intervals (0-based, inclusive) and the number of lines written
+  by the student.
+  """
+  diffs = diff_object.diff_main(staff_file.encoded, staff_file.encode(student_code), False)
 
-  # Creating the Submission object
-  submission = Submission(milestone=submit_milestone, name=submission_name, batch=batch)
-  if save:
-    submission.save()
-    for user in users:
-      submission.authors.add(user)
-    submission.save()
+  intervals = []
+  num_student_lines = 0
+  is_staff_line = False
+  line_start = 0
+  current_line = 0
+  for op, text in diffs:
+    if op == diff_match_patch.DIFF_DELETE:
+      continue # staff lines the student removed
+    for _ in text:
+      if op == diff_match_patch.DIFF_EQUAL or not student_code[current_line].strip():
+        if not is_staff_line:
+          line_start = current_line
+        is_staff_line = True
+      else:
+        num_student_lines += 1
+        if is_staff_line:
+          intervals.append((line_start, current_line - 1))
+        is_staff_line = False
+      current_line += 1
 
-  print submission
+  if is_staff_line:
+    intervals.append((line_start, current_line - 1))
+  return intervals, num_student_lines
 
-  file_objects = []
-  chunk_objects = []
+# set in each worker process by _init_worker
+_worker_settings = {}
 
-  # Creating the File objects
+def _init_worker(student_base_dir, staff_code):
+  _worker_settings['student_base_dir'] = student_base_dir
+  _worker_settings['staff_code'] = staff_code
+
+def read_submission(item):
+  """
+  Reads the files of one submission folder and diffs them against the staff
+  code. Runs in a worker process, so it must not touch the database.
+  Returns (folder name, [(file path, data, staff intervals, student lines)]).
+  """
+  root_folder_name, files = item
+  student_base_dir = _worker_settings['student_base_dir']
+  staff_code = _worker_settings['staff_code']
+  file_records = []
   for file_path in files:
-    file = create_file(file_path, submission)
-    if len(file.data) == 0:
+    file_data = open(file_path).read()
+    if len(file_data) == 0:
       continue # don't import empty files
 
-    file_objects.append(file)
-    if save:
-      file.save()
-
-    chunk = create_chunk(file)
-    chunk_objects.append(chunk)
-    if restricted: 
-      chunk.chunk_info = 'restricted'
-    if save:
-      chunk.save()
-
-    student_code = file.data.split('\n')
+    student_code = file_data.split('\n')
     num_student_lines = len(student_code)
-    
+    staff_lines = []
+
     if staff_code:
       # Assuming that the student's directory looks like student_base_dir + '/' + username + '/' + project_name_dir
       num_subdirs = len(student_base_dir.split('/')) + 1 # + 1 for student username
       relative_path = '/'.join(file_path.split('/')[num_subdirs:])
       #print "looking for student path " + relative_path
-      
+
       if relative_path in staff_code:
         # print "comparing with staff version of " + relative_path
-        num_student_lines = 0
-        staff_lines = []
-        is_staff_line = False
-        line_start = 0
-        current_line = 0
-        for line in student_code:
-          if line.strip() in staff_code[relative_path]:
-            if not is_staff_line:
-              line_start = current_line
-            is_staff_line = True
-          else:
-            num_student_lines += 1
-            if is_staff_line:
-              staff_lines.append((line_start, current_line - 1))
-            is_staff_line = False
-          current_line += 1
+        staff_lines, num_student_lines = find_staff_lines(student_code, staff_code[relative_path])
 
-        if is_staff_line:
-          staff_lines.append((line_start, current_line - 1))
+    # StaffLineIndex and StaffMarker use 1-based numbering
+    staff_lines = [(start+1, end+1) for start, end in staff_lines]
+    file_records.append((file_path, file_data, staff_lines, num_student_lines))
+  return (root_folder_name, file_records)
 
-        # print "staff lines = " + str(staff_lines)
-        if save:
-          for start, end in staff_lines:
-            sm = StaffMarker(chunk=chunk, start_line=start+1, end_line=end+1)  # StaffMarker uses 1-based numbering
-            sm.save()
-      
+def read_all_submissions(student_code, student_base_dir, staff_code, jobs=None):
+  """Reads and diffs every submission folder using a pool of worker processes."""
+  items = sorted(student_code.iteritems())
+  if jobs == 1:
+    _init_worker(student_base_dir, staff_code)
+    return map(read_submission, items)
+  pool = Pool(processes=jobs, initializer=_init_worker, initargs=(student_base_dir, staff_code))
+  try:
+    return pool.map(read_submission, items, chunksize=4)
+  finally:
+    pool.close()
+    pool.join()
+
+def create_file_objects(submission, file_records, restricted):
+  """Builds the unsaved Files and Chunks for the file records of a submission."""
+  file_objects = []
+  chunk_objects = []
+  for file_path, file_data, staff_lines, num_student_lines in file_records:
+    file = File(path=file_path, submission=submission, data=file_data)
+    file.staff_lines = StaffLineIndex(staff_lines).serialize()
+    file.staff_intervals = staff_lines
+    file_objects.append(file)
+
+    chunk = create_chunk(file)
+    if restricted: 
+      chunk.chunk_info = 'restricted'
     chunk.student_lines = num_student_lines
     if num_student_lines > 0:
       print str(chunk) + ": " + str(num_student_lines) + " new student lines"
+    chunk_objects.append(chunk)
+  return file_objects, chunk_objects
+
+def parse_all_files(student_code, student_base_dir, batch, submit_milestone, save, staff_code, restricted, jobs=None, update=False):
+  """
+  Loads the crawled submissions into Caesar. Files are read and compared
+  against the staff code in parallel, then all the Submissions, Files, Chunks
+  and StaffMarkers are written with a handful of bulk inserts in one
+  transaction. Returns a list of (submission, files, chunks).
+
+  Submissions that already exist are skipped, unless update is set: then
+  only their new and changed files are written (see update_submissions).
+  """
+  submission_records = read_all_submissions(student_code, student_base_dir, staff_code, jobs)
+
+  all_usernames = set()
+  for root_folder_name, file_records in submission_records:
+    all_usernames.update(split_into_usernames(root_folder_name))
+  users = dict((user.username, user) for user in User.objects.filter(username__in=all_usernames))
+  # Shouldn't remake submissions
+  existing_submissions = dict(Submission.authors.through.objects \
+      .filter(submission__milestone=submit_milestone, user__username__in=all_usernames) \
+      .values_list('user__username', 'submission'))
+  existing_authors = set(existing_submissions)
+
+  code_objects = []
+  updated_submissions = []
+  for root_folder_name, file_records in submission_records:
+    usernames = split_into_usernames(root_folder_name)
+    # Trying to find the user(s) who wrote this submission. Bail if they don't all exist in the DB.
+    missing_users = set(usernames).difference(users)
+    if missing_users:
+      for username in missing_users:
+        print "user %s doesn't exist in the database." % username
+      failed_users.update(missing_users)
+      continue
+
+    submission_name = "-".join(usernames)
+    if existing_authors.intersection(usernames):
+      author = existing_authors.intersection(usernames).pop()
+      if update and author in existing_submissions:
+        updated_submissions.append((existing_submissions[author], root_folder_name, file_records))
+      else:
+        print "submission for %s already exists in the database." % submission_name
+      continue
+
     if save:
-      chunk.save()
-    
-  return (submission, file_objects, chunk_objects)
+      existing_authors.update(usernames)
+
+    # Creating the Submission object
+    submission = Submission(milestone=submit_milestone, name=submission_name, batch=batch)
+    submission.authors_to_add = [users[username] for username in set(usernames)]
+    print submission
+
+    file_objects, chunk_objects = create_file_objects(submission, file_records, restricted)
+    code_objects.append((submission, file_objects, chunk_objects))
+
+  with transaction.commit_on_success():
+    if save:
+      save_code_objects(code_objects, batch)
+    if updated_submissions:
+      code_objects.extend(update_submissions(updated_submissions, save, restricted))
+  if save and code_objects:
+    invalidate_histograms(submit_milestone.id)
+  return code_objects
+
+def content_hash(data):
+  return hashlib.sha1(source_text(data).encode('utf-8')).hexdigest()
+
+def line_map(old_data, new_data):
+  """
+  Maps the line numbers of old_data onto new_data through a line diff.
+  Returns ({old line: new line}, set of old lines that were changed or
+  deleted). Changed lines map to the start of the code that replaced them.
+  """
+  old_lines = source_text(old_data).splitlines()
+  new_lines = source_text(new_data).splitlines()
+  mapping = {}
+  changed = set()
+  matcher = difflib.SequenceMatcher(None, old_lines, new_lines, autojunk=False)
+  for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+    for i in xrange(i1, i2):
+      if tag == 'equal':
+        mapping[i + 1] = j1 + (i - i1) + 1
+      else:
+        mapping[i + 1] = min(j1 + 1, max(len(new_lines), 1))
+        changed.add(i + 1)
+  return mapping, changed
+
+def remap_comments(comments, old_data, new_data):
+  """
+  Moves the comments' line ranges from old_data to the same code in
+  new_data. Comments on lines that were changed or deleted are marked
+  outdated, since the code they talk about is gone.
+  """
+  mapping, changed = line_map(old_data, new_data)
+  last_line = max(mapping.values() or [1])
+  for comment in comments:
+    lines = xrange(comment.start, max(comment.start, comment.end) + 1)
+    if any(line in changed or line not in mapping for line in lines):
+      comment.outdated = True
+    comment.start = mapping.get(comment.start, min(comment.start, last_line))
+    comment.end = max(comment.start, mapping.get(comment.end, min(comment.end, last_line)))
+
+def update_submissions(updated_submissions, save, restricted):
+  """
+  Compares the files of submissions that are already in the database with
+  their stored versions by content hash. New files get a File and a Chunk;
+  changed files are updated in place so that their chunks keep their
+  comments and tasks. Their old checkstyle comments are dropped, since they
+  point at stale lines, and the other comments are moved to the lines of
+  the new version through a line diff (see remap_comments). Unchanged files
+  are not touched. Returns (submission, files, chunks) for just the new and
+  changed files.
+  """
+  submission_ids = [submission_id for (submission_id, root_folder_name, file_records) in updated_submissions]
+  submissions = Submission.objects.in_bulk(submission_ids)
+  stored_files = defaultdict(dict)
+  for file_id, submission_id, path, data in File.objects.filter(submission__in=submission_ids) \
+      .values_list('id', 'submission', 'path', 'data'):
+    stored_files[submission_id][path] = (file_id, content_hash(data))
+
+  def relative_path(path, root_folder_name):
+    # the import directory may have moved since the last run
+    marker = '/' + root_folder_name + '/'
+    return path.split(marker, 1)[-1] if marker in path else path
+
+  code_objects = []
+  for submission_id, root_folder_name, file_records in updated_submissions:
+    submission = submissions[submission_id]
+    stored = dict((relative_path(path, root_folder_name), value)
+        for path, value in stored_files[submission_id].iteritems())
+    new_records = []
+    changed_records = []
+    for record in file_records:
+      file_path, file_data = record[0], record[1]
+      key = relative_path(file_path, root_folder_name)
+      if key not in stored:
+        new_records.append(record)
+      elif stored[key][1] != content_hash(file_data):
+        changed_records.append((stored[key][0], record))
+    if not new_records and not changed_records:
+      continue
+    print "%s: %s new and %s changed files" % (submission, len(new_records), len(changed_records))
+
+    file_objects, chunk_objects = create_file_objects(submission, new_records, restricted)
+    if save:
+      for file, chunk in zip(file_objects, chunk_objects):
+        file.save()
+        chunk.file = file
+        chunk.save()
+        StaffMarker.objects.bulk_create([StaffMarker(chunk=chunk, start_line=start, end_line=end)
+            for start, end in file.staff_intervals])
+
+    for file_id, (file_path, file_data, staff_lines, num_student_lines) in changed_records:
+      file = File.objects.get(id=file_id)
+      old_data = file.data
+      file.data = file_data
+      file.staff_lines = StaffLineIndex(staff_lines).serialize()
+      file_objects.append(file)
+      for chunk in file.chunks.filter(start=0):
+        chunk.file = file
+        chunk.end = len(file_data)
+        chunk.student_lines = num_student_lines
+        print str(chunk) + ": changed, " + str(num_student_lines) + " student lines"
+        chunk_objects.append(chunk)
+        if save:
+          Chunk.objects.filter(id=chunk.id).update(end=chunk.end, student_lines=chunk.student_lines)
+          chunk.staffmarkers.all().delete()
+          StaffMarker.objects.bulk_create([StaffMarker(chunk=chunk, start_line=start, end_line=end)
+              for start, end in staff_lines])
+          Comment.objects.filter(chunk=chunk, type='S').delete()
+          comments = list(Comment.objects.filter(chunk=chunk).only('id', 'start', 'end', 'outdated'))
+          remap_comments(comments, old_data, file_data)
+          for comment in comments:
+            Comment.objects.filter(id=comment.id).update(start=comment.start, end=comment.end,
+                outdated=comment.outdated)
+      if save:
+        File.objects.filter(id=file_id).update(data=file.data, staff_lines=file.staff_lines)
+    code_objects.append((submission, file_objects, chunk_objects))
+  if save and code_objects:
+    # the student lines of existing chunks changed behind the routing graphs
+    invalidate_routing_states()
+  return code_objects
+
+def save_code_objects(code_objects, batch):
+  """
+  Bulk inserts the submissions, files, chunks and staff markers of a batch.
+  bulk_create doesn't hand back primary keys, so after each level the new
+  ids are read back through the batch and set on the objects.
+  """
+  Submission.objects.bulk_create([submission for (submission, files, chunks) in code_objects])
+  submission_ids = dict(Submission.objects.filter(batch=batch).values_list('name', 'id'))
+  authors = []
+  for submission, files, chunks in code_objects:
+    submission.id = submission_ids[submission.name]
+    for user in submission.authors_to_add:
+      authors.append(Submission.authors.through(submission_id=submission.id, user_id=user.id))
+    for file in files:
+      file.submission_id = submission.id
+  Submission.authors.through.objects.bulk_create(authors)
+
+  all_files = [file for (submission, files, chunks) in code_objects for file in files]
+  File.objects.bulk_create(all_files, batch_size=100)
+  file_ids = dict(((submission_id, path), id) for (submission_id, path, id) in
+      File.objects.filter(submission__batch=batch).values_list('submission', 'path', 'id'))
+  for file in all_files:
+    file.id = file_ids[(file.submission_id, file.path)]
+
+  all_chunks = []
+  for submission, files, chunks in code_objects:
+    for file, chunk in zip(files, chunks):
+      chunk.file_id = file.id
+      all_chunks.append(chunk)
+  Chunk.objects.bulk_create(all_chunks, batch_size=500)
+  chunk_ids = dict(Chunk.objects.filter(file__submission__batch=batch).values_list('file', 'id'))
+
+  markers = []
+  for submission, files, chunks in code_objects:
+    for file, chunk in zip(files, chunks):
+      chunk.id = chunk_ids[file.id]
+      for start, end in file.staff_intervals:
+        markers.append(StaffMarker(chunk_id=chunk.id, start_line=start, end_line=end))
+  StaffMarker.objects.bulk_create(markers, batch_size=500)
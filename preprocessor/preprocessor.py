@@ -12,6 +12,9 @@ import time
 
 # Django imports
 from chunks.models import Assignment, Submission, File, Chunk, Batch, SubmitMilestone
+from chunks.highlight import prime_highlight_cache
+from utils.cache import cull_caches
+from chunks.clustering import cluster_milestone
 from django.db import transaction
 
 # Preprocessor imports
@@ -47,6 +50,14 @@ parser.add_argument('--submissions',
 parser.add_argument('--restrict',
                     action="store_true",
                     help="Restrict who can view the students' chunks to the student authors and any assigned reviewers")
+parser.add_argument('--jobs',
+                    metavar="N",
+                    type=int,
+                    default=None,
+                    help="number of worker processes used to read and diff the students' files. Defaults to the number of CPUs.")
+parser.add_argument('--update',
+                    action="store_true",
+                    help="Re-import submissions that are already loaded: add their new files and update changed ones in place, keeping existing comments and tasks")
 
 args = parser.parse_args()
 #print args
@@ -64,10 +75,8 @@ settings = {
 
 starting_time = time.time()
 
-# TODO(mglidden)
-# Placing the entire preprocessor in a transaction might slow down the database during
-# load time, but it will automatically roll back the changes if there's an exception.
-# with transaction.commit_on_success():
+# parse_all_files writes all submissions, files and chunks in a single
+# transaction, so a failed load doesn't leave half a batch behind.
 
 # Finding the submit milestone object
 submit_milestone = SubmitMilestone.objects.get(id=settings['submit_milestone_id'])
@@ -84,7 +93,7 @@ if settings['save_data']:
 # Crawling the file system.
 student_code = crawl_submissions(settings['student_submission_dir'])
 
-code_objects = parse_all_files(student_code, settings['student_submission_dir'], batch, submit_milestone, settings['save_data'], staff_code, args.restrict)
+code_objects = parse_all_files(student_code, settings['student_submission_dir'], batch, submit_milestone, settings['save_data'], staff_code, args.restrict, args.jobs, args.update)
 
 if parse.failed_users:
   print "To add the missing users to Caesar, use scripts/addMembers.py to add the following list of users:"
@@ -93,6 +102,13 @@ if parse.failed_users:
 
 print "Found %s submissions." % (len(code_objects))
 
+if settings['save_data']:
+  print "Highlighting files..."
+  prime_highlight_cache([file for (submission, files, chunks) in code_objects for file in files])
+  cull_caches()
+  print "Clustering similar chunks..."
+  print "Found %s clusters." % (cluster_milestone(submit_milestone))
+
 if settings['generate_comments']:
   print "Generating checkstyle comments..."
-  generate_checkstyle_comments(code_objects, settings['save_data'], batch)
+  generate_checkstyle_comments(code_objects, settings['save_data'], batch, args.jobs)
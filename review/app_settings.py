@@ -0,0 +1,10 @@
+from django.conf import settings
+
+# alias in settings.CACHES that stores the ranked comment ids of each
+# suggestion list, so that its pages don't rank the comments again
+SUGGESTIONS_CACHE = getattr(settings, 'REVIEW_SUGGESTIONS_CACHE', 'default')
+
+# lists of changed comments are never looked up again, this only bounds how
+# long they are kept
+SUGGESTIONS_CACHE_TIMEOUT = getattr(
+        settings, 'REVIEW_SUGGESTIONS_CACHE_TIMEOUT', 60 * 60)
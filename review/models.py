@@ -2,12 +2,12 @@ from django.contrib.auth.models import User
 from django.db import models
 from django.db.models import Count
 from django.db.models.signals import pre_save, post_save,\
-        pre_delete, post_delete
+        pre_delete, post_delete, post_init
 from django.dispatch import receiver
 from django.conf import settings
 
 from accounts.models import UserProfile
-from chunks.models import Chunk, Batch
+from chunks.models import Chunk, Batch, Semester, count_activity, update_activity_counts
 
 import sys
 
@@ -37,14 +37,21 @@ class Comment(models.Model):
     deleted = models.BooleanField(default=False)
     batch = models.ForeignKey(Batch, blank=True, null=True, related_name='comments')
     similar_comment = models.ForeignKey('self', related_name='similar_comments', blank=True, null=True)
+    # set when the code under the comment was changed by a later import
+    outdated = models.BooleanField(default=False)
 
     def __unicode__(self):
         return self.text
 
     def save(self, *args, **kwargs):
+        if self.parent_id:
+            self.thread_id = self.parent_id
         super(Comment, self).save(*args, **kwargs)
-        self.thread_id = self.parent_id or self.id
-        super(Comment, self).save(*args, **kwargs)
+        if self.thread_id is None:
+            # a root comment is its own thread, which takes its new id; this
+            # is written directly so that the save signals only run once
+            self.thread_id = self.id
+            Comment.objects.filter(id=self.id).update(thread_id=self.id)
 
     #returns child and vote counts for child as a tuple
     def get_child_comment_vote(self):
@@ -77,6 +84,23 @@ class Comment(models.Model):
     class Meta:
         ordering = [ 'start', '-end', 'thread_id', 'created' ]
 
+class CommentTerm(models.Model):
+    """
+    One row of the inverted index over comment text used by comment search:
+    a word or #hashtag of a comment and how often it occurs. The comment's
+    semester is copied here so searches don't have to join through chunks.
+    See review.search. On MySQL, term has a binary collation (migration
+    0008), since utf8_general_ci takes a word and its accented spelling for
+    the same term, which would break the unique constraint.
+    """
+    comment = models.ForeignKey(Comment, related_name='terms')
+    term = models.CharField(max_length=64, db_index=True)
+    count = models.IntegerField(default=1)
+    semester = models.ForeignKey(Semester, blank=True, null=True, related_name='+')
+
+    class Meta:
+        unique_together = ('term', 'comment',)
+
 class Vote(models.Model):
     VALUE_CHOICES = (
         (1, '+1'),
@@ -129,12 +153,51 @@ def denormalize_votes(sender, instance, created=False, **kwargs):
         comment = instance.comment
         comment.upvote_count = comment.votes.filter(value=1).count()
         comment.downvote_count = comment.votes.filter(value=-1).count()
-        comment.save()
+        # a vote doesn't change the comment, so skip its save signals
+        Comment.objects.filter(id=comment.id).update(upvote_count=comment.upvote_count,
+                downvote_count=comment.downvote_count)
     except Comment.DoesNotExist:
         # vote is getting deleted from a comment delete cascade, do nothing
         pass
 
 
+@receiver(post_save, sender=Comment)
+def denormalize_comments(sender, instance, created=False, raw=False, **kwargs):
+    """This keeps the comment counts of the chunk and its submission up to date"""
+    if not raw:
+        added = 1 if created else 0
+        if instance.type == 'U':
+            count_activity(instance.chunk_id, user_comments=added, comment_modified=instance.modified)
+        elif instance.type == 'S':
+            count_activity(instance.chunk_id, static_comments=added, comment_modified=instance.modified)
+        else:
+            count_activity(instance.chunk_id, test_comments=added, comment_modified=instance.modified)
+
+
+@receiver(post_delete, sender=Comment)
+def recount_comments_on_delete(sender, instance, **kwargs):
+    """The deleted comment may have been the latest one, so count again"""
+    update_activity_counts([instance.chunk_id])
+
+
+@receiver(post_init, sender=Comment)
+def remember_indexed_text(sender, instance, **kwargs):
+    # what the index holds for a comment loaded from the database
+    if instance.id is not None:
+        instance._indexed_state = (instance.text, instance.deleted)
+
+
+@receiver(post_save, sender=Comment)
+def index_comment_on_save(sender, instance, raw=False, **kwargs):
+    """This keeps the comment search index up to date"""
+    # index rows are removed along with the comment by the cascade
+    state = (instance.text, instance.deleted)
+    if not raw and getattr(instance, '_indexed_state', None) != state:
+        from review.search import index_comments
+        index_comments([instance])
+        instance._indexed_state = state
+
+
 class Star(models.Model):
     value = models.BooleanField(default=False)
     chunk = models.ForeignKey(Chunk, related_name="stars")
@@ -0,0 +1,105 @@
+"""
+Comment search over an inverted index of comment words and #hashtags.
+
+Each comment's text is split into lowercase terms that are stored as
+CommentTerm rows, one per distinct term, when the comment is saved. A
+search looks up the rows of the query's terms through the index on term,
+keeps the comments that have all of them and ranks them by how often the
+terms occur, so its cost follows the number of matches rather than the
+number of comments.
+"""
+import re
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count, Sum
+
+from chunks.models import Chunk
+from models import Comment, CommentTerm
+
+# hashtags name wiki articles, whose slugs may contain hyphens
+TERM_RE = re.compile(r'#\w+(?:-\w+)*|\w+', re.UNICODE)
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+MAX_TERM_LENGTH = CommentTerm._meta.get_field('term').max_length
+
+def tokenize(text):
+    """Returns {term: count} for the words and #hashtags of the text."""
+    counts = defaultdict(int)
+    for term in TERM_RE.findall(text.lower()):
+        counts[term[:MAX_TERM_LENGTH]] += 1
+        if term.startswith('#'):
+            # hashtags can be found by their plain words too
+            for word in WORD_RE.findall(term):
+                counts[word[:MAX_TERM_LENGTH]] += 1
+    return counts
+
+def index_comments(comments):
+    """
+    (Re)builds the index rows of the given comments. Deleted comments are
+    left out of the index. Code that bulk creates comments has to call this
+    itself, since bulk_create doesn't send post_save.
+    """
+    comments = list(comments)
+    if not comments:
+        return
+    chunk_ids = set(comment.chunk_id for comment in comments)
+    semesters = dict(Chunk.objects.filter(id__in=chunk_ids) \
+            .values_list('id', 'file__submission__milestone__assignment__semester'))
+    rows = []
+    for comment in comments:
+        if comment.deleted:
+            continue
+        for term, count in tokenize(comment.text).iteritems():
+            rows.append(CommentTerm(comment_id=comment.id, term=term, count=count,
+                semester_id=semesters.get(comment.chunk_id)))
+    with transaction.commit_on_success():
+        CommentTerm.objects.filter(comment__in=[comment.id for comment in comments]).delete()
+        CommentTerm.objects.bulk_create(rows, batch_size=500)
+
+def rebuild_index(comments=None, batch_size=1000):
+    """Reindexes all comments, or the given queryset of them, in batches."""
+    if comments is None:
+        comments = Comment.objects.all()
+    comment_ids = list(comments.values_list('id', flat=True))
+    for i in xrange(0, len(comment_ids), batch_size):
+        index_comments(Comment.objects.filter(id__in=comment_ids[i:i + batch_size]) \
+                .only('id', 'text', 'chunk', 'deleted'))
+    return len(comment_ids)
+
+def _matches(terms, current_semester_only):
+    rows = CommentTerm.objects.filter(term__in=terms)
+    if current_semester_only:
+        rows = rows.filter(semester__is_current_semester=True)
+    return rows.values('comment') \
+            .annotate(matched=Count('term'), score=Sum('count')) \
+            .filter(matched=len(terms))
+
+class SearchResults(object):
+    """
+    The comments that contain every term of a query, best matches first.
+    Counting runs one aggregate query and page() loads one page of comments.
+    """
+    def __init__(self, query, current_semester_only=True):
+        self.terms = sorted(tokenize(query))
+        self.current_semester_only = current_semester_only
+
+    def count(self):
+        if not self.terms:
+            return 0
+        return _matches(self.terms, self.current_semester_only).count()
+
+    def page(self, number, per_page=15):
+        """Returns the comments of the given 1-based page, in rank order."""
+        if not self.terms:
+            return []
+        start = (number - 1) * per_page
+        rows = _matches(self.terms, self.current_semester_only) \
+                .order_by('-score', '-comment')[start:start + per_page]
+        ranked = [row['comment'] for row in rows]
+        comments = Comment.objects.select_related('chunk').in_bulk(ranked)
+        return [comments[comment_id] for comment_id in ranked if comment_id in comments]
+
+def hashtag_comments(slug):
+    """Returns the CommentTerm rows of a wiki #hashtag, for counting its uses."""
+    return CommentTerm.objects.filter(term=u'#' + slug.lower()[:MAX_TERM_LENGTH - 1])
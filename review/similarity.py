@@ -0,0 +1,157 @@
+"""
+Finds earlier comments that a new comment reuses text from.
+
+A comment counts as similar to another when the two share a run of more
+than MIN_OVERLAP characters. Candidates come from an in-memory index of
+winnowed character n-gram fingerprints (Schleimer et al., "Winnowing: Local
+Algorithms for Document Fingerprinting"): with n-grams of GRAM_LENGTH and
+windows of WINDOW hashes, any shared run of GRAM_LENGTH + WINDOW - 1
+characters is guaranteed to share a fingerprint. Candidates are then
+checked exactly by intersecting their sets of (MIN_OVERLAP + 1)-grams,
+which is linear in the length of the texts.
+
+There is one index per semester, holding the comments written by the
+semester's staff on any of its subject's code. It lives in the server
+process and catches up with new and edited comments on each lookup.
+"""
+import threading
+from collections import defaultdict, deque
+
+
+from accounts.models import Member
+from chunks.models import Chunk, Semester
+from models import Comment
+
+# comments sharing more than this many characters in a row are similar
+MIN_OVERLAP = 20
+
+GRAM_LENGTH = 8
+WINDOW = MIN_OVERLAP + 1 - GRAM_LENGTH + 1
+
+# how many of the best candidates are checked exactly
+CANDIDATES_TO_CHECK = 5
+
+def fingerprints(text):
+    """
+    Returns the winnowed fingerprints of the text: the smallest n-gram hash
+    of every window of WINDOW consecutive n-grams.
+    """
+    text = text.lower()
+    hashes = [hash(text[i:i + GRAM_LENGTH]) for i in xrange(len(text) - GRAM_LENGTH + 1)]
+    selected = set()
+    window = deque()
+    for i, h in enumerate(hashes):
+        # keep the positions of the window's candidate minimums in order
+        while window and hashes[window[-1]] >= h:
+            window.pop()
+        window.append(i)
+        if window[0] <= i - WINDOW:
+            window.popleft()
+        if i >= WINDOW - 1 or i == len(hashes) - 1:
+            selected.add(hashes[window[0]])
+    return selected
+
+def _overlap_grams(text):
+    n = MIN_OVERLAP + 1
+    return set(text[i:i + n] for i in xrange(len(text) - n + 1))
+
+def overlaps(text, other_text):
+    """True if the texts share more than MIN_OVERLAP characters in a row."""
+    if len(text) > len(other_text):
+        text, other_text = other_text, text
+    grams = _overlap_grams(text)
+    n = MIN_OVERLAP + 1
+    return any(other_text[i:i + n] in grams for i in xrange(len(other_text) - n + 1))
+
+class SimilarityIndex(object):
+    """Fingerprints of the staff comments that can be reused in a semester."""
+    def __init__(self, semester_id):
+        self.semester_id = semester_id
+        self.texts = {}
+        self.comment_fingerprints = {}
+        self.postings = defaultdict(set)
+        self.synced = None
+        self.lock = threading.Lock()
+
+    def _comments(self):
+        semester = Semester.objects.get(id=self.semester_id)
+        return Comment.objects \
+            .filter(chunk__file__submission__milestone__assignment__semester__subject=semester.subject_id) \
+            .filter(author__membership__semester=self.semester_id, author__membership__role=Member.TEACHER) \
+            .filter(type='U') \
+            .distinct()
+
+    def _remove(self, comment_id):
+        for fingerprint in self.comment_fingerprints.pop(comment_id, ()):
+            self.postings[fingerprint].discard(comment_id)
+        self.texts.pop(comment_id, None)
+
+    def sync(self):
+        """Adds the comments created or edited since the last sync."""
+        with self.lock:
+            comments = self._comments()
+            if self.synced is not None:
+                comments = comments.filter(modified__gte=self.synced)
+            latest = self.synced
+            for comment_id, text, deleted, modified in comments.values_list('id', 'text', 'deleted', 'modified'):
+                self._remove(comment_id)
+                if not deleted:
+                    self.texts[comment_id] = text
+                    self.comment_fingerprints[comment_id] = fingerprints(text)
+                    for fingerprint in self.comment_fingerprints[comment_id]:
+                        self.postings[fingerprint].add(comment_id)
+                if latest is None or modified > latest:
+                    latest = modified
+            self.synced = latest
+
+    def find(self, text, exclude=()):
+        """Returns the ids of the indexed comments similar to the text, best first."""
+        if len(text) <= MIN_OVERLAP:
+            return []
+        text_fingerprints = fingerprints(text)
+        shared = defaultdict(int)
+        # another request may be syncing the index; the candidates' texts are
+        # copied under the lock and checked outside of it
+        with self.lock:
+            for fingerprint in text_fingerprints:
+                for comment_id in self.postings.get(fingerprint, ()):
+                    shared[comment_id] += 1
+            for comment_id in exclude:
+                shared.pop(comment_id, None)
+            ranked = sorted(shared, key=lambda comment_id: (-shared[comment_id], -comment_id))
+            candidates = [(comment_id, self.texts[comment_id]) for comment_id in ranked[:CANDIDATES_TO_CHECK]]
+        return [comment_id for comment_id, candidate_text in candidates if overlaps(text, candidate_text)]
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+def get_similarity_index(semester_id):
+    with _indexes_lock:
+        if semester_id not in _indexes:
+            _indexes[semester_id] = SimilarityIndex(semester_id)
+        index = _indexes[semester_id]
+    index.sync()
+    return index
+
+def find_similar_comment(suggested, text, chunk=None, exclude=()):
+    """
+    Returns the comment the text reuses, or None. The comment the author
+    picked from the suggestions (a Comment or an id) wins if the text really
+    overlaps it; otherwise the chunk's semester staff comments are searched.
+    """
+    if suggested not in (None, '', '-1', -1):
+        if not isinstance(suggested, Comment):
+            suggested = Comment.objects.get(id=suggested)
+        if overlaps(text, suggested.text):
+            return suggested
+    if chunk is None:
+        return None
+    semester_id = Chunk.objects.filter(id=chunk.id) \
+        .values_list('file__submission__milestone__assignment__semester', flat=True)[0]
+    similar = get_similarity_index(semester_id).find(text, exclude)
+    # the index doesn't notice comments removed from the database
+    comments = Comment.objects.in_bulk(similar)
+    for comment_id in similar:
+        if comment_id in comments:
+            return comments[comment_id]
+    return None
@@ -0,0 +1,141 @@
+"""
+Comments suggested to a reviewer while they write a comment on a chunk.
+
+Suggestions are the reviewer's own comments in the subject or, for staff,
+every staff comment of the semester. They are ranked by how related the
+commented chunk is to the one being viewed: same cluster of similar code,
+same chunk name, then the number of the chunk's identifiers the comment
+mentions (looked up in the search index, see review.search), newest first.
+
+Pages are sent in a compact form: authors are listed once and each comment
+is a row of [id, chunk id, author index, text].
+"""
+import hashlib
+from collections import Counter
+
+from django.contrib.auth.models import User
+from django.core.cache import get_cache
+from django.db.models import Count, Max
+
+from accounts.models import Member
+from models import Comment, CommentTerm
+from review.search import tokenize
+from tasks.models import routing_generation
+import app_settings
+
+# identifiers shorter than this (i, j, x...) say little about a comment
+MIN_IDENTIFIER_LENGTH = 3
+MAX_IDENTIFIERS = 100
+
+SUGGESTIONS_PER_PAGE = 200
+
+def chunk_identifiers(chunk):
+    """The most frequent words of the chunk's code, as search index terms."""
+    counts = Counter(dict((term, count) for term, count in tokenize(chunk.data).iteritems()
+        if len(term) >= MIN_IDENTIFIER_LENGTH and not term.startswith('#')))
+    return [term for term, count in counts.most_common(MAX_IDENTIFIERS)]
+
+class CommentSuggestions(object):
+    def __init__(self, chunk, user, scope, role):
+        self.chunk = chunk
+        self.user = user
+        self.scope = scope
+        self.role = role
+        self.semester = chunk.file.submission.milestone.assignment.semester
+
+        self._version = None
+
+    def comments(self):
+        comments = Comment.objects \
+            .filter(chunk__file__submission__milestone__assignment__semester__subject=self.semester.subject_id) \
+            .filter(deleted=False)
+        if self.scope == 'staff':
+            if self.role != Member.TEACHER:
+                return Comment.objects.none()
+            return comments.filter(author__membership__semester=self.semester,
+                    author__membership__role=Member.TEACHER).distinct()
+        return comments.filter(author=self.user)
+
+    def authors(self):
+        if self.scope == 'staff':
+            return User.objects.filter(membership__semester=self.semester,
+                    membership__role=Member.TEACHER).distinct()
+        return User.objects.filter(id=self.user.id)
+
+    def version(self):
+        """
+        Changes whenever the suggestions could have changed, without reading
+        every comment: saving a comment changes its modified (and deleting one
+        the count), and clustering the chunks bumps the routing generation.
+        The identifiers a comment mentions only change with its text.
+        """
+        if self._version is None:
+            digest = hashlib.sha1('%s:%s:%s:%s:%s:%s' % (self.scope, self.chunk.id, self.chunk.name,
+                    self.chunk.cluster_id, self.user.id, routing_generation()))
+            stats = self.comments().aggregate(count=Count('id'), modified=Max('modified'))
+            digest.update(repr((stats['count'], stats['modified'])))
+            # the few authors shown in the rows
+            for row in self.authors().order_by('id').values_list('id', 'first_name',
+                    'last_name', 'username', 'profile__reputation'):
+                digest.update(repr(row))
+            self._version = digest.hexdigest()
+        return self._version
+
+    def etag(self, page):
+        """Changes whenever the given page could have changed."""
+        return hashlib.sha1('%s:%s' % (self.version(), page)).hexdigest()
+
+    def ranked_ids(self):
+        """The ranked comment ids, ranked once for every page of a version."""
+        cache = get_cache(app_settings.SUGGESTIONS_CACHE)
+        key = 'suggestions:%s' % self.version()
+        ranked = cache.get(key)
+        if ranked is None:
+            ranked = self._rank()
+            cache.set(key, ranked, app_settings.SUGGESTIONS_CACHE_TIMEOUT)
+        return ranked
+
+    def _rank(self):
+        rows = list(self.comments().values_list('id', 'chunk__cluster_id', 'chunk__name'))
+        shared_terms = {}
+        identifiers = chunk_identifiers(self.chunk)
+        if rows and identifiers:
+            matches = CommentTerm.objects \
+                .filter(comment__in=self.comments().values('id'), term__in=identifiers) \
+                .values('comment').annotate(shared=Count('term'))
+            shared_terms = dict((row['comment'], row['shared']) for row in matches)
+        cluster_id = self.chunk.cluster_id
+
+        def rank(row):
+            comment_id, comment_cluster_id, chunk_name = row
+            return (cluster_id is not None and comment_cluster_id == cluster_id,
+                    chunk_name == self.chunk.name,
+                    shared_terms.get(comment_id, 0),
+                    comment_id)
+        rows.sort(key=rank, reverse=True)
+        return [row[0] for row in rows]
+
+    def page(self, number, per_page=None):
+        """Returns the compact data of the given 1-based page."""
+        if per_page is None:
+            per_page = SUGGESTIONS_PER_PAGE
+        ranked = self.ranked_ids()
+        start = (number - 1) * per_page
+        page_ids = ranked[start:start + per_page]
+        comments = Comment.objects.select_related('author__profile').in_bulk(page_ids)
+        authors = []
+        author_index = {}
+        rows = []
+        for comment_id in page_ids:
+            comment = comments[comment_id]
+            author = comment.author
+            if author.id not in author_index:
+                author_index[author.id] = len(authors)
+                authors.append([author.get_full_name() or author.username, author.username,
+                    author.profile.reputation])
+            rows.append([comment.id, comment.chunk_id, author_index[author.id], comment.text])
+        return {
+            'authors': authors,
+            'comments': rows,
+            'next': number + 1 if start + per_page < len(ranked) else None,
+        }
@@ -5,8 +5,15 @@ unittest). These will both pass when you run "manage.py test".
 Replace these with more appropriate tests for your application.
 """
 
+from django.contrib.auth.models import User
 from django.test import TestCase
 
+from accounts.models import Member
+from chunks.testing import CourseTestCase
+from review.models import Comment
+from review.search import SearchResults, hashtag_comments
+from review.similarity import find_similar_comment, overlaps
+
 class SimpleTest(TestCase):
     def test_basic_addition(self):
         """
@@ -21,3 +28,79 @@ Another way to test that 1 + 1 is equal to 2.
 True
 """}
 
+
+class CommentSearchTest(CourseTestCase):
+
+    def test_ranked_search(self):
+        """
+        Tests that search finds the comments containing every query word,
+        ranks them by how often the words occur and follows edits.
+        """
+        chunk = self.create_chunk(self.create_submission())
+        author = User.objects.create(username='author')
+
+        def comment(text):
+            c = Comment(chunk=chunk, author=author, text=text, start=1, end=1)
+            c.save()
+            return c
+        once = comment('This rep is exposed, see #RepExposure')
+        twice = comment('rep exposed here and the rep is exposed there')
+        comment('unrelated')
+
+        results = SearchResults('Rep exposed')
+        self.assertEqual(results.count(), 2)
+        self.assertEqual(results.page(1), [twice, once])
+        self.assertEqual(results.page(1, per_page=1), [twice])
+        self.assertEqual(results.page(2, per_page=1), [once])
+        self.assertEqual(hashtag_comments('repexposure').count(), 1)
+
+        hyphenated = comment('Follow #design-patterns here')
+        self.assertEqual(list(hashtag_comments('design-patterns').values_list('comment', flat=True)), [hyphenated.id])
+        self.assertEqual(hashtag_comments('design').count(), 0)
+        self.assertEqual(SearchResults('design patterns').page(1), [hyphenated])
+
+        terms = list(twice.terms.values_list('id', flat=True))
+        twice = Comment.objects.get(id=twice.id)
+        twice.save()
+        self.assertEqual(list(twice.terms.values_list('id', flat=True)), terms)
+
+        once.text = 'fixed'
+        once.save()
+        self.assertEqual(SearchResults('rep exposed').count(), 1)
+        self.assertEqual(hashtag_comments('repexposure').count(), 0)
+        self.semester.is_current_semester = False
+        self.semester.save()
+        self.assertEqual(SearchResults('rep exposed').count(), 0)
+
+
+class SimilarCommentTest(CourseTestCase):
+
+    def test_find_similar_comment(self):
+        """
+        Tests that a comment sharing more than 20 characters in a row with a
+        staff comment of the semester is matched to it, and that shorter
+        overlaps, student comments and deleted comments are not.
+        """
+        chunk = self.create_chunk(self.create_submission())
+        teacher = User.objects.create(username='teacher')
+        student = User.objects.create(username='student')
+        Member.objects.create(user=teacher, semester=self.semester, role=Member.TEACHER)
+        Member.objects.create(user=student, semester=self.semester, role=Member.STUDENT)
+
+        def comment(author, text):
+            c = Comment(chunk=chunk, author=author, text=text, start=1, end=1)
+            c.save()
+            return c
+        staff = comment(teacher, 'This method should check its precondition before using the list.')
+        comment(student, 'Why does nobody write specs for their helper methods here?')
+
+        self.assertTrue(overlaps('abcdefghijklmnopqrstu', 'xxabcdefghijklmnopqrstuxx'))
+        self.assertFalse(overlaps('abcdefghijklmnopqrst', 'xxabcdefghijklmnopqrstxx'))
+        self.assertEqual(find_similar_comment(None, 'Nice, but it should check its precondition first.', chunk), staff)
+        self.assertEqual(find_similar_comment(staff.id, 'should check its precondition before', None), staff)
+        self.assertEqual(find_similar_comment(None, 'always check its precond', chunk), None)
+        self.assertEqual(find_similar_comment(None, 'nobody write specs for their helper methods', chunk), None)
+
+        staff.deleted = True
+        staff.save()
+        self.assertEqual(find_similar_comment(None, 'Nice, but it should check its precondition first.', chunk), None)
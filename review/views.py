@@ -12,48 +12,28 @@ from django.core.urlresolvers import reverse
 from django.core.exceptions import ObjectDoesNotExist
 
 from chunks.models import Chunk, Assignment, Milestone, SubmitMilestone, ReviewMilestone, Submission, StaffMarker
+from chunks.models import get_chunk_access_cache
 from tasks.models import Task
 from tasks.routing import assign_tasks
 from models import Comment, Vote, Star
+from review.search import SearchResults
+from review.similarity import find_similar_comment
 from review.forms import CommentForm, ReplyForm, EditCommentForm
 from accounts.forms import UserProfileForm
 from accounts.models import UserProfile, Extension, Member
 from simplewiki.models import Article
-from log.models import Log
+from log import buffer as log_buffer
 
-from pygments import highlight
-from pygments.lexers import get_lexer_for_filename
-from pygments.formatters import HtmlFormatter
+from chunks.highlight import highlight_chunk
 
 import datetime
 import sys
 import logging
 
-def longest_common_substring(s1, s2):
-    m = [[0] * (1 + len(s2)) for i in xrange(1 + len(s1))]
-    longest, x_longest = 0, 0
-    for x in xrange(1, 1 + len(s1)):
-        for y in xrange(1, 1 + len(s2)):
-            if s1[x - 1] == s2[y - 1]:
-                m[x][y] = m[x - 1][y - 1] + 1
-                if m[x][y] > longest:
-                    longest = m[x][y]
-                    x_longest = x
-            else:
-                m[x][y] = 0
-    return s1[x_longest - longest: x_longest]
+SEARCH_RESULTS_PER_PAGE = 15
 
 def markLogStart(user, log):
-    logStart = Log(user=user, log='LOGSTART: '+str(log), timestamp=datetime.datetime.now())
-    logStart.save()
-
-def find_similar_comment(similar_comment_id, form_text):
-    similar_comment = Comment.objects.get(id=similar_comment_id)
-    overlap_length = len(longest_common_substring(form_text, similar_comment.text))
-    if overlap_length > 20:
-        return similar_comment
-    else:
-        return None
+    log_buffer.write(user, 'LOGSTART: '+str(log))
 
 @login_required
 def new_comment(request):
@@ -84,12 +64,12 @@ def new_comment(request):
     else:
         form = CommentForm(request.POST)
         if form.is_valid():
-            try:
-                form.similar_comment = find_similar_comment(form.cleaned_data['similar_comment'], form.cleaned_data['text'])
-            except:
-                form.similar_comment = None
             comment = form.save(commit=False)
             comment.author = request.user
+            try:
+                comment.similar_comment = find_similar_comment(form.cleaned_data['similar_comment'], comment.text, comment.chunk)
+            except:
+                comment.similar_comment = None
             comment.save()
             user = request.user
             chunk = comment.chunk
@@ -123,15 +103,15 @@ def reply(request):
     else:
         form = ReplyForm(request.POST)
         if form.is_valid():
-            try:
-                form.similar_comment = find_similar_comment(form.cleaned_data['similar_comment'], form.cleaned_data['text'])
-            except:
-                form.similar_comment = None
             comment = form.save(commit=False)
             comment.author = request.user
             parent = Comment.objects.get(id=comment.parent_id)
             chunk = parent.chunk
             comment.chunk = chunk
+            try:
+                comment.similar_comment = find_similar_comment(form.cleaned_data['similar_comment'], comment.text, chunk)
+            except:
+                comment.similar_comment = None
             comment.end = parent.end
             comment.start = parent.start
             if parent.is_reply():
@@ -192,7 +172,8 @@ def edit_comment(request):
             comment.text = form.cleaned_data['text']
             comment.edited = datetime.datetime.now()
             try:
-                comment.similar_comment = find_similar_comment(form.cleaned_data['similar_comment'], form.cleaned_data['text'])
+                comment.similar_comment = find_similar_comment(form.cleaned_data['similar_comment'], comment.text,
+                        comment.chunk, exclude=[comment.id])
             except:
                 comment.similar_comment = None
             comment.save()
@@ -282,35 +263,22 @@ def all_activity(request, review_milestone_id, username):
         .filter(file__submission__milestone= review_milestone.submit_milestone) \
         .filter(Q(comments__author=participant) | Q(comments__votes__author=participant)) \
         .select_related('comments__votes', 'comments__author_profile')
+    chunks = list(chunks)
+    get_chunk_access_cache().prefetch(chunks)
     chunk_set = set()
     review_milestone_data = []
 
-    # lexer = JavaLexer()
-    formatter = HtmlFormatter(cssclass='syntax', nowrap=True)
     for chunk in chunks:
         if chunk in chunk_set:
             continue
         else:
             chunk_set.add(chunk)
-        lexer = get_lexer_for_filename(chunk.file.path)
         participant_votes = dict((vote.comment.id, vote.value) \
                 for vote in participant.votes.filter(comment__chunk=chunk.id))
         numbers, lines = zip(*chunk.lines)
 
-        staff_lines = StaffMarker.objects.filter(chunk=chunk).order_by('start_line', 'end_line')
-
-        highlighted = zip(numbers,
-                highlight(chunk.data, lexer, formatter).splitlines())
-
-        highlighted_lines = []
-        staff_line_index = 0
-        for number, line in highlighted:
-            if staff_line_index < len(staff_lines) and number >= staff_lines[staff_line_index].start_line and number <= staff_lines[staff_line_index].end_line:
-                while staff_line_index < len(staff_lines) and number == staff_lines[staff_line_index].end_line:
-                    staff_line_index += 1
-                highlighted_lines.append((number, line, True))
-            else:
-                highlighted_lines.append((number, line, False))
+        highlighted = zip(numbers, highlight_chunk(chunk))
+        highlighted_lines = chunk.file.staff_line_index().mark(highlighted)
 
         comments = chunk.comments.prefetch_related('votes', 'author__profile', 'author__membership__semester')
         highlighted_comments = []
@@ -335,7 +303,7 @@ def all_activity(request, review_milestone_id, username):
         'articles': [x for x in Article.objects.all() if not x == Article.get_root()],
     })
 
-def view_helper(comments):
+def comment_review_data(comments):
     review_data = []
     for comment in comments:
         if comment.is_reply():
@@ -343,22 +311,33 @@ def view_helper(comments):
             review_data.append(("reply-comment", comment, comment.generate_snippet(), False, None))
         else:
             review_data.append(("new-comment", comment, comment.generate_snippet(), False, None))
+    return review_data
+
+def view_helper(comments):
+    review_data = comment_review_data(comments)
     review_data = sorted(review_data, key=lambda element: element[1].modified, reverse = True)
     return review_data
 
 @login_required
 def search(request):
-    if request.method == 'POST':
-        querystring = request.POST['value'].strip()
-        if querystring:
-            comments = Comment.objects.filter(chunk__file__submission__milestone__assignment__semester__is_current_semester=True,
-                                              text__icontains = querystring)
-            review_data = view_helper(comments[:15])
-            return render(request, 'review/search.html', {
-                                   'review_data': review_data,
-                                   'query': querystring,
-                                   'num_results': len(comments),
-            })
+    querystring = request.REQUEST.get('value', '').strip()
+    if querystring:
+        try:
+            page = max(int(request.GET.get('page', 1)), 1)
+        except ValueError:
+            page = 1
+        results = SearchResults(querystring)
+        num_results = results.count()
+        # search results keep their rank order instead of view_helper's sort
+        review_data = comment_review_data(results.page(page, SEARCH_RESULTS_PER_PAGE))
+        return render(request, 'review/search.html', {
+                               'review_data': review_data,
+                               'query': querystring,
+                               'num_results': num_results,
+                               'page': page,
+                               'previous_page': page - 1 if page > 1 else None,
+                               'next_page': page + 1 if page * SEARCH_RESULTS_PER_PAGE < num_results else None,
+        })
     return render(request, 'review/search.html', {
                                'review_data': [],
                            })
@@ -36,11 +36,11 @@ parser.add_argument('-n', '--dry-run',
 args = parser.parse_args()
 #print args
 
-tasks = Task.objects.filter(milestone__id=args.milestone).exclude(status='C').exclude(status="U")
-print "Preparing to close out " + str(len(tasks)) + " uncompleted tasks"
+milestone = ReviewMilestone.objects.get(id=args.milestone)
+tasks = Task.objects.filter(milestone=milestone).exclude(status='C').exclude(status="U")
+print "Preparing to close out " + str(tasks.count()) + " uncompleted tasks"
 
 if not args.dry_run:
-  tasks.update(status="U")
-  print "Changed the tasks to Unfinished."
-
-
+  # started tasks become Unfinished too, they weren't finished in time
+  counts = Task.objects.close_out(milestone, complete_started=False)
+  print "Changed %s tasks to Unfinished." % (counts['unfinished'])
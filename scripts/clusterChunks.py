@@ -0,0 +1,39 @@
+#!/usr/bin/env python2.7
+import sys, os
+# Add a custom Python path.
+sys.path.insert(0, "/var/django")
+sys.path.insert(0, "/var/django/caesar")
+
+from django.core.management import setup_environ
+from caesar import settings
+setup_environ(settings)
+
+# Set the DJANGO_SETTINGS_MODULE environment variable.
+#os.environ['DJANGO_SETTINGS_MODULE'] = "caesar.settings"
+
+from caesar.chunks.models import SubmitMilestone
+from caesar.chunks.clustering import cluster_milestone
+
+import time
+
+
+import argparse
+parser = argparse.ArgumentParser(description="""
+Groups the chunks of a submit milestone into clusters of similar code. The
+preprocessor does this after loading submissions; run this to recluster
+code loaded before, e.g. after changing CHUNKS_CHUNK_SIMILARITY_THRESHOLD.
+""")
+parser.add_argument('--milestone',
+                    metavar="ID",
+                    type=int,
+                    required=True,
+                    help="id number of the SubmitMilestone in Caesar whose chunks should be clustered.")
+
+args = parser.parse_args()
+#print args
+
+submit_milestone = SubmitMilestone.objects.get(id=args.milestone)
+
+starting_time = time.time()
+count = cluster_milestone(submit_milestone)
+print "Found %s clusters in %s in %.1f seconds." % (count, submit_milestone.full_name(), time.time() - starting_time)
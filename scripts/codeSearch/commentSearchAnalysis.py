@@ -4,10 +4,11 @@ from review.models import Comment
 from accounts.models import Member
 from chunks.models import Chunk, Semester
 from django.contrib.auth.models import User
+from django.db.models import Q
 import csv
 
 def formatJson(log):
-  logstring = log.log
+  logstring = log if isinstance(log, basestring) else log.log
   if "LOGSTART: " in logstring:
     logstring = logstring.replace("LOGSTART: ", "")
   valid_s = json.dumps(ast.literal_eval(logstring))
@@ -20,45 +21,145 @@ def formatJson(log):
       rawJson[key] = stringJson[key]
   return rawJson
 
+# rows read from the log table per query
+LOG_PAGE_SIZE = 5000
+
+def iterLogs(page_size=LOG_PAGE_SIZE):
+  """
+  Yields (username, log) for the whole log, ordered by user, time and id.
+  MySQLdb reads a complete result set into memory even for .iterator(), so
+  the rows are read in pages: each one continues after the (user, timestamp,
+  id) of the last row read, within that user and then with the next users.
+  """
+  logs = Log.objects.order_by('user', 'timestamp', 'id') \
+      .values_list('user', 'timestamp', 'id', 'user__username', 'log')
+  last = None
+  while True:
+    if last is None:
+      rows = list(logs[:page_size])
+    else:
+      user_id, timestamp, log_id = last
+      rows = list(logs.filter(user=user_id) \
+          .filter(Q(timestamp__gt=timestamp) | Q(timestamp=timestamp, id__gt=log_id))[:page_size])
+      if not rows:
+        rows = list(logs.filter(user__gt=user_id)[:page_size])
+    if not rows:
+      return
+    for user_id, timestamp, log_id, username, logstring in rows:
+      yield username, logstring
+    last = rows[-1][:3]
+
+def iterSessions():
+  """
+  Streams the log once, ordered by user and time, and yields a session for
+  each LOGSTART that is followed by events: the events of the same user up
+  to their next LOGSTART.
+  """
+  logs = iterLogs()
+  session = None
+  for username, logstring in logs:
+    if session is not None and session['user'] != username:
+      if session['logs']:
+        yield session
+      session = None
+    if "LOGSTART" in logstring:
+      if session is not None and session['logs']:
+        yield session
+      session = {'user': username, 'logstart': formatJson(logstring), 'logs': []}
+    elif session is not None:
+      session['logs'].append(formatJson(logstring))
+  if session is not None and session['logs']:
+    yield session
+
 def aggregateLogs():
-  # id__gt=9499
-  logStarts = Log.objects.filter(log__contains='LOGSTART').order_by('timestamp')
-  print len(logStarts)
-  aggregateLogs = []
-  for i in range(len(logStarts)-1):
-  # for i in range(10000, len(logStarts)-1):
-    print i
-    timeStart = logStarts[i].timestamp
-    user = logStarts[i].user
-    j = i+1
-    while logStarts[j].user != user:
-      j += 1
-      if j == len(logStarts):
-        j -= 1
-        break
-    timeEnd = logStarts[j].timestamp
-    logs = Log.objects.filter(user=user, timestamp__gt=timeStart, timestamp__lt=timeEnd)
-    if len(logs) > 0:
-      logDict = {'user': user.username,
-                 'logstart': formatJson(logStarts[i]),
-                 'logs': [formatJson(l) for l in logs],
-                }
-      aggregateLogs.append(logDict)
-  timeStart = logStarts[len(logStarts)-1].timestamp
-  user = logStarts[len(logStarts)-1].user
-  logs = Log.objects.filter(user=user, timestamp__gt=timeStart)
-  if len(logs) > 0:
-    logDict = {'user': user.username,
-               'logstart': formatJson(logStarts[len(logStarts)-1]),
-               'logs': [formatJson(l) for l in logs],
-              }
-    aggregateLogs.append(logDict)
-  return aggregateLogs
-
-def buildAggregateLogs():
-  data = aggregateLogs()
-  with open('scripts/aggregateLogsAll.txt', 'w') as outfile:
-    json.dump(data, outfile)
+  return list(iterSessions())
+
+class SessionSummary(object):
+  """Computes what getEvents, getExplorers and getUsers report, one session at a time."""
+  def __init__(self):
+    self.sessions = 0
+    self.events = {}
+    self.explorers = {}
+    self.users = {}
+    self.semesters = {}
+    self.roles = {}
+
+  def semester(self, logstart):
+    if logstart["type"] == "new comment":
+      key = ('chunk', logstart["chunk"])
+      semesters = Chunk.objects.filter(id=logstart["chunk"])
+    elif logstart["type"] == "edit comment":
+      key = ('comment', logstart["comment_id"])
+      semesters = Comment.objects.filter(id=logstart["comment_id"])
+    else: # logstart["type"] == "new reply"
+      key = ('parent', logstart["parent"])
+      semesters = Comment.objects.filter(id=logstart["parent"])
+    if key not in self.semesters:
+      prefix = 'file__' if key[0] == 'chunk' else 'chunk__file__'
+      found = semesters.values_list(prefix + 'submission__milestone__assignment__semester', flat=True)
+      if not found:
+        print "Failed for %s" % (key,)
+      self.semesters[key] = found[0] if found else None
+    return self.semesters[key]
+
+  def role(self, username, semester):
+    if (username, semester) not in self.roles:
+      roles = Member.objects.filter(user__username=username, semester=semester).values_list('role', flat=True)
+      self.roles[username, semester] = roles[0] if roles else None
+    return self.roles[username, semester]
+
+  def addEvents(self, session):
+    """Counts the session's events, without touching the database. Returns its uses."""
+    self.sessions += 1
+    uses = 0
+    for log in session["logs"]:
+      event = log.get("event", "select")
+      self.events[event] = self.events.get(event, 0) + 1
+      if "event" not in log or log["event"] == "return":
+        uses += 1
+    return uses
+
+  def add(self, session):
+    uses = self.addEvents(session)
+    semester = self.semester(session["logstart"])
+    if semester is None:
+      return
+    user = session["user"]
+    role = self.role(user, semester)
+    explorers = self.explorers.setdefault(role, {})
+    explorers[user] = explorers.get(user, 0) + 1
+    if uses:
+      users = self.users.setdefault(role, {})
+      users[user] = users.get(user, 0) + uses
+
+def summarize(sessions):
+  summary = SessionSummary()
+  for session in sessions:
+    summary.add(session)
+  return summary
+
+def buildAggregateLogs(path='scripts/aggregateLogsAll.txt'):
+  """Writes the sessions to path as JSON lines, and returns their summary."""
+  summary = SessionSummary()
+  with open(path, 'w') as outfile:
+    for session in iterSessions():
+      outfile.write(json.dumps(session) + '\n')
+      summary.add(session)
+  return summary
+
+def readAggregateLogs(path='scripts/aggregateLogsAll.txt'):
+  """Yields the sessions written by buildAggregateLogs, one line at a time."""
+  with open(path) as logfile:
+    if logfile.read(1) == '[':
+      # written by older versions as a single JSON list
+      logfile.seek(0)
+      for session in json.load(logfile):
+        yield session
+      return
+    logfile.seek(0)
+    for line in logfile:
+      if line.strip():
+        yield json.loads(line)
 
 def getReusedComments():
   reused = Comment.objects.filter(similar_comment__isnull=False)
@@ -70,79 +171,17 @@ def getReusedComments():
   return author_roles
 
 def getEvents(aggregateLogs):
-  events = {}
-  for entry in aggregateLogs:
-    for log in entry["logs"]:
-      if "event" in log:
-        event = log["event"]
-      else:
-        event = "select"
-      events[event] = events.get(event, 0) + 1
-  return events
+  # the events don't need the semesters and roles summarize looks up
+  summary = SessionSummary()
+  for session in aggregateLogs:
+    summary.addEvents(session)
+  return summary.events
 
 def getExplorers(aggregateLogs):
-  users = {}
-  for entry in aggregateLogs:
-    user = entry["user"]
-    if entry["logstart"]["type"] == "new comment":
-      chunk_id = entry["logstart"]["chunk"]
-      try:
-        semester = Chunk.objects.get(id=chunk_id).file.submission.milestone.assignment.semester
-      except:
-        print "Failed for chunk", chunk_id
-        continue
-    elif entry["logstart"]["type"] == "edit comment":
-      comment_id = entry["logstart"]["comment_id"]
-      try:
-        semester = Comment.objects.get(id=comment_id).chunk.file.submission.milestone.assignment.semester
-      except:
-        print "Failed for comment", comment_id
-        continue
-    else: # entry["logstart"]["type"] == "new reply"
-      parent_id = entry["logstart"]["parent"]
-      try:
-        semester = Comment.objects.get(id=parent_id).chunk.file.submission.milestone.assignment.semester
-      except:
-        print "Failed for parent", parent_id
-        continue
-    role = User.objects.get(username=user).membership.filter(semester=semester)[0].role
-    if role not in users:
-      users[role] = {}
-    users[role][user] = users[role].get(user, 0) + 1
-  return users
+  return summarize(aggregateLogs).explorers
 
 def getUsers(aggregateLogs):
-  users = {}
-  for entry in aggregateLogs:
-    for log in entry["logs"]:
-      if "event" not in log or log["event"] == "return":
-        user = entry["user"]
-        if entry["logstart"]["type"] == "new comment":
-          chunk_id = entry["logstart"]["chunk"]
-          try:
-            semester = Chunk.objects.get(id=chunk_id).file.submission.milestone.assignment.semester
-          except:
-            print "Failed for chunk", chunk_id
-            continue
-        elif entry["logstart"]["type"] == "edit comment":
-          comment_id = entry["logstart"]["comment_id"]
-          try:
-            semester = Comment.objects.get(id=comment_id).chunk.file.submission.milestone.assignment.semester
-          except:
-            print "Failed for comment", comment_id
-            continue
-        else: # entry["logstart"]["type"] == "new reply"
-          parent_id = entry["logstart"]["parent"]
-          try:
-            semester = Comment.objects.get(id=parent_id).chunk.file.submission.milestone.assignment.semester
-          except:
-            print "Failed for parent", parent_id
-            continue
-        role = User.objects.get(username=user).membership.filter(semester=semester)[0].role
-        if role not in users:
-          users[role] = {}
-        users[role][user] = users[role].get(user, 0) + 1
-  return users
+  return summarize(aggregateLogs).users
 
 def getCommentWriters(aggregateLogs):
   mismatchedUsers = [];
@@ -158,19 +197,15 @@ def getCommentWriters(aggregateLogs):
   return mismatchedUsers
 
 def analyzeAggregateLogs():
-  with open("scripts/aggregateLogsAll.txt") as logfile:
-    aggregateLogs = json.load(logfile)
-  # id__gt=9499
-  logStarts = Log.objects.filter(log__contains='LOGSTART').order_by('timestamp')
-  # print "Total logStarts:", len(logStarts)
-  # print "Uses:", len(aggregateLogs)
-  # print "Total Events:", getEvents(aggregateLogs)
+  aggregateLogs = readAggregateLogs()
+  # summary = summarize(readAggregateLogs())
+  # print "Uses:", summary.sessions
+  # print "Total Events:", summary.events
   # print "Author roles:", getReusedComments()
-  # explorers = getExplorers(aggregateLogs)
-  # # print "Users:", users
+  # explorers = summary.explorers
   # print "Average number of student explorations:", sum(explorers["S"].values())/len(explorers["S"].keys())
   # print "Average number of teacher explorations:", sum(explorers["T"].values())/len(explorers["T"].keys())
-  # users = getUsers(aggregateLogs)
+  # users = summary.users
   # print "Users:", users
   # print "Average number of student uses:", sum(users["S"].values())/len(users["S"].keys())
   # print "Average number of teacher uses:", sum(users["T"].values())/len(users["T"].keys())
@@ -0,0 +1,31 @@
+#!/usr/bin/env python2.7
+import sys, os
+# Add a custom Python path.
+sys.path.insert(0, "/var/django")
+sys.path.insert(0, "/var/django/caesar")
+
+from django.core.management import setup_environ
+from caesar import settings
+setup_environ(settings)
+
+# Set the DJANGO_SETTINGS_MODULE environment variable.
+#os.environ['DJANGO_SETTINGS_MODULE'] = "caesar.settings"
+
+from caesar.utils.cache import cull_caches
+
+import time
+
+
+import argparse
+parser = argparse.ArgumentParser(description="""
+Deletes the expired and least recently used entries of the file based caches
+once they hold more than MAX_ENTRIES. The web server never culls them itself,
+so run this from cron, e.g. every 5 minutes.
+""")
+
+args = parser.parse_args()
+#print args
+
+starting_time = time.time()
+cull_caches()
+print "Done in %.1f seconds." % (time.time() - starting_time)
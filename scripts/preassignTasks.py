@@ -0,0 +1,47 @@
+#!/usr/bin/env python2.7
+import sys, os
+# Add a custom Python path.
+sys.path.insert(0, "/var/django")
+sys.path.insert(0, "/var/django/caesar")
+
+from django.core.management import setup_environ
+from caesar import settings
+setup_environ(settings)
+
+# Set the DJANGO_SETTINGS_MODULE environment variable.
+#os.environ['DJANGO_SETTINGS_MODULE'] = "caesar.settings"
+
+from caesar.chunks.models import ReviewMilestone
+from caesar.tasks.routing import preassign_tasks
+
+import time
+
+
+import argparse
+parser = argparse.ArgumentParser(description="""
+Assigns review tasks to every member of the class in one pass, so that nobody
+has to wait for routing when they log in after the review milestone opens.
+""")
+parser.add_argument('--milestone',
+                    metavar="ID",
+                    type=int,
+                    required=True,
+                    help="id number of ReviewMilestone in Caesar. Go to Admin, Review milestones, and take the last number from the link of the review milestone you created for this deadline.")
+parser.add_argument('-n', '--dry-run',
+                    action="store_true",
+                    help="just do a test run -- don't save anything into the Caesar database")
+
+
+args = parser.parse_args()
+#print args
+
+review_milestone = ReviewMilestone.objects.get(id=args.milestone)
+print "Assigning tasks for %s" % (review_milestone.full_name())
+
+starting_time = time.time()
+tasks = preassign_tasks(review_milestone, save=not args.dry_run)
+reviewers = set(task.reviewer_id for task in tasks)
+print "Routed " + str(len(tasks)) + " tasks to " + str(len(reviewers)) + " reviewers in %.1f seconds" % (time.time() - starting_time)
+
+if not args.dry_run:
+  print "and saved them to the database."
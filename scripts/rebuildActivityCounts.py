@@ -0,0 +1,41 @@
+#!/usr/bin/env python2.7
+import sys, os
+# Add a custom Python path.
+sys.path.insert(0, "/var/django")
+sys.path.insert(0, "/var/django/caesar")
+
+from django.core.management import setup_environ
+from caesar import settings
+setup_environ(settings)
+
+# Set the DJANGO_SETTINGS_MODULE environment variable.
+#os.environ['DJANGO_SETTINGS_MODULE'] = "caesar.settings"
+
+from caesar.chunks.models import Chunk, update_activity_counts
+
+import time
+
+
+import argparse
+parser = argparse.ArgumentParser(description="""
+Recomputes the comment and reviewer counts stored on chunks and submissions
+from the comments and tasks in the database. Run it after migrating, or after
+changing comments or tasks behind Caesar's back (e.g. with raw SQL).
+""")
+parser.add_argument('--milestone',
+                    metavar="ID",
+                    type=int,
+                    help="id number of a SubmitMilestone in Caesar, to only rebuild the counts of its submissions. Defaults to all submissions.")
+
+args = parser.parse_args()
+#print args
+
+chunks = Chunk.objects.all()
+if args.milestone is not None:
+  chunks = chunks.filter(file__submission__milestone__id=args.milestone)
+
+starting_time = time.time()
+chunk_ids = list(chunks.values_list('id', flat=True))
+print "Rebuilding the counts of " + str(len(chunk_ids)) + " chunks"
+update_activity_counts(chunk_ids)
+print "Done in %.1f seconds." % (time.time() - starting_time)
@@ -0,0 +1,40 @@
+#!/usr/bin/env python2.7
+import sys, os
+# Add a custom Python path.
+sys.path.insert(0, "/var/django")
+sys.path.insert(0, "/var/django/caesar")
+
+from django.core.management import setup_environ
+from caesar import settings
+setup_environ(settings)
+
+# Set the DJANGO_SETTINGS_MODULE environment variable.
+#os.environ['DJANGO_SETTINGS_MODULE'] = "caesar.settings"
+
+from caesar.review.models import Comment
+from caesar.review.search import rebuild_index
+
+import time
+
+
+import argparse
+parser = argparse.ArgumentParser(description="""
+Rebuilds the comment search index from the comments in the database. Run it
+after migrating, or after changing comments behind Caesar's back (e.g. with
+raw SQL).
+""")
+parser.add_argument('--semester',
+                    metavar="ID",
+                    type=int,
+                    help="id number of a Semester in Caesar, to only reindex its comments. Defaults to all comments.")
+
+args = parser.parse_args()
+#print args
+
+comments = Comment.objects.all()
+if args.semester is not None:
+  comments = comments.filter(chunk__file__submission__milestone__assignment__semester__id=args.semester)
+
+starting_time = time.time()
+count = rebuild_index(comments)
+print "Indexed %s comments in %.1f seconds." % (count, time.time() - starting_time)
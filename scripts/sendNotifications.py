@@ -0,0 +1,39 @@
+#!/usr/bin/env python2.7
+import sys, os
+# Add a custom Python path.
+sys.path.insert(0, "/var/django")
+sys.path.insert(0, "/var/django/caesar")
+
+from django.core.management import setup_environ
+from caesar import settings
+setup_environ(settings)
+
+# Set the DJANGO_SETTINGS_MODULE environment variable.
+#os.environ['DJANGO_SETTINGS_MODULE'] = "caesar.settings"
+
+from caesar.notifications.digest import send_digests
+
+import time
+
+
+import argparse
+parser = argparse.ArgumentParser(description="""
+Emails the queued notifications, one digest per recipient. Run it from cron,
+or leave it running with --every.
+""")
+parser.add_argument('--every',
+                    metavar="SECONDS",
+                    type=int,
+                    default=None,
+                    help="keep running and send the due digests every SECONDS seconds. By default, send them once and exit.")
+
+args = parser.parse_args()
+#print args
+
+while True:
+  starting_time = time.time()
+  count = send_digests()
+  print "Sent %s digests in %.1f seconds." % (count, time.time() - starting_time)
+  if args.every is None:
+    break
+  time.sleep(args.every)
@@ -0,0 +1,68 @@
+#!/usr/bin/env python2.7
+import sys, os
+# Add a custom Python path.
+sys.path.insert(0, "/var/django")
+sys.path.insert(0, "/var/django/caesar")
+
+from django.core.management import setup_environ
+from caesar import settings
+setup_environ(settings)
+
+# Set the DJANGO_SETTINGS_MODULE environment variable.
+#os.environ['DJANGO_SETTINGS_MODULE'] = "caesar.settings"
+
+from caesar.chunks.models import ReviewMilestone
+from caesar.tasks.simulation import sweep
+
+import time
+
+
+def int_list(value):
+  return [int(v) for v in value.split(',')]
+
+import argparse
+parser = argparse.ArgumentParser(description="""
+Simulates the routing of a review milestone for every combination of the
+given parameters, without assigning any tasks, and prints how well each
+configuration covers the chunks. Parameters that aren't given keep the
+milestone's values, e.g. --student-count 3,4,5 --reviewers-per-chunk 1,2.
+""")
+parser.add_argument('--milestone',
+                    metavar="ID",
+                    type=int,
+                    required=True,
+                    help="id number of ReviewMilestone in Caesar. Go to Admin, Review milestones, and take the last number from the link of the review milestone you created for this deadline.")
+for name in ['student_count', 'alum_count', 'staff_count', 'reviewers_per_chunk', 'min_student_lines']:
+  parser.add_argument('--' + name.replace('_', '-'),
+                      dest=name,
+                      metavar="N,N,...",
+                      type=int_list,
+                      help="values of %s to try" % name)
+parser.add_argument('--seed',
+                    type=int,
+                    default=0,
+                    help="random seed, shared by all configurations")
+
+
+args = parser.parse_args()
+#print args
+
+review_milestone = ReviewMilestone.objects.get(id=args.milestone)
+print "Simulating routing for %s" % (review_milestone.full_name())
+
+parameters = dict((name, values) for name, values in vars(args).iteritems()
+    if name not in ('milestone', 'seed') and values)
+
+starting_time = time.time()
+results = sweep(review_milestone, seed=args.seed, **parameters)
+
+print "%5s %5s %5s %5s %5s | %6s %8s %8s %8s  %s" % ('stud', 'alum', 'staff', 'rpc', 'lines',
+    'tasks', 'coverage', 'quota', 'staffed', 'reviewers per chunk')
+for result in results:
+  config, metrics = result.config, result.metrics
+  distribution = ' '.join('%d:%d' % item for item in sorted(metrics['reviewers_per_chunk'].items()))
+  print "%5d %5d %5d %5d %5d | %6d %7.1f%% %7.1f%% %7.1f%%  %s" % (config.student_count, config.alum_count,
+      config.staff_count, config.reviewers_per_chunk, config.min_student_lines, metrics['tasks'],
+      100 * metrics['coverage'], 100 * metrics['quota_met'], 100 * metrics['staff_spread'], distribution)
+
+print "Simulated " + str(len(results)) + " configurations in %.1f seconds" % (time.time() - starting_time)
@@ -154,6 +154,7 @@ INSTALLED_APPS = (
     'simplewiki',
     'notifications',
     'log',
+    'dashboard',
 )
 
 LOGIN_REDIRECT_URL = '/'
@@ -178,9 +179,54 @@ DEBUG_TOOLBAR_PANELS = (
     'debug_toolbar.panels.logger.LoggingPanel',
 )
 
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # highlighted source lines; file based so it survives restarts and is
+    # shared between the apache worker processes. LRUFileBasedCache culls
+    # least recently used first, unlike FileBasedCache, and only when
+    # scripts/cullCaches.py (run it from cron) or the preprocessor asks.
+    'highlight': {
+        'BACKEND': 'utils.cache.LRUFileBasedCache',
+        'LOCATION': project_path('cache/highlight'),
+        'TIMEOUT': 60 * 60 * 24 * 30,
+        'OPTIONS': {
+            'MAX_ENTRIES': 20000,
+        },
+    },
+    # per-user dashboard summaries, invalidated by signals in whichever
+    # process changes the data, so this must be shared between processes too
+    'dashboard': {
+        'BACKEND': 'utils.cache.LRUFileBasedCache',
+        'LOCATION': project_path('cache/dashboard'),
+        'TIMEOUT': 60 * 60 * 24,
+        'OPTIONS': {
+            'MAX_ENTRIES': 50000,
+        },
+    },
+    # figures about whole milestones for the staff pages, shared so that
+    # the apache workers compute them once between them
+    'milestones': {
+        'BACKEND': 'utils.cache.LRUFileBasedCache',
+        'LOCATION': project_path('cache/milestones'),
+        'TIMEOUT': 60 * 60 * 24,
+        'OPTIONS': {
+            'MAX_ENTRIES': 5000,
+        },
+    },
+}
+
 # PROJECT SPECIFIC SETTINGS
 MINIMUM_SNIPPET_LENGTH = 80
 
+CHUNKS_HIGHLIGHT_CACHE = 'highlight'
+DASHBOARD_SUMMARY_CACHE = 'dashboard'
+CHUNKS_HISTOGRAM_CACHE = 'milestones'
+TASKS_STATS_CACHE = 'milestones'
+TASKS_ROUTING_CACHE = 'milestones'
+REVIEW_SUGGESTIONS_CACHE = 'milestones'
+
 FIXTURE_DIRS = [project_path('fixtures')]
 
 from settings_local import *
@@ -188,6 +234,9 @@ from settings_local import *
 # run tests in memory
 if 'test' in sys.argv:
     DATABASES['default'] = {'ENGINE': 'django.db.backends.sqlite3'}
+    CACHES['highlight'] = {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}
+    CACHES['dashboard'] = {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'dashboard'}
+    CACHES['milestones'] = {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'milestones'}
 # don't migrate for tests
 SOUTH_TESTS_MIGRATE = False
 
@@ -18,6 +18,7 @@ from models import *
 from settings import *
 
 from review.models import Comment, Vote
+from review.search import hashtag_comments
 
 @login_required
 def view(request, wiki_url):
@@ -41,16 +42,18 @@ def view(request, wiki_url):
     for revision in revisions:
         if revision.revision_user not in contributors:
             contributors.append(revision.revision_user)
-    num_uses_total = Comment.objects.filter(text__icontains='#' + article.slug).count()
-    current_semester_comments = Comment.objects.filter(chunk__file__submission__milestone__assignment__semester="FA12",
-                                                       text__icontains = "#" + article.slug).distinct().exclude(author__username = "checkstyle")
+    # hashtag uses come from the comment search index, see review.search
+    hashtag_uses = hashtag_comments(article.slug)
+    num_uses_total = hashtag_uses.count()
+    current_semester_uses = hashtag_uses.filter(semester__is_current_semester=True)
+    current_semester_comments = Comment.objects \
+        .filter(id__in=current_semester_uses.values('comment')) \
+        .exclude(author__username = "checkstyle")
     
     review_data = view_helper(current_semester_comments[0:15])
-    commenters = User.objects.filter(comments__chunk__file__submission__milestone__assignment__semester="FA12",
-                                     comments__text__icontains = "#" + article.slug).exclude(username="checkstyle").distinct()
-    num_checkstyle_uses_semester = Comment.objects.filter(chunk__file__submission__milestone__assignment__semester="FA12",
-                                                          text__icontains = "#" + article.slug,
-                                                          author__username = "checkstyle").count()
+    commenters = User.objects.filter(comments__in=current_semester_comments).distinct()
+    num_checkstyle_uses_semester = current_semester_uses \
+        .filter(comment__author__username = "checkstyle").count()
     
     return render(request, "simplewiki/simplewiki_view.html", {
                            'wiki_article': article,
@@ -61,7 +64,7 @@ def view(request, wiki_url):
                            'review_data': review_data,
                            'articles': articles,
                            'contributors': contributors,
-                           'num_student_uses_semester': len(current_semester_comments),
+                           'num_student_uses_semester': current_semester_comments.count(),
                            'num_uses_total': num_uses_total,
                            'commenters': commenters,
                            'num_checkstyle_uses_semester': num_checkstyle_uses_semester,
@@ -74,6 +74,52 @@ function clearDatabase(chunk_id) {
   }
 }
 
+// Expand a page of similar comment suggestions, where authors are listed once
+// and comments are [id, chunk_id, author index, text] rows
+function unpackSimilarComments(page) {
+  var comments = [];
+  for (var i=0; i<page.comments.length; i++) {
+    var row = page.comments[i];
+    var author = page.authors[row[2]];
+    comments.push({
+      "comment_id": row[0],
+      "chunk_id": row[1],
+      "author": author[0],
+      "author_username": author[1],
+      "reputation": author[2],
+      "comment": row[3]
+    });
+  }
+  return comments;
+}
+
+// Load the suggestions at url from the given page on, then call done.
+// The responses carry ETags, so pages that haven't changed come from the browser cache.
+function loadSimilarComments(url, page, chunk_id, done) {
+  $.ajax({
+    url: url,
+    data: {"page": page},
+    success: function(response) {
+      if (response && response.comments) {
+        var comments = unpackSimilarComments(response);
+        if (commentSearch.isReady()) {
+          commentSearch.addCommentsToDB(comments);
+        }
+        else {
+          commentSearch.init(comments, chunk_id);
+        }
+        if (response.next) {
+          loadSimilarComments(url, response.next, chunk_id, done);
+          return;
+        }
+      }
+      if (done) {
+        done();
+      }
+    }
+  });
+}
+
 ////////////////////////////////////////////////////////////////////////
 // Call this function when opening a comment form
 ////////////////////////////////////////////////////////////////////////  
@@ -312,6 +358,10 @@ var commentSearch = new function() {
     }
   }
 
+  this.isReady = function() {
+    return commentsSearchEngine !== undefined;
+  };
+
   this.init = function(commentsData_, chunk_id) {
 
     dbName = "similarCommentsDB-"+chunk_id;
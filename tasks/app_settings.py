@@ -13,3 +13,18 @@ ROLE_AFFINITY_MULTIPLIER = getattr(settings, 'TASKS_ROLE_AFFINITY_MULTIPLIER',
                                    100)
 
 CHUNKS_PER_CLUSTER = getattr(settings, 'TASKS_CHUNKS_PER_CLUSTER', 3)
+
+# alias in settings.CACHES that stores the review milestone statistics
+# snapshots shown to the staff. It should be shared by all the server
+# processes (e.g. file based), so that they keep one snapshot between them.
+STATS_CACHE = getattr(settings, 'TASKS_STATS_CACHE', 'default')
+
+# alias in settings.CACHES that holds the routing generation, which tells the
+# server processes to reload their routing graphs. It has to be shared by all
+# of them and by the preprocessor.
+ROUTING_CACHE = getattr(settings, 'TASKS_ROUTING_CACHE', 'default')
+
+STATS_CACHE_TIMEOUT = getattr(settings, 'TASKS_STATS_CACHE_TIMEOUT', 60 * 60 * 24 * 7)
+
+# snapshots younger than this many seconds are served as they are
+STATS_REFRESH_INTERVAL = getattr(settings, 'TASKS_STATS_REFRESH_INTERVAL', 60)
@@ -0,0 +1,138 @@
+"""
+Figures about a review milestone for the staff (tasks.views.review_milestone_info).
+
+The figures are kept in a timestamped snapshot in the cache. Chunk figures
+come from one query grouped by submission and are only recomputed when the
+milestone's chunks change. Comment figures come from one query grouped by
+(author, type, chunk); since comments are only soft deleted, a refresh just
+adds the groups of the comments created since the last one, and starts over
+if comments were removed. Task figures are a single aggregate. Snapshots
+younger than STATS_REFRESH_INTERVAL seconds are served without any query.
+"""
+import datetime
+from collections import defaultdict
+
+from django.core.cache import get_cache
+from django.db.models import Count, Max
+
+from accounts.models import Member
+from chunks.models import Chunk, Submission
+from review.models import Comment
+from models import Task
+import app_settings
+
+def _cache_key(review_milestone_id):
+    return 'milestone-stats:%s' % review_milestone_id
+
+def _chunk_version(submit_milestone_id):
+    stats = Chunk.objects.filter(file__submission__milestone=submit_milestone_id) \
+            .aggregate(count=Count('id'), last=Max('id'))
+    submissions = Submission.objects.filter(milestone=submit_milestone_id) \
+            .aggregate(count=Count('id'), last=Max('id'))
+    return (stats['count'], stats['last'], submissions['count'], submissions['last'])
+
+def _chunk_stats(submit_milestone_id):
+    chunk_counts = Submission.objects.filter(milestone=submit_milestone_id) \
+            .annotate(chunks=Count('files__chunks')).values_list('chunks', flat=True)
+    return {
+        'total_chunks': sum(chunk_counts),
+        'zero_chunk_users': sum(1 for count in chunk_counts if not count),
+    }
+
+def _add_comment_groups(snapshot, comments):
+    """Adds the (author, type, chunk) groups of the comments. Returns how many there were."""
+    added = 0
+    for row in comments.values('author', 'type', 'chunk').annotate(count=Count('id'), last=Max('id')):
+        snapshot['author_types'][row['author'], row['type']] += row['count']
+        if row['type'] == 'U':
+            snapshot['human_chunks'].add(row['chunk'])
+        snapshot['last_comment_id'] = max(snapshot['last_comment_id'], row['last'])
+        added += row['count']
+    return added
+
+def _sync_comments(snapshot, submit_milestone_id):
+    comments = Comment.objects.filter(chunk__file__submission__milestone=submit_milestone_id)
+    stats = comments.aggregate(count=Count('id'), last=Max('id'))
+    if (stats['count'], stats['last'] or 0) == (snapshot['comment_count'], snapshot['last_comment_id']):
+        return
+    added = _add_comment_groups(snapshot, comments.filter(id__gt=snapshot['last_comment_id']))
+    if snapshot['comment_count'] + added != stats['count']:
+        # comments were removed, the groups have to be counted again
+        snapshot.update(author_types=defaultdict(int), human_chunks=set(), last_comment_id=0)
+        added = _add_comment_groups(snapshot, comments)
+        snapshot['comment_count'] = 0
+    snapshot['comment_count'] += added
+
+def _figures(snapshot, roles):
+    figures = dict(snapshot['chunk_stats'])
+    figures.update(snapshot['task_stats'])
+    by_role = defaultdict(int)
+    alums = set()
+    total_comments = total_checkstyle = total_user_comments = 0
+    for (author_id, comment_type), count in snapshot['author_types'].iteritems():
+        role = roles.get(author_id)
+        by_role[role] += count
+        if role == Member.VOLUNTEER:
+            alums.add(author_id)
+        total_comments += count
+        if comment_type == 'S':
+            total_checkstyle += count
+        elif comment_type == 'U':
+            total_user_comments += count
+    figures.update(
+        alums_participating=len(alums),
+        total_chunks_with_human=len(snapshot['human_chunks']),
+        total_comments=total_comments,
+        total_checkstyle=total_checkstyle,
+        total_user_comments=total_user_comments,
+        total_staff_comments=by_role[Member.TEACHER],
+        total_student_comments=by_role[Member.STUDENT],
+        total_alum_comments=by_role[Member.VOLUNTEER],
+    )
+    return figures
+
+def refresh_stats(review_milestone, snapshot=None, now=None):
+    """Brings the snapshot (a new one if None) up to date and returns it."""
+    if snapshot is None:
+        snapshot = {
+            'chunk_version': None,
+            'comment_count': 0,
+            'last_comment_id': 0,
+            'author_types': defaultdict(int),
+            'human_chunks': set(),
+        }
+    submit_milestone_id = review_milestone.submit_milestone_id
+
+    chunk_version = _chunk_version(submit_milestone_id)
+    if chunk_version != snapshot['chunk_version']:
+        snapshot['chunk_stats'] = _chunk_stats(submit_milestone_id)
+        snapshot['chunk_version'] = chunk_version
+
+    tasks = Task.objects.filter(milestone=review_milestone) \
+            .aggregate(total_tasks=Count('id'), assigned_chunks=Count('chunk', distinct=True))
+    snapshot['task_stats'] = tasks
+
+    _sync_comments(snapshot, submit_milestone_id)
+
+    roles = dict(Member.objects.filter(semester=review_milestone.assignment.semester_id) \
+            .values_list('user_id', 'role'))
+    snapshot['figures'] = _figures(snapshot, roles)
+    snapshot['computed'] = now or datetime.datetime.now()
+    return snapshot
+
+def get_stats(review_milestone, max_age=None, now=None):
+    """
+    Returns the milestone's snapshot: a dict of its 'figures' and the time
+    they were 'computed'. A snapshot older than max_age seconds (by default
+    STATS_REFRESH_INTERVAL) is refreshed first.
+    """
+    if max_age is None:
+        max_age = app_settings.STATS_REFRESH_INTERVAL
+    now = now or datetime.datetime.now()
+    cache = get_cache(app_settings.STATS_CACHE)
+    key = _cache_key(review_milestone.id)
+    snapshot = cache.get(key)
+    if snapshot is None or now - snapshot['computed'] >= datetime.timedelta(seconds=max_age):
+        snapshot = refresh_stats(review_milestone, snapshot, now)
+        cache.set(key, snapshot, app_settings.STATS_CACHE_TIMEOUT)
+    return snapshot
@@ -1,13 +1,88 @@
 from datetime import datetime
+import time
 
-from django.db import models
+from django.core.cache import get_cache
+from django.db import models, transaction
 from django.db.models import Count
+from django.db.models.signals import post_save, post_delete, post_init
+from django.dispatch import receiver, Signal
 
 from django.contrib.auth.models import User
-from accounts.models import UserProfile
-from chunks.models import Chunk, ReviewMilestone, Submission
+from accounts.models import UserProfile, Member
+from chunks.models import Chunk, ReviewMilestone, Submission, count_activity
 import app_settings
 
+# sent after tasks change status in bulk, which doesn't send post_save
+tasks_updated = Signal(providing_args=['reviewer_ids'])
+
+ROUTING_GENERATION_KEY = 'routing:generation'
+ROUTING_GENERATION_TIMEOUT = 60 * 60 * 24 * 365
+
+def routing_generation():
+    """
+    A number that changes whenever something the routing graphs hold changes
+    in a way that their chunk and member counts don't show (see
+    tasks.routing.get_routing_state).
+    """
+    cache = get_cache(app_settings.ROUTING_CACHE)
+    generation = cache.get(ROUTING_GENERATION_KEY)
+    if generation is None:
+        _start_routing_generation(cache)
+        generation = cache.get(ROUTING_GENERATION_KEY)
+    return generation
+
+def _start_routing_generation(cache):
+    # like the dashboard generation, start from the clock so that losing the
+    # key can't bring back an earlier one; add() keeps the first of several
+    # processes starting it at once
+    cache.add(ROUTING_GENERATION_KEY, int(time.time()), ROUTING_GENERATION_TIMEOUT)
+
+def invalidate_routing_states():
+    """Makes every process reload its routing graphs."""
+    cache = get_cache(app_settings.ROUTING_CACHE)
+    try:
+        # incr() is atomic, so concurrent invalidations all count
+        cache.incr(ROUTING_GENERATION_KEY)
+    except ValueError:
+        # a new generation is a change already
+        _start_routing_generation(cache)
+
+class TaskManager(models.Manager):
+    def mark_all_as(self, tasks, status, now=None):
+        """
+        Like Task.mark_as for a whole queryset of tasks, in one UPDATE.
+        Returns the number of tasks changed.
+        """
+        if status not in zip(*Task.STATUS_CHOICES)[0]:
+            raise Exception('Invalid task status')
+        if now is None:
+            now = datetime.now()
+        fields = {'status': status}
+        if status == 'N':
+            fields.update(opened=None, started=None, completed=None)
+        elif status in Task.STATUS_TIMESTAMPS:
+            fields[Task.STATUS_TIMESTAMPS[status]] = now
+        reviewer_ids = set(tasks.values_list('reviewer', flat=True).distinct())
+        count = tasks.update(**fields)
+        if count:
+            tasks_updated.send(sender=Task, reviewer_ids=reviewer_ids)
+        return count
+
+    def close_out(self, milestone=None, complete_started=True):
+        """
+        Ends the review of a milestone, or of every milestone: started tasks
+        become completed (or unfinished, if not complete_started) and the
+        other open tasks unfinished. Returns a dict of the counts.
+        """
+        tasks = self.all() if milestone is None else self.filter(milestone=milestone)
+        now = datetime.now()
+        counts = {'completed': 0}
+        with transaction.commit_on_success():
+            if complete_started:
+                counts['completed'] = self.mark_all_as(tasks.filter(status='S'), 'C', now)
+            counts['unfinished'] = self.mark_all_as(tasks.exclude(status__in=['C', 'U']), 'U', now)
+        return counts
+
 class Task(models.Model):
     STATUS_CHOICES=(
         ('N', 'New'),
@@ -16,6 +91,12 @@ class Task(models.Model):
         ('C', 'Completed'),
         ('U', 'Unfinished'),
     )
+    # the time each status was entered is kept in these fields
+    STATUS_TIMESTAMPS = {
+        'O': 'opened',
+        'S': 'started',
+        'C': 'completed',
+    }
     
     submission = models.ForeignKey(Submission, related_name='tasks', null=True, blank=True)
     chunk = models.ForeignKey(Chunk, related_name='tasks', null=True, blank=True)
@@ -28,6 +109,8 @@ class Task(models.Model):
     started = models.DateTimeField(blank=True, null=True)
     completed = models.DateTimeField(blank=True, null=True)
 
+    objects = TaskManager()
+
     # how should tasks be sorted in the dashboard?
     def sort_key(self):
         try:
@@ -64,3 +147,76 @@ class Task(models.Model):
     
     def authors(self):
       return self.submission.authors
+
+
+@receiver(post_save, sender=Task)
+def denormalize_tasks(sender, instance, created=False, raw=False, **kwargs):
+    """This keeps the reviewer counts of the chunk and its submission up to date"""
+    # status changes don't move any counts
+    if created and not raw:
+        count_activity(instance.chunk_id, reviewers=1)
+
+
+@receiver(post_delete, sender=Task)
+def denormalize_deleted_tasks(sender, instance, **kwargs):
+    count_activity(instance.chunk_id, reviewers=-1)
+
+
+@receiver(post_save, sender=Task)
+def invalidate_routing_on_reassignment(sender, instance, created=False, raw=False, **kwargs):
+    # a new task is picked up by the routing graphs on their own, but a task
+    # moved to another chunk or reviewer has to be replayed from scratch
+    if not created and not raw and \
+            (instance.chunk_id, instance.reviewer_id) != getattr(instance, '_routed', None):
+        invalidate_routing_states()
+    instance._routed = (instance.chunk_id, instance.reviewer_id)
+
+
+@receiver(post_init, sender=Task)
+def remember_routing(sender, instance, **kwargs):
+    if instance.id is not None:
+        instance._routed = (instance.chunk_id, instance.reviewer_id)
+
+
+# the fields of chunks and members that the routing graphs hold; new chunks
+# and members show in the counts
+ROUTED_FIELDS = {
+    Chunk: ('cluster_id', 'student_lines'),
+    Member: ('role',),
+}
+
+def _routed_fields(sender, instance):
+    return tuple(getattr(instance, field) for field in ROUTED_FIELDS[sender])
+
+
+@receiver(post_save, sender=Chunk)
+@receiver(post_save, sender=Member)
+def invalidate_routing_on_change(sender, instance, created=False, raw=False, **kwargs):
+    if not created and not raw and _routed_fields(sender, instance) != getattr(instance, '_routed_fields', None):
+        invalidate_routing_states()
+    instance._routed_fields = _routed_fields(sender, instance)
+
+
+@receiver(post_init, sender=Chunk)
+@receiver(post_init, sender=Member)
+def remember_routed_fields(sender, instance, **kwargs):
+    if instance.id is not None:
+        instance._routed_fields = _routed_fields(sender, instance)
+
+
+@receiver(post_delete, sender=Member)
+def invalidate_routing_on_removal(sender, instance, **kwargs):
+    invalidate_routing_states()
+
+
+@receiver(post_save, sender=UserProfile)
+def invalidate_routing_on_reputation(sender, instance, created=False, raw=False, **kwargs):
+    if not created and not raw and instance.reputation != getattr(instance, '_routed_reputation', None):
+        invalidate_routing_states()
+    instance._routed_reputation = instance.reputation
+
+
+@receiver(post_init, sender=UserProfile)
+def remember_reputation(sender, instance, **kwargs):
+    if instance.id is not None:
+        instance._routed_reputation = instance.reputation
@@ -2,21 +2,24 @@ from __future__ import division
 
 from collections import namedtuple, defaultdict
 import itertools
+import heapq
 
-from django.db.models import Count
+from django.db.models import Count, Max
 from django.contrib import auth
 from django.contrib.auth.models import User
 from django.db.models.query import prefetch_related_objects
+from django.db import transaction
 
-from models import Task
-from chunks.models import Chunk
+from models import Task, routing_generation
+from chunks.models import Chunk, Submission, update_activity_counts
 from accounts.models import Member
 import random
 import sys
+import threading
 import app_settings
 import logging
 
-__all__ = ['assign_tasks']
+__all__ = ['assign_tasks', 'preassign_tasks']
 
 # WARNING: These classes shadow the names of the actual model objects
 # that they represent. This is deliberate. I am sorry.
@@ -172,6 +175,28 @@ where submissions.milestone_id=%s and not(user_id=%s)
     return chunks
 
 
+def chunk_review_priority(role, chunk, reviewers_per_chunk, min_student_lines):
+    """
+    How much a reviewer with the given role is needed on the chunk, lower
+    is more. Only grows as reviewers of the same kind are added.
+    """
+    num_staff_reviewers = sum(1 for u in chunk.reviewers if u.role == Member.TEACHER)
+    num_nonstaff_reviewers = len(chunk.reviewers) - num_staff_reviewers
+    if role == Member.TEACHER:
+      # prioritize chunks that are approaching their quota of nonstaff reviewers
+      review_priority = max(reviewers_per_chunk - num_nonstaff_reviewers, 0)
+      # deprioritize chunks that already have staff reviewers
+      review_priority += num_staff_reviewers
+    else:
+      if num_nonstaff_reviewers < reviewers_per_chunk:
+        review_priority = 0 # high priority!  try to finish the quota on this chunk
+      else:
+        review_priority = num_nonstaff_reviewers # prioritize chunks with fewer reviewers
+
+    if chunk.student_lines <= min_student_lines:
+        review_priority = 100000 # deprioritize really short chunks
+    return review_priority
+
 def find_chunks(user, chunks, count, reviewers_per_chunk, min_student_lines, priority_dict):
     """
     Computes the IDs of the chunks for this user to review on this assignment.
@@ -240,20 +265,7 @@ def find_chunks(user, chunks, count, reviewers_per_chunk, min_student_lines, pri
 
     def make_chunk_sort_key(user):
       def chunk_sort_key(chunk):        
-        num_nonstaff_reviewers = len([u for u in chunk.reviewers if u.role != Member.TEACHER])
-        if user.role == Member.TEACHER:
-          # prioritize chunks that are approaching their quota of nonstaff reviewers
-          review_priority = max(reviewers_per_chunk - num_nonstaff_reviewers, 0)
-          # deprioritize chunks that already have staff reviewers
-          review_priority += len([u for u in chunk.reviewers if u.role == Member.TEACHER])
-        else:
-          if num_nonstaff_reviewers < reviewers_per_chunk:
-            review_priority = 0 # high priority!  try to finish the quota on this chunk
-          else:
-            review_priority = num_nonstaff_reviewers # prioritize chunks with fewer reviewers
-        
-        if chunk.student_lines <= min_student_lines:
-            review_priority = 100000 # deprioritize really short chunks
+        review_priority = chunk_review_priority(user.role, chunk, reviewers_per_chunk, min_student_lines)
         
         type_priority = 0
         if chunk.name in priority_dict:
@@ -282,9 +294,29 @@ def find_chunks(user, chunks, count, reviewers_per_chunk, min_student_lines, pri
     
     if not chunks:
         return
+
+    # Keep the chunks in a heap ordered by their sort keys. Assigning this
+    # user to a chunk only ever makes the keys of that chunk and of the other
+    # chunks in its submission larger, so stale entries can be re-keyed lazily
+    # when they reach the top of the heap instead of rescanning every chunk.
+    tiebreaks = {}
+    def current_key(chunk):
+        return key(chunk)[:-1] + (tiebreaks[chunk.id],)
+
+    heap = []
+    for chunk in chunks:
+        chunk_key = key(chunk)
+        tiebreaks[chunk.id] = chunk_key[-1]
+        heap.append((chunk_key, chunk.id, chunk))
+    heapq.heapify(heap)
+
     for _ in itertools.repeat(None, count):
-        # TODO consider using a priority queue here
-        chunk_to_assign = min(chunks, key=key)
+        while True:
+            chunk_key, chunk_id, chunk_to_assign = heap[0]
+            new_key = current_key(chunk_to_assign)
+            if new_key == chunk_key:
+                break
+            heapq.heapreplace(heap, (new_key, chunk_to_assign.id, chunk_to_assign))
         if chunk_to_assign.assign_reviewer(user):
             yield chunk_to_assign.id
         else:
@@ -341,35 +373,163 @@ def _generate_tasks(review_milestone, reviewer, chunk_map,  chunk_id_task_map=de
 
     return tasks
 
-def assign_tasks(review_milestone, reviewer, tasks_to_assign=sys.maxint, assign_more=False):
-  user_map = load_members(review_milestone.assignment.semester)
-  chunks = load_chunks(review_milestone.submit_milestone, user_map, reviewer)
-  chunk_map = {}
-  for chunk in chunks:
-    chunk_map[chunk.id] = chunk
+ChunkRow = namedtuple('ChunkRow', 'id name cluster_id class_type student_lines submission_id')
+
+class RoutingState:
+    """
+    The Reviewer/SubmissionForReview/ChunkForReview graph of one review
+    milestone, kept in memory between requests.
+
+    The state is stamped with a version built from cheap aggregates over the
+    milestone's chunks and the semester's members, and from the routing
+    generation that writers bump when they change chunks, members, profiles or
+    tasks in place (tasks.models.invalidate_routing_states); if another
+    process changes any of those the graph is reloaded. Tasks are replayed
+    incrementally: each sync only fetches the tasks created since the last
+    one, so tasks saved by other worker processes are picked up as well.
+    """
+    def __init__(self, review_milestone, version):
+        self.review_milestone_id = review_milestone.id
+        self.version = version
+        self.lock = threading.RLock()
+        self.last_task_id = 0
+        self.task_count = 0
+
+        self.user_map = load_members(review_milestone.assignment.semester)
+
+        submit_milestone = review_milestone.submit_milestone
+        submission_authors = defaultdict(list)
+        for submission_id, user_id in Submission.authors.through.objects \
+                .filter(submission__milestone=submit_milestone) \
+                .values_list('submission_id', 'user_id'):
+            submission_authors[submission_id].append(user_id)
+
+        submission_chunks = defaultdict(list)
+        for row in Chunk.objects.filter(file__submission__milestone=submit_milestone) \
+                .values_list('id', 'name', 'cluster_id', 'class_type', 'student_lines', 'file__submission'):
+            chunk = ChunkRow(*row)
+            submission_chunks[chunk.submission_id].append(chunk)
+
+        self.chunk_map = {}
+        for submission_id, chunks in submission_chunks.iteritems():
+            if submission_id not in submission_authors:
+                continue
+            submission = SubmissionForReview(
+                    id=submission_id,
+                    authors=[self.user_map[user_id] for user_id in submission_authors[submission_id] if user_id in self.user_map],
+                    chunks=chunks)
+            for chunk in submission.chunks:
+                self.chunk_map[chunk.id] = chunk
+
+    def _tasks(self):
+        return Task.objects.filter(milestone_id=self.review_milestone_id, chunk__isnull=False)
+
+    def sync(self):
+        """
+        Replays the tasks created since the last sync. Returns False if
+        tasks were deleted in the meantime and the state has to be rebuilt.
+        """
+        new_tasks = list(self._tasks().filter(id__gt=self.last_task_id) \
+                .order_by('id').values_list('id', 'chunk_id', 'reviewer_id'))
+        if new_tasks or self.task_count:
+            if self._tasks().count() != self.task_count + len(new_tasks):
+                return False
+        for task_id, chunk_id, reviewer_id in new_tasks:
+            chunk = self.chunk_map.get(chunk_id)
+            reviewer = self.user_map[reviewer_id]
+            if chunk is not None and reviewer is not None:
+                chunk.assign_reviewer(reviewer)
+            self.last_task_id = task_id
+        self.task_count += len(new_tasks)
+        return True
 
-  tasks = _generate_tasks(review_milestone, user_map[reviewer.id], chunk_map, max_tasks=tasks_to_assign, assign_more=assign_more)
+    def chunks_for(self, reviewer):
+        return [chunk for chunk in self.chunk_map.itervalues()
+                if reviewer not in chunk.submission.authors]
+
+# review milestone id => RoutingState, for this process
+_routing_states = {}
+_routing_states_lock = threading.Lock()
+
+def _routing_version(review_milestone):
+    chunks = Chunk.objects.filter(file__submission__milestone=review_milestone.submit_milestone) \
+            .aggregate(count=Count('id'), last=Max('id'))
+    members = Member.objects.filter(semester=review_milestone.assignment.semester) \
+            .aggregate(count=Count('id'), last=Max('id'))
+    return (chunks['count'], chunks['last'], members['count'], members['last'], routing_generation())
+
+def get_routing_state(review_milestone):
+    version = _routing_version(review_milestone)
+    with _routing_states_lock:
+        state = _routing_states.get(review_milestone.id)
+        if state is None or state.version != version:
+            state = RoutingState(review_milestone, version)
+            _routing_states[review_milestone.id] = state
+    with state.lock:
+        if not state.sync():
+            state = RoutingState(review_milestone, version)
+            state.sync()
+            with _routing_states_lock:
+                _routing_states[review_milestone.id] = state
+    return state
+
+def forget_routing_state(review_milestone):
+    with _routing_states_lock:
+        _routing_states.pop(review_milestone.id, None)
 
-  [task.save() for task in tasks]
+def assign_tasks(review_milestone, reviewer, tasks_to_assign=sys.maxint, assign_more=False):
+  state = get_routing_state(review_milestone)
+  with state.lock:
+    user = state.user_map[reviewer.id]
+    chunk_map = dict((chunk.id, chunk) for chunk in state.chunks_for(user))
+    try:
+      tasks = _generate_tasks(review_milestone, user, chunk_map, max_tasks=tasks_to_assign, assign_more=assign_more)
+      [task.save() for task in tasks]
+    except:
+      # the graph may already contain assignments that never got saved
+      forget_routing_state(review_milestone)
+      raise
 
   return len(tasks)
 
-def simulate_tasks(review_milestone, num_students, num_staff, num_alum):
-  user_map = load_members(review_milestone.assignment.semester)
-  chunks = load_chunks(review_milestone.submit_milestone, user_map, None)
-  chunk_map = {}
-  for chunk in chunks:
-    chunk_map[chunk.id] = chunk
-  chunk_id_task_map = defaultdict(list)
-
-  #for i in range(0, num_students + num_staff + num_alum):
-  #  if i < num_students:
-  #    reviewer =
-  #  elif i < num_students + num_staff:
-  #    reviewer =
-  #  else:
-  #    reviewer =
-  for reviewer in user_map.values():
-    _generate_tasks(review_milestone, user_map[reviewer.id], chunk_map, chunk_id_task_map=chunk_id_task_map)
-
-  return chunk_id_task_map
+def preassign_tasks(review_milestone, save=True):
+  """
+  Runs the routing for every member of the semester in one pass and inserts
+  all of their tasks at once, so that the dashboard only has to read them.
+  Members who already have tasks for this milestone are skipped, as are
+  students without a submission, just like on the dashboard.
+  """
+  state = get_routing_state(review_milestone)
+  with state.lock:
+    has_tasks = set(Task.objects.filter(milestone=review_milestone).values_list('reviewer_id', flat=True))
+    submitted = set(Submission.authors.through.objects \
+        .filter(submission__milestone=review_milestone.submit_milestone) \
+        .values_list('user_id', flat=True))
+    reviewers = [reviewer for reviewer in state.user_map.values()
+        if reviewer.id not in has_tasks and (reviewer.id in submitted or reviewer.role != Member.STUDENT)]
+    # staff go last so that they can spread out over the students' picks
+    random.shuffle(reviewers)
+    reviewers.sort(key=lambda reviewer: reviewer.role == Member.TEACHER)
+
+    chunk_type_priorities = _convert_review_milestone_to_priority(review_milestone)
+    tasks = []
+    try:
+      for reviewer in reviewers:
+        chunk_ids = find_chunks(reviewer, state.chunks_for(reviewer),
+            num_tasks_for_user(review_milestone, reviewer), review_milestone.reviewers_per_chunk,
+            review_milestone.min_student_lines, chunk_type_priorities)
+        for chunk_id in chunk_ids:
+          tasks.append(Task(reviewer_id=reviewer.id, chunk_id=chunk_id, milestone=review_milestone,
+              submission_id=state.chunk_map[chunk_id].submission.id))
+      if save:
+        with transaction.commit_on_success():
+          Task.objects.bulk_create(tasks)
+          # bulk_create skips the signals that keep the reviewer counts
+          update_activity_counts(task.chunk_id for task in tasks)
+    except:
+      forget_routing_state(review_milestone)
+      raise
+    if not save:
+      # the graph holds assignments that were never saved
+      forget_routing_state(review_milestone)
+    return tasks
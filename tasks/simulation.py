@@ -0,0 +1,217 @@
+"""
+What-if routing: runs the task routing of a review milestone in memory, for
+any number of configurations, without touching the tasks table.
+
+The milestone's members, submissions and chunks are loaded once into a
+RoutingSnapshot. Each configuration then gets a fresh Reviewer/ChunkForReview
+graph, and routes it the way preassign_tasks does (students and alums in a
+random order, then staff). Instead of sorting every chunk for every reviewer
+like find_chunks, all reviewers of a phase share one heap: during a phase the
+review priority of a chunk only grows, so stale heap entries are re-keyed
+when they reach the top, and the chunks a reviewer can't take are set aside
+and pushed back afterwards. Existing tasks are ignored, so a simulation shows
+what routing would do for a milestone that hasn't been opened yet.
+"""
+import heapq
+import itertools
+import random
+from collections import defaultdict, namedtuple
+
+from accounts.models import Member
+from chunks.models import Chunk, Submission
+from models import Task
+from routing import ChunkRow, Reviewer, SubmissionForReview, chunk_review_priority
+
+# reviewers_per_chunk and min_student_lines are routing parameters, the
+# *_count fields are the tasks per reviewer and students, alums and staff
+# cap how many reviewers of each role take part (None for all of them)
+RoutingConfig = namedtuple('RoutingConfig',
+        'student_count alum_count staff_count reviewers_per_chunk min_student_lines students alums staff')
+
+SimulationResult = namedtuple('SimulationResult', 'config tasks metrics')
+
+def milestone_config(review_milestone, **overrides):
+    """The configuration the milestone would be routed with, with overrides."""
+    values = dict((field, getattr(review_milestone, field))
+            for field in ('student_count', 'alum_count', 'staff_count', 'reviewers_per_chunk', 'min_student_lines'))
+    values.update(students=None, alums=None, staff=None)
+    values.update(overrides)
+    return RoutingConfig(**values)
+
+class RoutingSnapshot(object):
+    """The rows routing needs for a review milestone, loaded in a few queries."""
+    def __init__(self, review_milestone):
+        self.review_milestone = review_milestone
+        submit_milestone = review_milestone.submit_milestone
+        self.members = list(Member.objects.filter(semester=review_milestone.assignment.semester) \
+                .values_list('user_id', 'role', 'user__profile__reputation'))
+
+        self.submission_authors = defaultdict(list)
+        for submission_id, user_id in Submission.authors.through.objects \
+                .filter(submission__milestone=submit_milestone) \
+                .values_list('submission_id', 'user_id'):
+            self.submission_authors[submission_id].append(user_id)
+
+        self.submission_chunks = defaultdict(list)
+        for row in Chunk.objects.filter(file__submission__milestone=submit_milestone) \
+                .order_by('id') \
+                .values_list('id', 'name', 'cluster_id', 'class_type', 'student_lines', 'file__submission'):
+            chunk = ChunkRow(*row)
+            self.submission_chunks[chunk.submission_id].append(chunk)
+
+    def build(self):
+        """Returns a fresh graph: ({user id: Reviewer}, [SubmissionForReview])."""
+        user_map = dict((user_id, Reviewer(id=user_id, role=role, reputation=reputation or 0))
+                for user_id, role, reputation in self.members)
+        submissions = []
+        for submission_id in sorted(self.submission_chunks):
+            if submission_id not in self.submission_authors:
+                continue
+            submissions.append(SubmissionForReview(
+                    id=submission_id,
+                    authors=[user_map[user_id] for user_id in self.submission_authors[submission_id] if user_id in user_map],
+                    chunks=self.submission_chunks[submission_id]))
+        return user_map, submissions
+
+    def reviewers(self, user_map, config, rng):
+        """The reviewers taking part, in routing order, with their task counts."""
+        submitted = set(user_id for authors in self.submission_authors.itervalues() for user_id in authors)
+        task_counts = {
+            Member.STUDENT: config.student_count,
+            Member.VOLUNTEER: config.alum_count,
+            Member.TEACHER: config.staff_count,
+        }
+        headcounts = {
+            Member.STUDENT: config.students,
+            Member.VOLUNTEER: config.alums,
+            Member.TEACHER: config.staff,
+        }
+        reviewers = [reviewer for reviewer in sorted(user_map.itervalues(), key=lambda reviewer: reviewer.id)
+                if task_counts.get(reviewer.role) and (reviewer.id in submitted or reviewer.role != Member.STUDENT)]
+        rng.shuffle(reviewers)
+        taken = defaultdict(int)
+        routed = []
+        for reviewer in reviewers:
+            limit = headcounts[reviewer.role]
+            if limit is None or taken[reviewer.role] < limit:
+                taken[reviewer.role] += 1
+                routed.append((reviewer, task_counts[reviewer.role]))
+        # staff go last so that they can spread out over the students' picks
+        routed.sort(key=lambda (reviewer, count): reviewer.role == Member.TEACHER)
+        return routed
+
+def _route_phase(reviewers, chunks, config, rng):
+    """Assigns chunks to reviewers of one phase. Returns [(reviewer id, chunk id)]."""
+    if not reviewers or not chunks:
+        return []
+    role = reviewers[0][0].role
+    tiebreaks = dict((chunk.id, rng.random()) for chunk in chunks)
+
+    def key(chunk):
+        return (chunk_review_priority(role, chunk, config.reviewers_per_chunk, config.min_student_lines),
+                len(chunk.submission.reviewers),
+                -(chunk.student_lines or 0),
+                tiebreaks[chunk.id])
+
+    heap = [(key(chunk), chunk.id, chunk) for chunk in chunks]
+    heapq.heapify(heap)
+    assignments = []
+    for reviewer, count in reviewers:
+        set_aside = []
+        assigned = 0
+        while assigned < count and heap:
+            chunk_key, chunk_id, chunk = heap[0]
+            new_key = key(chunk)
+            if new_key != chunk_key:
+                heapq.heapreplace(heap, (new_key, chunk_id, chunk))
+                continue
+            heapq.heappop(heap)
+            if reviewer in chunk.reviewers or reviewer in chunk.submission.authors:
+                set_aside.append((chunk_key, chunk_id, chunk))
+                continue
+            chunk.assign_reviewer(reviewer)
+            assignments.append((reviewer.id, chunk_id))
+            assigned += 1
+            heapq.heappush(heap, (key(chunk), chunk_id, chunk))
+        for entry in set_aside:
+            heapq.heappush(heap, entry)
+    return assignments
+
+def measure(submissions, tasks, config):
+    """Quality figures of a routed graph."""
+    chunks = [chunk for submission in submissions for chunk in submission.chunks]
+    eligible = [chunk for chunk in chunks if chunk.student_lines > config.min_student_lines]
+    distribution = defaultdict(int)
+    quota_met = 0
+    for chunk in eligible:
+        distribution[len(chunk.reviewers)] += 1
+        nonstaff = sum(1 for reviewer in chunk.reviewers if reviewer.role != Member.TEACHER)
+        if nonstaff >= config.reviewers_per_chunk:
+            quota_met += 1
+
+    staff_per_submission = [sum(1 for reviewer in submission.reviewers if reviewer.role == Member.TEACHER)
+            for submission in submissions]
+    tasks_per_role = defaultdict(int)
+    for submission in submissions:
+        for chunk in submission.chunks:
+            for reviewer in chunk.reviewers:
+                tasks_per_role[reviewer.role] += 1
+
+    def fraction(count, total):
+        return float(count) / total if total else 0.0
+
+    return {
+        'tasks': len(tasks),
+        'tasks_per_role': dict(tasks_per_role),
+        'chunks': len(eligible),
+        'coverage': fraction(len(eligible) - distribution[0], len(eligible)),
+        'quota_met': fraction(quota_met, len(eligible)),
+        'reviewers_per_chunk': dict((count, chunks) for count, chunks in distribution.iteritems() if chunks),
+        'submissions': len(submissions),
+        'submissions_reviewed': sum(1 for submission in submissions if submission.reviewers),
+        'staff_spread': fraction(sum(1 for count in staff_per_submission if count), len(submissions)),
+        'max_staff_per_submission': max(staff_per_submission) if staff_per_submission else 0,
+    }
+
+def simulate(snapshot, config, seed=None):
+    """Routes the snapshot with the configuration. Returns a SimulationResult."""
+    rng = random.Random(seed)
+    user_map, submissions = snapshot.build()
+    chunks = [chunk for submission in submissions for chunk in submission.chunks]
+    reviewers = snapshot.reviewers(user_map, config, rng)
+    tasks = []
+    # staff rank chunks differently, so they get a heap of their own
+    for is_staff, phase in itertools.groupby(reviewers, key=lambda (reviewer, count): reviewer.role == Member.TEACHER):
+        tasks.extend(_route_phase(list(phase), chunks, config, rng))
+    return SimulationResult(config, tasks, measure(submissions, tasks, config))
+
+def sweep(review_milestone, seed=0, **parameters):
+    """
+    Simulates every combination of the given parameter values, e.g.
+    sweep(milestone, student_count=[3, 5], reviewers_per_chunk=[1, 2]).
+    The parameters left out keep the milestone's values. Every configuration
+    is routed with the same seed so that they can be compared.
+    """
+    snapshot = RoutingSnapshot(review_milestone)
+    names = sorted(parameters)
+    results = []
+    for values in itertools.product(*[parameters[name] for name in names]):
+        config = milestone_config(review_milestone, **dict(zip(names, values)))
+        results.append(simulate(snapshot, config, seed))
+    return results
+
+def simulate_tasks(review_milestone, num_students=None, num_staff=None, num_alum=None):
+    """
+    Returns {chunk id: [unsaved Task]} of a simulated routing of the
+    milestone with at most the given numbers of reviewers of each role.
+    """
+    config = milestone_config(review_milestone, students=num_students, staff=num_staff, alums=num_alum)
+    snapshot = RoutingSnapshot(review_milestone)
+    result = simulate(snapshot, config)
+    submission_ids = dict((chunk.id, chunk.submission_id)
+            for chunks in snapshot.submission_chunks.itervalues() for chunk in chunks)
+    chunk_id_task_map = defaultdict(list)
+    for reviewer_id, chunk_id in result.tasks:
+        chunk_id_task_map[chunk_id].append(Task(reviewer_id=reviewer_id, chunk_id=chunk_id,
+            milestone=review_milestone, submission_id=submission_ids[chunk_id]))
+    return chunk_id_task_map
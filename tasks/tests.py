@@ -5,7 +5,19 @@ when you run "manage.py test".
 Replace this with more appropriate tests for your application.
 """
 
+import datetime
+
 from django.test import TestCase
+from django.contrib.auth.models import User
+
+from accounts.models import Member
+from chunks.clustering import cluster_milestone
+from chunks.models import ReviewMilestone, Submission, Chunk
+from chunks.testing import CourseTestCase
+from review.models import Comment
+from tasks.milestone_stats import refresh_stats
+from tasks.models import Task
+from tasks import routing, simulation
 
 
 class SimpleTest(TestCase):
@@ -14,3 +26,209 @@ class SimpleTest(TestCase):
         Tests that 1 + 1 always equals 2.
         """
         self.assertEqual(1 + 1, 2)
+
+
+class RoutingTest(CourseTestCase):
+    def setUp(self):
+        super(RoutingTest, self).setUp()
+        routing._routing_states.clear()
+        self.review_milestone = self.create_review_milestone(
+                assigned_date=self.now - datetime.timedelta(days=1), duedate=self.now + datetime.timedelta(days=1))
+        ReviewMilestone.objects.filter(id=self.review_milestone.id).update(student_count=2, reviewers_per_chunk=1, min_student_lines=0)
+        self.review_milestone = ReviewMilestone.objects.get(id=self.review_milestone.id)
+
+        self.students = []
+        for i in range(4):
+            user = User.objects.create(username='student%d' % i)
+            Member.objects.create(user=user, semester=self.semester, role=Member.STUDENT)
+            submission = self.create_submission(user.username, [user])
+            for name in ['A', 'B']:
+                self.create_chunk(submission, name, 'class %s {\n}\n' % name, path='%s/%s.java' % (user.username, name),
+                        class_type='NONE', student_lines=10)
+            self.students.append(user)
+
+    def test_assign_tasks(self):
+        """
+        Tests that reviewers never get their own code and that the cached
+        routing state sees tasks created outside of it.
+        """
+        first = self.students[0]
+        self.assertEqual(routing.assign_tasks(self.review_milestone, first), 2)
+        for task in Task.objects.filter(reviewer=first):
+            self.assertFalse(task.submission.has_author(first))
+
+        state = routing.get_routing_state(self.review_milestone)
+        self.assertEqual(state.task_count, 2)
+        task = Task.objects.filter(reviewer=first)[0]
+        task.delete()
+        self.assertTrue(routing.get_routing_state(self.review_milestone) is not state)
+
+        for student in self.students[1:]:
+            routing.assign_tasks(self.review_milestone, student)
+        reviewed = Task.objects.values_list('chunk', flat=True)
+        self.assertEqual(len(reviewed), 7)
+        self.assertEqual(len(set(reviewed)), 7)
+
+    def test_routing_state_reloads_on_changes_in_place(self):
+        """
+        Tests that the cached routing state is rebuilt when chunks, members,
+        reputations or tasks change without changing how many there are.
+        """
+        def reloaded(state):
+            new_state = routing.get_routing_state(self.review_milestone)
+            return new_state is not state, new_state
+
+        state = routing.get_routing_state(self.review_milestone)
+        self.assertEqual(reloaded(state), (False, state))
+        cluster_milestone(self.submit_milestone)
+        changed, state = reloaded(state)
+        self.assertTrue(changed)
+
+        member = Member.objects.get(user=self.students[0])
+        member.slack_budget += 1
+        member.save()
+        chunk = Chunk.objects.filter(file__submission__milestone=self.submit_milestone)[0]
+        chunk.name = 'Renamed'
+        chunk.save()
+        self.assertEqual(reloaded(state), (False, state))
+        member.role = Member.VOLUNTEER
+        member.save()
+        changed, state = reloaded(state)
+        self.assertTrue(changed)
+        self.assertEqual(state.user_map[self.students[0].id].role, Member.VOLUNTEER)
+
+        profile = self.students[1].get_profile()
+        profile.reputation += 10
+        profile.save()
+        changed, state = reloaded(state)
+        self.assertTrue(changed)
+
+        routing.assign_tasks(self.review_milestone, self.students[1])
+        state = routing.get_routing_state(self.review_milestone)
+        task = Task.objects.filter(reviewer=self.students[1])[0]
+        task.mark_as('O')
+        self.assertEqual(reloaded(state), (False, state))
+        task.reviewer = self.students[2]
+        task.save()
+        changed, state = reloaded(state)
+        self.assertTrue(changed)
+        self.assertTrue(self.students[2].id in [reviewer.id for reviewer in state.chunk_map[task.chunk_id].reviewers])
+
+    def test_preassign_tasks(self):
+        """
+        Tests that preassigning gives every student their tasks up front and
+        that the dashboard-time assignment then has nothing left to do.
+        """
+        tasks = routing.preassign_tasks(self.review_milestone)
+        self.assertEqual(len(tasks), 8)
+        self.assertEqual(Task.objects.count(), 8)
+        for student in self.students:
+            self.assertEqual(Task.objects.filter(reviewer=student).count(), 2)
+            self.assertEqual(routing.assign_tasks(self.review_milestone, student), 0)
+
+    def test_activity_counts(self):
+        """
+        Tests that the counts stored on chunks and submissions follow task and
+        comment saves and deletes, including bulk created tasks.
+        """
+        routing.preassign_tasks(self.review_milestone)
+        submission = Submission.objects.get(name='student0')
+        # routing may have doubled up on a chunk of this submission and left
+        # the other one out
+        chunk = Chunk.objects.filter(file__submission=submission, tasks__isnull=False).distinct()[0]
+        self.assertEqual(Chunk.objects.get(id=chunk.id).reviewer_count, Task.objects.filter(chunk=chunk).count())
+        self.assertEqual(Submission.objects.get(id=submission.id).reviewer_count,
+                Task.objects.filter(chunk__file__submission=submission).count())
+
+        reviewer = Task.objects.filter(chunk=chunk)[0].reviewer
+        comment = Comment(chunk=chunk, author=reviewer, text='hi', start=1, end=1)
+        comment.save()
+        Comment(chunk=chunk, author=reviewer, text='style', start=1, end=1, type='S').save()
+        Comment(chunk=chunk, author=reviewer, text='test failed', start=1, end=1, type='T').save()
+        chunk = Chunk.objects.get(id=chunk.id)
+        self.assertEqual((chunk.user_comment_count, chunk.static_comment_count, chunk.test_comment_count), (1, 1, 1))
+        self.assertEqual(chunk.comment_count(), 3)
+        self.assertEqual(Submission.objects.get(id=submission.id).last_comment_modified, chunk.last_comment_modified)
+
+        comment.delete()
+        Task.objects.filter(chunk=chunk).delete()
+        chunk = Chunk.objects.get(id=chunk.id)
+        self.assertEqual((chunk.user_comment_count, chunk.reviewer_count), (0, 0))
+        submission = Submission.objects.get(id=submission.id)
+        self.assertEqual((submission.user_comment_count, submission.static_comment_count,
+                submission.test_comment_count, submission.reviewer_count),
+                (0, 1, 1, Task.objects.filter(chunk__file__submission=submission).count()))
+
+    def test_close_out(self):
+        """
+        Tests that closing out a milestone completes its started tasks, marks
+        the other open ones unfinished and sets the timestamps in bulk.
+        """
+        routing.preassign_tasks(self.review_milestone)
+        tasks = list(Task.objects.filter(milestone=self.review_milestone).order_by('id'))
+        tasks[0].mark_as('S')
+        tasks[1].mark_as('C')
+        tasks[2].mark_as('O')
+        completed = Task.objects.get(id=tasks[1].id).completed
+        counts = Task.objects.close_out(self.review_milestone)
+        self.assertEqual(counts, {'completed': 1, 'unfinished': len(tasks) - 2})
+        self.assertEqual(Task.objects.get(id=tasks[0].id).status, 'C')
+        self.assertTrue(Task.objects.get(id=tasks[0].id).completed is not None)
+        self.assertEqual(Task.objects.get(id=tasks[1].id).completed, completed)
+        self.assertEqual(set(Task.objects.exclude(id__in=[tasks[0].id, tasks[1].id]).values_list('status', flat=True)), set(['U']))
+        self.assertEqual(Task.objects.close_out(self.review_milestone), {'completed': 0, 'unfinished': 0})
+
+    def test_simulation(self):
+        """
+        Tests that a parameter sweep routes in memory, never gives reviewers
+        their own code and reports the coverage of each configuration.
+        """
+        results = simulation.sweep(self.review_milestone, student_count=[1, 2], reviewers_per_chunk=[1])
+        self.assertEqual(Task.objects.count(), 0)
+        self.assertEqual([result.config.student_count for result in results], [1, 2])
+        few, enough = [result.metrics for result in results]
+        self.assertEqual((few['tasks'], few['coverage'], few['reviewers_per_chunk']), (4, 0.5, {0: 4, 1: 4}))
+        # the last reviewer may only have their own chunks left to cover
+        self.assertEqual((enough['tasks'], sum(enough['reviewers_per_chunk'].values())), (8, 8))
+        self.assertTrue(enough['coverage'] > few['coverage'])
+        self.assertEqual(enough['submissions_reviewed'], 4)
+
+        authors = dict((chunk.id, chunk.file.submission.authors.get().id) for chunk in Chunk.objects.all())
+        for reviewer_id, chunk_id in results[1].tasks:
+            self.assertNotEqual(authors[chunk_id], reviewer_id)
+
+        chunk_task_map = simulation.simulate_tasks(self.review_milestone, num_students=3)
+        self.assertEqual(sum(len(tasks) for tasks in chunk_task_map.values()), 6)
+
+    def test_milestone_stats(self):
+        """
+        Tests that the statistics snapshot matches the figures counted
+        directly and follows new and removed comments.
+        """
+        routing.preassign_tasks(self.review_milestone)
+        staff = User.objects.create(username='staff')
+        Member.objects.create(user=staff, semester=self.semester, role=Member.TEACHER)
+        empty = Submission.objects.create(milestone=self.submit_milestone, name='empty')
+        empty.authors.add(staff)
+        chunks = list(Chunk.objects.order_by('id'))
+        Comment(chunk=chunks[0], author=self.students[1], text='a', start=1, end=1).save()
+        Comment(chunk=chunks[0], author=staff, text='b', start=1, end=1).save()
+        Comment(chunk=chunks[1], author=staff, text='c', start=1, end=1, type='S').save()
+
+        snapshot = refresh_stats(self.review_milestone)
+        figures = snapshot['figures']
+        self.assertEqual((figures['total_chunks'], figures['zero_chunk_users']), (8, 1))
+        self.assertEqual((figures['total_tasks'], figures['assigned_chunks']),
+                (8, len(set(Task.objects.values_list('chunk', flat=True)))))
+        self.assertEqual((figures['total_comments'], figures['total_user_comments'], figures['total_checkstyle']), (3, 2, 1))
+        self.assertEqual((figures['total_staff_comments'], figures['total_student_comments']), (2, 1))
+        self.assertEqual(figures['total_chunks_with_human'], 1)
+
+        Comment(chunk=chunks[2], author=self.students[2], text='d', start=1, end=1).save()
+        figures = refresh_stats(self.review_milestone, snapshot)['figures']
+        self.assertEqual((figures['total_comments'], figures['total_chunks_with_human']), (4, 2))
+
+        Comment.objects.filter(chunk=chunks[0]).delete()
+        figures = refresh_stats(self.review_milestone, snapshot)['figures']
+        self.assertEqual((figures['total_comments'], figures['total_chunks_with_human']), (2, 1))
+        self.assertEqual(figures['total_student_comments'], 1)
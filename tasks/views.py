@@ -1,7 +1,7 @@
 import json
 
 from django.core import serializers
-from django.db.models import Q, Count, Max
+from django.db.models import Q, Max
 from django.shortcuts import render, redirect, get_object_or_404
 from django.template import RequestContext
 from django.contrib.auth.models import User
@@ -12,12 +12,14 @@ from django.core.urlresolvers import reverse
 from  django.core.exceptions import ObjectDoesNotExist
 
 from chunks.models import Chunk, Assignment, Milestone, SubmitMilestone, ReviewMilestone, Submission, StaffMarker
+from chunks.models import get_chunk_access_cache
 from tasks.models import Task
 from tasks.routing import assign_tasks
+from tasks.milestone_stats import get_stats
 from review.models import Comment, Vote, Star
 from review.forms import CommentForm, ReplyForm, EditCommentForm
 from accounts.forms import UserProfileForm
-from accounts.models import UserProfile, Extension, Member
+from accounts.models import UserProfile, Extension
 from simplewiki.models import Article
 
 import datetime
@@ -26,46 +28,16 @@ import logging
 
 @staff_member_required
 def review_milestone_info(request, review_milestone_id):
-    review_milestone = get_object_or_404(ReviewMilestone.objects.select_related('assignment__semester'), pk=review_milestone_id)
-    submit_milestone = review_milestone.submit_milestone
-    comments = Comment.objects.filter(chunk__file__submission__milestone__review_milestone=review_milestone)
-    semester = review_milestone.assignment.semester
-
-    total_chunks = Chunk.objects.filter(file__submission__milestone__review_milestone=review_milestone).count()
-    alums_participating = Member.objects.filter(role=Member.VOLUNTEER, user__comments__chunk__file__submission__milestone__review_milestone=review_milestone).distinct().count()
-    total_tasks = Task.objects.filter(milestone=review_milestone).count()
-    assigned_chunks = Chunk.objects.filter(tasks__gt=0).filter(file__submission__milestone__review_milestone=review_milestone).distinct().count()
-    total_chunks_with_human = Chunk.objects.filter(comments__type='U').filter(file__submission__milestone__review_milestone=review_milestone).distinct().count()
-    total_comments = comments.count()
-    total_checkstyle = comments.filter(type='S').count()
-    total_staff_comments = comments.filter(author__membership__role=Member.TEACHER, author__membership__semester=semester).count()
-    total_student_comments = comments.filter(author__membership__role=Member.STUDENT, author__membership__semester=semester).count()
-    total_alum_comments = comments.filter(author__membership__role=Member.VOLUNTEER, author__membership__semester=semester).count()
-    total_user_comments = comments.filter(type='U').count()
-    zero_chunk_users = len(filter(lambda sub: len(sub.chunks()) == 0, submit_milestone.submissions.all()))
-
-    return render(request, 'tasks/review_milestone_info.html', {
-        'review_milestone': review_milestone,
-        'total_chunks': total_chunks,
-        'alums_participating': alums_participating,
-        'total_tasks': total_tasks,
-        'assigned_chunks': assigned_chunks,
-        'total_chunks_with_human': total_chunks_with_human,
-        'total_comments': total_comments,
-        'total_checkstyle': total_checkstyle,
-        'total_staff_comments': total_staff_comments,
-        'total_student_comments': total_student_comments,
-        'total_user_comments': total_user_comments,
-        'total_alum_comments': total_alum_comments,
-        'zero_chunk_users': zero_chunk_users,
-    })
+    review_milestone = get_object_or_404(ReviewMilestone.objects.select_related('assignment'), pk=review_milestone_id)
+    snapshot = get_stats(review_milestone, max_age=0 if 'refresh' in request.GET else None)
+    context = dict(snapshot['figures'])
+    context.update(review_milestone=review_milestone, computed=snapshot['computed'])
+    return render(request, 'tasks/review_milestone_info.html', context)
 
 @staff_member_required
 def stats(request):
     chunks = Chunk.objects.all()
-    chunks_with_comments = \
-            Chunk.objects.filter(comments__type='U') \
-            .annotate(user_comment_count=Count('comments'))
+    chunks_with_comments = Chunk.objects.filter(user_comment_count__gt=0)
     tasks = Task.objects.all()
     completed_tasks = Task.objects.filter(status='C')
     recent_comments = Comment.objects.filter(type='U').order_by('-created')[:10]
@@ -113,22 +85,21 @@ def more_work(request):
             active_tasks = user.tasks \
                 .select_related('chunk__file__submission__milestone__assignment') \
                 .exclude(status='C') \
-                .exclude(status='U') \
-                .annotate(comment_count=Count('chunk__comments', distinct=True),
-                          reviewer_count=Count('chunk__tasks', distinct=True))
+                .exclude(status='U')
             one = active_tasks.all()[0]
             two = active_tasks.all()[1]
+            get_chunk_access_cache().prefetch([task.chunk for task in (one, two) if task.chunk])
             response_json = json.dumps({
                 'total': total,
                 'one': {"task_chunk_name": one.chunk.name, \
-                                 "task_comment_count": one.comment_count,\
-                                 "task_reviewer_count": one.reviewer_count, \
+                                 "task_comment_count": one.chunk.comment_count(),\
+                                 "task_reviewer_count": one.chunk.reviewer_count, \
                                  "task_chunk_generate_snippet": one.chunk.generate_snippet(),\
                                  "task_id": one.id,\
                                  "task_chunk_id": one.chunk.id},
                 'two': {"task_chunk_name": two.chunk.name, \
-                                 "task_comment_count": two.comment_count,\
-                                 "task_reviewer_count": two.reviewer_count, \
+                                 "task_comment_count": two.chunk.comment_count(),\
+                                 "task_reviewer_count": two.chunk.reviewer_count, \
                                  "task_chunk_generate_snippet": two.chunk.generate_snippet(),\
                                  "task_id": two.id,\
                                  "task_chunk_id": two.chunk.id},
@@ -142,18 +113,10 @@ def cancel_assignment(request):
     if request.method == 'POST':
         assignments = request.POST.get('assignment', None)
         if assignments == "all":
-            started_tasks = Task.objects.filter(status='S')
-            started = 0
-            for task in started_tasks:
-                task.mark_as('C')
-                started += 1
-            unfinished_tasks = Task.objects.exclude(status='C').exclude(status='U')
-            total = 0
-            for task in unfinished_tasks:
-                total += 1
-                task.mark_as('U')
+            counts = Task.objects.close_out()
             response_json = json.dumps({
-                'total': total,
+                'total': counts['unfinished'],
+                'completed': counts['completed'],
             })
             return HttpResponse(response_json, mimetype='application/javascript')
     return render(request, 'accountss/manage.html', {
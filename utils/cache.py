@@ -0,0 +1,144 @@
+"""
+A file based cache that is shared between processes and evicts the least
+recently used entries.
+
+Django's FileBasedCache counts every file in the cache directory before each
+set() and, once it is full, deletes every n-th subdirectory regardless of
+use. This backend marks entries as used by touching them on each hit, and
+never culls during a request: cull() (or cull_caches() for every cache of
+this kind, run by scripts/cullCaches.py and the preprocessor) deletes expired
+entries first and then the least recently used ones, down to MAX_ENTRIES
+minus a CULL_FREQUENCY-th of them.
+
+add() and incr() hold an exclusive lock on a file in the cache directory, so
+that counters kept in the cache (like the routing and dashboard generations)
+can be started and bumped by several processes without losing an update.
+"""
+from contextlib import contextmanager
+import fcntl
+import os
+import tempfile
+import time
+try:
+    from django.utils.six.moves import cPickle as pickle
+except ImportError:
+    import pickle
+
+from django.conf import settings
+from django.core.cache import get_cache
+from django.core.cache.backends.filebased import FileBasedCache
+
+LOCK_FILE = 'lock'
+
+def cull_caches():
+    """Culls every LRUFileBasedCache in settings.CACHES."""
+    for alias in settings.CACHES:
+        cache = get_cache(alias)
+        if isinstance(cache, LRUFileBasedCache):
+            cache.cull()
+
+class LRUFileBasedCache(FileBasedCache):
+    def get(self, key, default=None, version=None):
+        missing = object()
+        value = super(LRUFileBasedCache, self).get(key, missing, version=version)
+        if value is missing:
+            return default
+        try:
+            os.utime(self._key_to_file(self.make_key(key, version=version)), None)
+        except OSError:
+            pass
+        return value
+
+    def set(self, key, value, timeout=None, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        if timeout is None:
+            timeout = self.default_timeout
+        self._write(self._key_to_file(key), time.time() + timeout, value)
+
+    def add(self, key, value, timeout=None, version=None):
+        with self._locked():
+            return super(LRUFileBasedCache, self).add(key, value, timeout, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        with self._locked():
+            fname = self._key_to_file(self.make_key(key, version=version))
+            try:
+                with open(fname, 'rb') as f:
+                    expires = pickle.load(f)
+                    value = pickle.load(f)
+            except (IOError, OSError, EOFError, pickle.PickleError):
+                expires = None
+            if expires is None or expires < time.time():
+                raise ValueError("Key '%s' not found" % key)
+            # the entry keeps its expiry
+            value += delta
+            self._write(fname, expires, value)
+            return value
+
+    @contextmanager
+    def _locked(self):
+        if not os.path.exists(self._dir):
+            self._createdir()
+        with open(os.path.join(self._dir, LOCK_FILE), 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _write(self, fname, expires, value):
+        dirname = os.path.dirname(fname)
+        try:
+            if not os.path.exists(dirname):
+                os.makedirs(dirname)
+            # written under a temporary name and renamed, so that other
+            # processes never read half an entry
+            fd, temp_path = tempfile.mkstemp(dir=dirname)
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(expires, f, pickle.HIGHEST_PROTOCOL)
+                pickle.dump(value, f, pickle.HIGHEST_PROTOCOL)
+            os.rename(temp_path, fname)
+        except (IOError, OSError):
+            pass
+
+    def cull(self):
+        entries = []
+        for root, _, files in os.walk(self._dir):
+            for name in files:
+                path = os.path.join(root, name)
+                if root == self._dir:
+                    continue # the lock file
+                try:
+                    entries.append((os.path.getmtime(path), path))
+                except OSError:
+                    pass
+        if len(entries) < self._max_entries:
+            return
+
+        # like FileBasedCache, a CULL_FREQUENCY of 0 empties the cache
+        keep = 0
+        if self._cull_frequency:
+            keep = self._max_entries - self._max_entries // self._cull_frequency
+        now = time.time()
+        live = []
+        for used, path in entries:
+            try:
+                # only the expiry, not the whole entry
+                with open(path, 'rb') as f:
+                    expired = pickle.load(f) < now
+            except (IOError, OSError, EOFError, pickle.PickleError):
+                expired = True
+            if expired:
+                self._delete_quietly(path)
+            else:
+                live.append((used, path))
+        live.sort()
+        for used, path in live[:max(0, len(live) - keep)]:
+            self._delete_quietly(path)
+
+    def _delete_quietly(self, path):
+        try:
+            self._delete(path)
+        except (IOError, OSError):
+            pass